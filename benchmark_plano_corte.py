@@ -0,0 +1,388 @@
+"""
+================================================================================
+BENCHMARK — MOTOR DE COMBINAÇÕES (plano_corte_rev005)
+================================================================================
+
+OBJETIVO:
+    Medir se uma mudança em buscar_combinacoes_para_largura deixou o motor
+    mais rápido ou mais lento, com números comparáveis entre execuções.
+
+O QUE É MEDIDO:
+    1. Catálogos SINTÉTICOS determinísticos (mesma semente = mesmo catálogo),
+       de tamanho e densidade controlados: nº de matrizes, distribuição dos
+       desenvolvimentos, espessuras e taxa de duplicação (mesma matriz em
+       vários produtos). Para cada catálogo, três âncoras (maior, mediana e
+       menor desenvolvimento) × 1/2/3 complementares × cada largura de
+       LARGURAS_BOBINA × com e sem limite de cortes.
+    2. As consultas REAIS em db_plano_corte.xlsx que geraram os planos de
+       files/output (encontrar_combinacoes completo, como no menu).
+
+SAÍDA:
+    JSON (padrão: BASE_OUTPUT/benchmark_<timestamp>.json) com ambiente,
+    parâmetros e um registro por caso. --comparar ANTERIOR.json imprime a
+    razão de tempo caso a caso contra uma execução anterior.
+
+USO:
+    python benchmark_plano_corte.py [--catalogos pequeno medio grande]
+                                    [--repeticoes N] [--completo]
+                                    [--catalogo ARQ] [--saida ARQ.json]
+                                    [--comparar ANTERIOR.json]
+================================================================================
+"""
+
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import plano_corte_rev005 as pc
+
+
+# ================================================================================
+# CONFIGURAÇÕES
+# ================================================================================
+
+PASTA_SCRIPT = os.path.dirname(os.path.abspath(__file__))
+
+# Catálogos sintéticos (parâmetros de gerar_catalogo_sintetico)
+CATALOGOS_SINTETICOS = {
+    'pequeno': {'n_matrizes': 15, 'espessuras': (2.0, 4.75), 'taxa_duplicacao': 0.2},
+    'medio':   {'n_matrizes': 30, 'espessuras': (2.0, 4.75), 'taxa_duplicacao': 0.2},
+    'grande':  {'n_matrizes': 60, 'espessuras': (2.0, 4.75), 'taxa_duplicacao': 0.2},
+}
+
+# Complementares e limite de cortes testados
+MAX_COMPLEMENTARES_TESTADOS = (1, 2, 3)
+LIMITE_CORTES_TESTADO = 12
+
+# Com 3 complementares o custo cresce com o cubo do grupo: acima deste
+# tamanho os casos só rodam com --completo (uma âncora pequena leva ~20 s
+# por largura num grupo de 30 matrizes e ~1 min num de 60)
+MAX_MATRIZES_3_COMP = 15
+
+# Repetições: para de repetir um caso quando já somou este tempo
+REPETICOES_PAD = 3
+TEMPO_MAX_REPETICOES_S = 2.0
+
+# Consultas reais: (espessura, tipo, âncora) de cada plano em files/output
+CONSULTAS_REAIS = [
+    (3.75, 'COMERCIAL', '101,60-4" [312]'),    # plano_101-60-4in_esp3-75_COMERCIAL_L1200.xlsx
+    (4.75, 'COMERCIAL', '152,40-6" [469]'),    # plano_152-40-6in_esp4-75_COMERCIAL_L1200.xlsx
+    (2.0,  'COMERCIAL', '184 - [2.00]'),       # plano_184_-_[2.00]_esp2-0_COMERCIAL_L1200_*.xlsx
+    (1.5,  'COMERCIAL', '186 - [1,50]'),       # plano_186_-_[1-50]_esp1-5_COMERCIAL_L1200_*.xlsx
+    (1.8,  'COMERCIAL', '50X25X10 [106]'),     # plano_50X25X10_esp1-8_COMERCIAL_L1200.xlsx
+]
+
+
+# ================================================================================
+# CATÁLOGO SINTÉTICO
+# ================================================================================
+
+def gerar_catalogo_sintetico(
+    n_matrizes: int = 30,
+    espessuras: tuple = (2.0,),
+    tipos: tuple = ('COMERCIAL',),
+    distribuicao: str = 'lognormal',
+    dev_min: float = 48.0,
+    dev_max: float = 1041.0,
+    taxa_duplicacao: float = 0.2,
+    semente: int = 0
+) -> pd.DataFrame:
+    """
+    Catálogo no mesmo formato de carregar_dados, gerado de forma determinística.
+
+    ENTRADA:
+        n_matrizes: matrizes distintas por (espessura, tipo)
+        distribuicao: 'lognormal' (parecida com o catálogo real: mediana
+                      ~184 mm, média ~210 mm) ou 'uniforme' em [dev_min, dev_max]
+        taxa_duplicacao: fração de linhas extras repetindo uma matriz em
+                         outro produto (desenvolvimento ± 0,5 mm, como no
+                         banco real, onde listar_matrizes tira a média)
+        semente: mesma semente → mesmo catálogo
+
+    SAÍDA:
+        DataFrame [Código, Espessura, Matriz, Tipo de material, Produto, Desenvolvimento]
+    """
+    rng = np.random.default_rng(semente)
+    linhas = []
+    codigo = 900000
+
+    for g, (esp, tipo) in enumerate((e, t) for e in espessuras for t in tipos):
+        if distribuicao == 'lognormal':
+            devs = rng.lognormal(mean=np.log(184), sigma=0.51, size=n_matrizes)
+        elif distribuicao == 'uniforme':
+            devs = rng.uniform(dev_min, dev_max, size=n_matrizes)
+        else:
+            raise ValueError(f"Distribuição desconhecida: {distribuicao}")
+        devs = np.round(np.clip(devs, dev_min, dev_max) * 2) / 2   # passo de 0,5 mm
+
+        nomes = [f"SINT{g}-{i:03d} [{dev:g}]" for i, dev in enumerate(devs)]
+        base = list(zip(nomes, devs))
+        extras = rng.integers(0, n_matrizes, size=int(round(taxa_duplicacao * n_matrizes)))
+        base += [(nomes[i], devs[i] + rng.choice([-0.5, 0.0, 0.5])) for i in extras]
+
+        for nome, dev in base:
+            codigo += 1
+            linhas.append({
+                'Código': codigo,
+                'Espessura': esp,
+                'Matriz': nome,
+                'Tipo de material': tipo,
+                'Produto': f"PRODUTO {nome}",
+                'Desenvolvimento': float(dev),
+            })
+
+    return pd.DataFrame(linhas)
+
+
+# ================================================================================
+# MEDIÇÃO
+# ================================================================================
+
+def cronometrar(funcao, repeticoes: int) -> tuple[list[float], object]:
+    """
+    Executa funcao() até `repeticoes` vezes (para antes se a soma passar de
+    TEMPO_MAX_REPETICOES_S) e devolve (tempos em s, último retorno).
+    """
+    tempos, retorno = [], None
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        retorno = funcao()
+        tempos.append(time.perf_counter() - inicio)
+        if sum(tempos) >= TEMPO_MAX_REPETICOES_S:
+            break
+    return tempos, retorno
+
+
+def _registro_tempos(tempos: list[float]) -> dict:
+    """Campos de tempo comuns a todos os casos."""
+    return {
+        'tempos_s': [round(t, 6) for t in tempos],
+        'min_s': round(min(tempos), 6),
+        'mediana_s': round(statistics.median(tempos), 6),
+    }
+
+
+def escolher_ancoras(grupo: pd.DataFrame) -> list[tuple[str, str]]:
+    """Âncoras de maior, mediano e menor desenvolvimento do grupo (ordenado desc.)."""
+    posicoes = {'maior': 0, 'mediana': len(grupo) // 2, 'menor': len(grupo) - 1}
+    return [(papel, grupo['Matriz'].iloc[i]) for papel, i in posicoes.items()]
+
+
+def benchmark_sintetico(nome: str, parametros: dict, repeticoes: int, completo: bool) -> list[dict]:
+    """
+    Casos do motor (buscar_combinacoes_para_largura) num catálogo sintético:
+    cada espessura × âncora × complementares × largura × limite.
+    """
+    df = gerar_catalogo_sintetico(**parametros)
+    casos = []
+
+    for esp in parametros['espessuras']:
+        grupo = pc.listar_matrizes(df, esp, 'COMERCIAL')
+
+        for papel, ancora in escolher_ancoras(grupo):
+            dev_ancora = pc.obter_desenvolvimento(df, ancora, esp)
+            comp = grupo[grupo['Matriz'] != ancora]
+
+            for max_comp in MAX_COMPLEMENTARES_TESTADOS:
+                for largura in pc.LARGURAS_BOBINA:
+                    for limite in (None, LIMITE_CORTES_TESTADO):
+                        caso = {
+                            'catalogo': nome,
+                            'espessura': esp,
+                            'ancora': papel,
+                            'matriz': ancora,
+                            'dev_ancora': dev_ancora,
+                            'matrizes_grupo': len(grupo),
+                            'max_complementares': max_comp,
+                            'largura': largura,
+                            'limite_cortes': limite,
+                        }
+
+                        if max_comp == 3 and len(grupo) > MAX_MATRIZES_3_COMP and not completo:
+                            casos.append({**caso, 'pulado': f"grupo > {MAX_MATRIZES_3_COMP} matrizes (use --completo)"})
+                            continue
+
+                        tempos, res = cronometrar(lambda: pc.buscar_combinacoes_para_largura(
+                            dev_ancora=dev_ancora,
+                            matriz_ancora=ancora,
+                            matrizes_complementares=comp['Matriz'].tolist(),
+                            devs_complementares=comp['Dev_mm'].tolist(),
+                            largura_bobina=largura,
+                            max_complementares=max_comp,
+                            espessura=esp,
+                            limite_cortes=limite
+                        ), repeticoes)
+
+                        casos.append({
+                            **caso,
+                            'resultados': len(res),
+                            'validas': sum(r['Status'] == '✓ Válida' for r in res),
+                            **_registro_tempos(tempos),
+                        })
+                        print(f"  {nome:<8} esp {esp:<5} {papel:<8} comp {max_comp} L{largura} "
+                              f"lim {str(limite):<4} → {len(res):>7} comb. em {min(tempos):.4f} s")
+
+    return casos
+
+
+def benchmark_reais(df: pd.DataFrame, repeticoes: int) -> list[dict]:
+    """Consultas reais completas (encontrar_combinacoes), como no menu."""
+    casos = []
+
+    for esp, tipo, ancora in CONSULTAS_REAIS:
+        caso = {'espessura': esp, 'tipo': tipo, 'matriz': ancora}
+
+        if not ((df['Matriz'] == ancora) & (df['Espessura'] == esp)).any():
+            casos.append({**caso, 'pulado': 'matriz não está no catálogo'})
+            continue
+
+        tempos, (df_res, largura) = cronometrar(
+            lambda: pc.encontrar_combinacoes(df, esp, tipo, ancora, verbose=False), repeticoes)
+
+        casos.append({
+            **caso,
+            'largura_usada': largura,
+            'resultados': len(df_res),
+            'validas': int((df_res['Status'] == '✓ Válida').sum()) if len(df_res) else 0,
+            **_registro_tempos(tempos),
+        })
+        print(f"  real     {ancora:<20} esp {esp:<5} → {len(df_res):>7} comb. (L{largura}) em {min(tempos):.4f} s")
+
+    return casos
+
+
+def descrever_ambiente() -> dict:
+    """Versões e máquina, para comparar execuções."""
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=PASTA_SCRIPT,
+            capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'sistema': platform.platform(),
+        'processador': platform.processor() or platform.machine(),
+        'nucleos': os.cpu_count(),
+        'commit': commit,
+    }
+
+
+# ================================================================================
+# COMPARAÇÃO COM EXECUÇÃO ANTERIOR
+# ================================================================================
+
+def _chave_caso(caso: dict, secao: str) -> tuple:
+    """Identidade de um caso entre execuções."""
+    if secao == 'reais':
+        return (secao, caso['espessura'], caso['tipo'], caso['matriz'])
+    return (secao, caso['catalogo'], caso['espessura'], caso['ancora'],
+            caso['max_complementares'], caso['largura'], caso['limite_cortes'])
+
+
+def comparar(atual: dict, anterior: dict) -> None:
+    """Imprime min_s anterior × atual (razão < 1 = ficou mais rápido)."""
+    antes = {
+        _chave_caso(c, secao): c
+        for secao in ('sinteticos', 'reais') for c in anterior.get(secao, []) if 'min_s' in c
+    }
+    print(f"\n  Comparação com {anterior.get('gerado_em', '?')} (commit {anterior['ambiente'].get('commit')}):")
+    print(f"  {'caso':<62} {'antes':>9} {'agora':>9} {'razão':>7}  resultados")
+
+    razoes = []
+    for secao in ('sinteticos', 'reais'):
+        for caso in atual[secao]:
+            chave = _chave_caso(caso, secao)
+            if 'min_s' not in caso or chave not in antes:
+                continue
+            velho = antes[chave]
+            razao = caso['min_s'] / velho['min_s'] if velho['min_s'] > 0 else float('nan')
+            razoes.append(razao)
+            iguais = 'iguais' if caso['resultados'] == velho['resultados'] else \
+                f"DIFERENTES ({velho['resultados']} → {caso['resultados']})"
+            nome = ' '.join(str(x) for x in chave[1:])
+            print(f"  {nome[:62]:<62} {velho['min_s']:>9.4f} {caso['min_s']:>9.4f} {razao:>7.2f}  {iguais}")
+
+    if razoes:
+        media = float(np.exp(np.mean(np.log([r for r in razoes if r > 0]))))
+        print(f"\n  Média geométrica das razões: {media:.3f} ({len(razoes)} casos)")
+
+
+# ================================================================================
+# EXECUÇÃO
+# ================================================================================
+
+def main(argv: list[str] | None = None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark do motor de combinações do plano de corte")
+    parser.add_argument('--catalogos', nargs='+', choices=list(CATALOGOS_SINTETICOS),
+                        default=list(CATALOGOS_SINTETICOS), help="catálogos sintéticos a medir")
+    parser.add_argument('--repeticoes', type=int, default=REPETICOES_PAD, help="repetições por caso")
+    parser.add_argument('--completo', action='store_true',
+                        help=f"roda 3 complementares também em grupos > {MAX_MATRIZES_3_COMP} matrizes")
+    parser.add_argument('--catalogo', metavar='ARQ', help="db_plano_corte.xlsx para as consultas reais")
+    parser.add_argument('--saida', metavar='ARQ', help="arquivo JSON de saída")
+    parser.add_argument('--comparar', metavar='ARQ', help="JSON de uma execução anterior")
+    args = parser.parse_args(argv)
+
+    resultado = {
+        'gerado_em': datetime.now().isoformat(timespec='seconds'),
+        'ambiente': descrever_ambiente(),
+        'parametros': {
+            'catalogos': {nome: CATALOGOS_SINTETICOS[nome] for nome in args.catalogos},
+            'repeticoes': args.repeticoes,
+            'completo': args.completo,
+            'larguras': pc.LARGURAS_BOBINA,
+            'perda_pct': [pc.PERDA_MIN_PCT, pc.PERDA_MAX_PCT],
+            'limite_cortes_testado': LIMITE_CORTES_TESTADO,
+        },
+        'sinteticos': [],
+        'reais': [],
+    }
+
+    # ── Catálogos sintéticos ──
+    print("\n  Catálogos sintéticos:")
+    for nome in args.catalogos:
+        resultado['sinteticos'] += benchmark_sintetico(
+            nome, CATALOGOS_SINTETICOS[nome], args.repeticoes, args.completo)
+
+    # ── Consultas reais ──
+    caminho_db = args.catalogo or next(
+        (c for c in (os.path.join(pc.BASE_INPUT, 'db_plano_corte.xlsx'),
+                     os.path.join(PASTA_SCRIPT, 'files', 'input', 'db_plano_corte.xlsx'))
+         if os.path.exists(c)), None)
+    if caminho_db:
+        print(f"\n  Consultas reais ({caminho_db}):")
+        resultado['parametros']['catalogo_real'] = caminho_db
+        resultado['reais'] = benchmark_reais(pc.carregar_dados(caminho_db), args.repeticoes)
+    else:
+        print("\n  ⚠️  db_plano_corte.xlsx não encontrado: consultas reais puladas (use --catalogo).")
+
+    # ── Grava JSON ──
+    saida = args.saida or os.path.join(
+        pc.BASE_OUTPUT, f"benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(saida)), exist_ok=True)
+    with open(saida, 'w', encoding='utf-8') as f:
+        json.dump(resultado, f, ensure_ascii=False, indent=2)
+    print(f"\n  ✓ {saida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as f:
+            comparar(resultado, json.load(f))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
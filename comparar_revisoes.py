@@ -0,0 +1,324 @@
+"""
+================================================================================
+COMPARAÇÃO ENTRE REVISÕES DO MOTOR (rev002 → rev005 e motores novos)
+================================================================================
+
+OBJETIVO:
+    Rodar o MESMO conjunto de consultas em cada revisão do motor de busca,
+    conferir se os resultados batem com o oráculo (rev005) e comparar os
+    tempos lado a lado. Um motor novo/otimizado entra como mais um adaptador
+    (registrar_motor) e só deve ser adotado se não houver diferenças.
+
+COMO AS REVISÕES SÃO IGUALADAS:
+    - Cada arquivo é importado isolado (importlib), com os parâmetros
+      globais trocados pelos da rev005: janela de perda, refilo mínimo e
+      larguras. Sem isso cada revisão usaria sua própria janela (1,70 /
+      1,68 / 1,65 %) e as diferenças seriam só de configuração.
+    - Adaptadores com a mesma assinatura para _buscar_para_largura
+      (rev002–rev004) e buscar_combinacoes_para_largura (rev005).
+    - O que a revisão não faz é emulado no adaptador, e o relatório avisa:
+      rev002 não tem limite de cortes (filtrado depois); rev002/rev003 não
+      têm regra de refilo (status calculado pela regra da rev005).
+    - Status normalizado: 'valida' / 'fora' ('✓ Válida', 'Válida' e
+      'Fora da regra' nas revisões).
+    - rev001 é só a carga do catálogo (sem motor) e fica de fora.
+
+COMPARAÇÃO:
+    Cada combinação vira uma chave canônica (N da âncora + complementares
+    ordenadas por nome, com seus cortes). Por consulta: combinações que
+    faltam / sobram em relação ao oráculo e as que têm perda ou status
+    diferentes.
+
+USO:
+    python comparar_revisoes.py [--revisoes rev002 rev003 rev004 rev005]
+                                [--max-comp 1 2] [--sinteticos]
+                                [--catalogo ARQ] [--saida ARQ.json]
+================================================================================
+"""
+
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import sys
+from datetime import datetime
+
+import pandas as pd
+
+import plano_corte_rev005 as pc
+from benchmark_plano_corte import (
+    CONSULTAS_REAIS,
+    LIMITE_CORTES_TESTADO,
+    PASTA_SCRIPT,
+    cronometrar,
+    escolher_ancoras,
+    gerar_catalogo_sintetico,
+)
+
+
+# ================================================================================
+# CONFIGURAÇÕES
+# ================================================================================
+
+REVISOES = ['rev002', 'rev003', 'rev004', 'rev005']
+ORACULO = 'rev005'
+
+# Parâmetros globais copiados da rev005 para as outras revisões
+PARAMETROS_IGUALADOS = ['LARGURAS_BOBINA', 'PERDA_MIN_PCT', 'PERDA_MAX_PCT',
+                        'REFILO_MIN_ATE_3MM', 'REFILO_MIN_ACIMA_3MM']
+
+MAX_COMP_PAD = (1, 2)
+REPETICOES_PAD = 1
+
+# Status das revisões → status normalizado
+STATUS_NORMALIZADO = {'✓ Válida': 'valida', 'Válida': 'valida', 'Fora da regra': 'fora'}
+
+
+# ================================================================================
+# CARGA DAS REVISÕES E ADAPTADORES
+# ================================================================================
+
+def carregar_revisao(revisao: str):
+    """
+    Importa plano_corte_<revisao>.py como módulo isolado, sem o print de
+    usuário que rev003/rev004 fazem na carga, e iguala os parâmetros globais
+    aos da rev005.
+    """
+    caminho = os.path.join(PASTA_SCRIPT, f"plano_corte_{revisao}.py")
+    spec = importlib.util.spec_from_file_location(f"_comparar_{revisao}", caminho)
+    modulo = importlib.util.module_from_spec(spec)
+    with contextlib.redirect_stdout(io.StringIO()):
+        spec.loader.exec_module(modulo)
+
+    for nome in PARAMETROS_IGUALADOS:
+        if hasattr(modulo, nome):
+            setattr(modulo, nome, getattr(pc, nome))
+    return modulo
+
+
+def _status_pela_regra(perda_mm: float, espessura: float) -> str:
+    """Regra de refilo da rev005, para revisões que não a têm."""
+    refilo_min = pc.REFILO_MIN_ATE_3MM if espessura <= 3.0 else pc.REFILO_MIN_ACIMA_3MM
+    return 'valida' if perda_mm >= refilo_min else 'fora'
+
+
+def criar_adaptador(revisao: str, modulo) -> tuple:
+    """
+    Função de busca da revisão com a assinatura comum:
+        buscar(dev_ancora, ancora, mats_comp, devs_comp, largura, max_comp,
+               espessura, limite_cortes) -> lista de dicts com 'Status'
+               normalizado
+
+    SAÍDA:
+        (buscar, lista de avisos sobre o que foi emulado)
+    """
+    if hasattr(modulo, 'buscar_combinacoes_para_largura'):
+        def buscar(dev_ancora, ancora, mats_comp, devs_comp, largura, max_comp, espessura, limite_cortes):
+            res = modulo.buscar_combinacoes_para_largura(
+                dev_ancora, ancora, mats_comp, devs_comp, largura, max_comp, espessura, limite_cortes)
+            for r in res:
+                r['Status'] = STATUS_NORMALIZADO[r['Status']]
+            return res
+        return buscar, []
+
+    parametros = modulo._buscar_para_largura.__code__.co_varnames[:modulo._buscar_para_largura.__code__.co_argcount]
+    tem_limite = 'limite_cortes' in parametros
+    tem_refilo = 'espessura' in parametros
+    avisos = []
+    if not tem_limite:
+        avisos.append('limite de cortes filtrado pelo adaptador')
+    if not tem_refilo:
+        avisos.append('status pela regra de refilo da rev005')
+
+    def buscar(dev_ancora, ancora, mats_comp, devs_comp, largura, max_comp, espessura, limite_cortes):
+        extras = {}
+        if tem_limite:
+            extras['limite_cortes'] = limite_cortes
+        if tem_refilo:
+            extras['espessura'] = espessura
+        res = modulo._buscar_para_largura(dev_ancora, ancora, mats_comp, devs_comp, largura, max_comp, **extras)
+
+        if not tem_limite and limite_cortes is not None:
+            res = [r for r in res if sum(d['N_cortes'] for d in r['Detalhes']) <= limite_cortes]
+        for r in res:
+            r['Status'] = (STATUS_NORMALIZADO[r['Status']] if tem_refilo
+                           else _status_pela_regra(r['Perda_mm'], espessura))
+        return res
+
+    return buscar, avisos
+
+
+# Motores registrados: nome → (buscar, avisos)
+MOTORES: dict[str, tuple] = {}
+
+
+def registrar_motor(nome: str, buscar, avisos: list[str] | None = None) -> None:
+    """
+    Registra um motor novo para comparar com o oráculo. `buscar` deve ter a
+    assinatura comum (ver criar_adaptador) e devolver 'Status' normalizado.
+    """
+    MOTORES[nome] = (buscar, avisos or [])
+
+
+# ================================================================================
+# CONSULTAS E COMPARAÇÃO
+# ================================================================================
+
+def montar_consultas(df: pd.DataFrame, rotulo: str, consultas: list[tuple], max_comps, com_limite: bool = True) -> list[dict]:
+    """
+    Expande (espessura, tipo, âncora) em consultas por largura, nº de
+    complementares e limite, com as complementares montadas como na rev005.
+    """
+    saida = []
+    for esp, tipo, ancora in consultas:
+        grupo = pc.listar_matrizes(df, esp, tipo)
+        comp = grupo[grupo['Matriz'] != ancora]
+        dev_ancora = pc.obter_desenvolvimento(df, ancora, esp)
+        for max_comp in max_comps:
+            for largura in pc.LARGURAS_BOBINA:
+                for limite in ((None, LIMITE_CORTES_TESTADO) if com_limite else (None,)):
+                    saida.append({
+                        'origem': rotulo, 'espessura': esp, 'tipo': tipo, 'matriz': ancora,
+                        'max_comp': max_comp, 'largura': largura, 'limite_cortes': limite,
+                        'args': (dev_ancora, ancora, comp['Matriz'].tolist(), comp['Dev_mm'].tolist(),
+                                 largura, max_comp, esp, limite),
+                    })
+    return saida
+
+
+def chave_combinacao(resultado: dict) -> tuple:
+    """Identidade da combinação, independente da ordem das complementares."""
+    detalhes = resultado['Detalhes']
+    return (detalhes[0]['N_cortes'],) + tuple(sorted((d['Matriz'], d['N_cortes']) for d in detalhes[1:]))
+
+
+def diferencas(oraculo: list[dict], outro: list[dict]) -> dict:
+    """Faltando / sobrando / perda diferente / status diferente em relação ao oráculo."""
+    ref = {chave_combinacao(r): r for r in oraculo}
+    res = {chave_combinacao(r): r for r in outro}
+    comuns = ref.keys() & res.keys()
+    return {
+        'faltando': len(ref.keys() - res.keys()),
+        'sobrando': len(res.keys() - ref.keys()),
+        'perda_diferente': sum(abs(ref[k]['Perda_mm'] - res[k]['Perda_mm']) > 1e-6 for k in comuns),
+        'status_diferente': sum(ref[k]['Status'] != res[k]['Status'] for k in comuns),
+        'exemplos_faltando': [ref[k]['Combinacao'] for k in list(ref.keys() - res.keys())[:3]],
+        'exemplos_sobrando': [res[k]['Combinacao'] for k in list(res.keys() - ref.keys())[:3]],
+    }
+
+
+def comparar_motores(consultas: list[dict], motores: dict, repeticoes: int) -> list[dict]:
+    """Roda cada consulta em cada motor e compara com o oráculo."""
+    linhas = []
+    for consulta in consultas:
+        resultados = {}
+        linha = {k: v for k, v in consulta.items() if k != 'args'}
+        for nome, (buscar, _) in motores.items():
+            tempos, res = cronometrar(lambda: buscar(*consulta['args']), repeticoes)
+            resultados[nome] = res
+            linha[nome] = {'resultados': len(res),
+                           'validas': sum(r['Status'] == 'valida' for r in res),
+                           'min_s': round(min(tempos), 6)}
+        for nome in motores:
+            if nome != ORACULO:
+                linha[nome].update(diferencas(resultados[ORACULO], resultados[nome]))
+        linhas.append(linha)
+    return linhas
+
+
+def imprimir_relatorio(linhas: list[dict], motores: dict) -> None:
+    """Tempos lado a lado e resumo de concordância por motor."""
+    nomes = list(motores)
+    print(f"\n  {'consulta':<46}" + ''.join(f"{n:>18}" for n in nomes))
+    for linha in linhas:
+        rotulo = (f"{linha['matriz'][:18]} e{linha['espessura']} c{linha['max_comp']} "
+                  f"L{linha['largura']} lim {linha['limite_cortes']}")
+        celulas = []
+        for n in nomes:
+            m = linha[n]
+            ok = '' if n == ORACULO else ('' if not any(m[k] for k in ('faltando', 'sobrando', 'perda_diferente', 'status_diferente')) else ' ✗')
+            celulas.append(f"{m['resultados']:>6} {m['min_s']:>8.4f}s{ok:<2}")
+        print(f"  {rotulo:<46}" + ''.join(f"{c:>18}" for c in celulas))
+
+    print(f"\n  {'motor':<10} {'tempo total':>12} {'vs oráculo':>11} {'consultas iguais':>17}   avisos")
+    total_oraculo = sum(l[ORACULO]['min_s'] for l in linhas)
+    for n in nomes:
+        total = sum(l[n]['min_s'] for l in linhas)
+        iguais = len(linhas) if n == ORACULO else sum(
+            not any(l[n][k] for k in ('faltando', 'sobrando', 'perda_diferente', 'status_diferente')) for l in linhas)
+        razao = total / total_oraculo if total_oraculo else float('nan')
+        print(f"  {n:<10} {total:>11.3f}s {razao:>10.2f}x {iguais:>8}/{len(linhas):<8}   {'; '.join(motores[n][1]) or '-'}")
+
+    divergentes = [(l, n) for l in linhas for n in nomes if n != ORACULO
+                   and any(l[n][k] for k in ('faltando', 'sobrando', 'perda_diferente', 'status_diferente'))]
+    for linha, n in divergentes[:10]:
+        m = linha[n]
+        print(f"\n  ✗ {n} — {linha['matriz']} esp {linha['espessura']} comp {linha['max_comp']} "
+              f"L{linha['largura']} lim {linha['limite_cortes']}: faltando {m['faltando']}, sobrando {m['sobrando']}, "
+              f"perda ≠ {m['perda_diferente']}, status ≠ {m['status_diferente']}")
+        for c in m['exemplos_faltando']:
+            print(f"      falta:  {c}")
+        for c in m['exemplos_sobrando']:
+            print(f"      sobra:  {c}")
+
+
+# ================================================================================
+# EXECUÇÃO
+# ================================================================================
+
+def main(argv: list[str] | None = None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compara o motor de busca entre revisões do plano de corte")
+    parser.add_argument('--revisoes', nargs='+', default=REVISOES, choices=REVISOES)
+    parser.add_argument('--max-comp', nargs='+', type=int, default=list(MAX_COMP_PAD),
+                        help="nº de complementares a testar (padrão: 1 2)")
+    parser.add_argument('--sinteticos', action='store_true',
+                        help="inclui as âncoras do catálogo sintético 'pequeno' do benchmark")
+    parser.add_argument('--repeticoes', type=int, default=REPETICOES_PAD)
+    parser.add_argument('--catalogo', metavar='ARQ', help="db_plano_corte.xlsx (consultas reais)")
+    parser.add_argument('--saida', metavar='ARQ', help="grava o relatório em JSON")
+    args = parser.parse_args(argv)
+
+    if ORACULO not in args.revisoes:
+        args.revisoes.append(ORACULO)
+
+    # ── Motores: revisões do repositório + os registrados ──
+    motores = {}
+    for revisao in args.revisoes:
+        motores[revisao] = criar_adaptador(revisao, carregar_revisao(revisao))
+    motores.update(MOTORES)
+
+    # ── Consultas ──
+    caminho_db = args.catalogo or next(
+        (c for c in (os.path.join(pc.BASE_INPUT, 'db_plano_corte.xlsx'),
+                     os.path.join(PASTA_SCRIPT, 'files', 'input', 'db_plano_corte.xlsx'))
+         if os.path.exists(c)), None)
+    consultas = []
+    if caminho_db:
+        df = pc.carregar_dados(caminho_db)
+        reais = [c for c in CONSULTAS_REAIS if ((df['Matriz'] == c[2]) & (df['Espessura'] == c[0])).any()]
+        consultas += montar_consultas(df, 'real', reais, args.max_comp)
+    if args.sinteticos or not caminho_db:
+        df_sint = gerar_catalogo_sintetico(n_matrizes=15, espessuras=(2.0, 4.75))
+        sint = [(esp, 'COMERCIAL', ancora) for esp in (2.0, 4.75)
+                for _, ancora in escolher_ancoras(pc.listar_matrizes(df_sint, esp, 'COMERCIAL'))]
+        consultas += montar_consultas(df_sint, 'sintetico', sint, args.max_comp)
+
+    print(f"\n  {len(consultas)} consultas × {len(motores)} motores "
+          f"(janela {pc.PERDA_MIN_PCT}–{pc.PERDA_MAX_PCT} %, oráculo {ORACULO})")
+    linhas = comparar_motores(consultas, motores, args.repeticoes)
+    imprimir_relatorio(linhas, motores)
+
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            json.dump({'gerado_em': datetime.now().isoformat(timespec='seconds'),
+                       'oraculo': ORACULO,
+                       'avisos': {n: motores[n][1] for n in motores},
+                       'consultas': linhas}, f, ensure_ascii=False, indent=2)
+        print(f"\n  ✓ {args.saida}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
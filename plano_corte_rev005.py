@@ -24,17 +24,43 @@ ESTRUTURA DO CÓDIGO:
     BLOCO 4: Motor de busca combinatorial
     BLOCO 5: Cálculo de KG
     BLOCO 6: Validação de resultados
-    BLOCO 7: Interface com usuário (CLI)
-    BLOCO 8: Exportação para Excel
+    BLOCO 7: Interface com usuário (CLI e paginador)
+    BLOCO 8: Exportação (Excel e formatos colunares)
     BLOCO 9: Função principal (main)
+    BLOCO 10: Processamento em lote (sem menu)
+    BLOCO 11: Motor em memória e sessão interativa
+    BLOCO 12: Serviço HTTP local
+    BLOCO 13: Front-end assíncrono (cancelamento de consultas superadas)
+    BLOCO 14: Planejamento por demanda (várias bobinas)
+    BLOCO 15: Sequenciamento de padrões (troca de facas)
+    BLOCO 16: Atribuição de bobinas do estoque
+    BLOCO 17: Atlas de viabilidade do catálogo
+    BLOCO 18: Perfil de execução (tempo e memória por etapa)
+    BLOCO 19: Varredura de sensibilidade (janela de perda e larguras)
+    BLOCO 20: Largura de bobina ótima (varredura de larguras arbitrárias)
 ================================================================================
 """
 
 import os
 import platform
+import re
+import sys
+import heapq
+import pickle
+import tempfile
+import time
+import unicodedata
+from bisect import bisect_left
+from math import prod
+import numpy as np
 import pandas as pd
 from itertools import combinations, product as iproduct
+import threading
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, replace
 from datetime import datetime
+from itertools import count, islice
+from typing import Iterable, Iterator
 
 
 # ================================================================================
@@ -74,6 +100,154 @@ MAX_COMP_NA_COMBO = 2
 PESO_MEDIO_BOB_PAD = 12_000  # kg (12 toneladas)
 QTD_BOBINAS_PAD = 1
 
+# Acima deste número de combinações o Excel é gravado em modo streaming
+LIMITE_COMBOS_EXCEL_NORMAL = 2_000
+LINHAS_MAX_EXCEL = 1_048_576       # linhas de uma planilha (limite do formato)
+
+# Exportações em segundo plano: quantas gravam ao mesmo tempo e a cada
+# quantas linhas o progresso é atualizado
+MAX_EXPORTACOES_SIMULTANEAS = 2
+INTERVALO_PROGRESSO = 500
+
+# Terminal: linhas da tabela mostradas por página (o resto fica no paginador)
+LINHAS_POR_PAGINA = 40
+
+# Busca de âncora no menu: quantas sugestões mostrar por busca
+MAX_SUGESTOES_ANCORA = 15
+
+# Busca sem nenhuma combinação na janela: quantas combinações mais próximas
+# guardar de cada lado (perda acima / abaixo da janela). 0 = não sugerir
+MAX_SUGESTOES_PROXIMAS = 5
+
+# Planejamento por demanda: colunas (padrões) acrescentadas ao LP por iteração
+# e tempo máximo do problema inteiro sobre as colunas geradas
+MAX_COLUNAS_POR_ITERACAO = 50
+TEMPO_MAX_PLANO_INTEIRO_S = 3
+
+# Sequenciamento de padrões: custo de cada troca de setup da slitter (minutos)
+#   fixo: parada por troca de padrão | mm: por mm de faca deslocada
+#   faca: por faca colocada ou retirada
+CUSTO_TROCA_FACAS = {'fixo': 5.0, 'mm': 0.01, 'faca': 1.5}
+TEMPO_MAX_SEQUENCIAMENTO_S = 0.5   # limite da busca local (2-opt)
+
+# Orçamento de memória da busca (MB). Cada combinação custa em média
+# BYTES_POR_COMBINACAO no fluxo inteiro (lista do motor + DataFrame + KG +
+# pico da exportação em streaming, medido com tracemalloc). Se uma largura
+# passar de ORCAMENTO_MEMORIA_MB / BYTES_POR_COMBINACAO combinações, a busca
+# guarda só as melhores (modo top-K) em vez de estourar a memória.
+# None = sem limite. É o padrão de ConfigPlano.orcamento_memoria_mb; cada
+# consulta (e --orcamento-mb) leva o seu orçamento na config.
+ORCAMENTO_MEMORIA_MB = 1024
+BYTES_POR_COMBINACAO = 3_000
+
+# Com o orçamento estourado: 'top_k' guarda só as melhores; 'disco' também
+# grava TODAS em corridas ordenadas (arquivos temporários) e a exportação
+# lê a intercalação delas — CSV/JSONL/Parquet completos, Excel até o
+# limite de linhas da planilha. O terminal mostra as melhores nos dois modos.
+# Padrão de ConfigPlano.modo_orcamento (--modo-orcamento troca na config).
+MODO_ORCAMENTO = 'top_k'
+
+# Corridas em disco: combinações por bloco gravado (na intercalação fica
+# um bloco de cada corrida em memória) e por bloco da exportação a partir
+# do disco
+TAMANHO_BLOCO_CORRIDA = 1_000
+TAMANHO_BLOCO_EXPORTACAO = 10_000
+
+# Largura ótima: faixa de larguras avaliadas (mm, de 1 em 1) quando não informada
+FAIXA_LARGURA_OTIMA = (900, 1600)
+
+# Sessão interativa / serviço: quantas consultas ficam guardadas em memória
+MAX_CONSULTAS_EM_CACHE = 64
+
+# Front-end assíncrono: combinações enviadas por lote de resultado parcial
+TAMANHO_LOTE_PARCIAL = 200
+
+# Formatos colunares gravados junto com o Excel (para MES/BI)
+# Opções: 'csv', 'jsonl', 'parquet' (parquet requer pyarrow)
+FORMATOS_COLUNARES = ['csv']
+
+
+# ── Regras de uma consulta ──
+
+@dataclass(frozen=True)
+class ConfigPlano:
+    """
+    Regras de negócio de UMA consulta: larguras, janela de perda, refilo,
+    nº de complementares e orçamento de memória da busca. Imutável e hashable.
+    
+    Motor, validação, terminal e exportações recebem 'config' (None =
+    ConfigPlano.padrao(), os parâmetros de negócio acima no momento da
+    chamada) em vez de ler as constantes. Como é hashable, entra na chave de
+    cache do MotorPlanejamento: consultas com regras diferentes rodam no
+    mesmo processo, ao mesmo tempo, cada uma com o seu cache.
+    
+    USO:
+        config = ConfigPlano.padrao().com(perda_max_pct=2.0, larguras=(1200, 1500))
+        encontrar_combinacoes(df, 2.0, 'COMERCIAL', '184 - [2.00]', config=config)
+    
+    Por ser um dado (e não uma constante do módulo), a config chega inteira
+    aos processos de trabalho (lote, pool do serviço), inclusive com spawn.
+    
+    ERRO:
+        ValueError se as regras forem inconsistentes (sem larguras, largura
+        ≤ 0, janela invertida, complementares negativas, orçamento ≤ 0)
+    """
+    larguras: tuple[int, ...]
+    perda_min_pct: float
+    perda_max_pct: float
+    refilo_min_ate_3mm: float
+    refilo_min_acima_3mm: float
+    max_complementares: int
+    espessura_limite_refilo: float = 3.0    # até esta espessura vale refilo_min_ate_3mm
+    orcamento_memoria_mb: float | None = None   # None = sem limite (ver ORCAMENTO_MEMORIA_MB)
+    modo_orcamento: str = 'top_k'               # 'top_k' ou 'disco' (ver MODO_ORCAMENTO)
+    
+    def __post_init__(self):
+        # Lista de larguras vira tupla: a config continua hashable
+        object.__setattr__(self, 'larguras', tuple(int(l) for l in self.larguras))
+        if not self.larguras:
+            raise ValueError("informe ao menos uma largura de bobina")
+        if min(self.larguras) <= 0:
+            raise ValueError(f"larguras de bobina devem ser > 0 mm (recebido {list(self.larguras)})")
+        if not 0 <= self.perda_min_pct <= self.perda_max_pct:
+            raise ValueError(f"janela de perda inválida: {self.perda_min_pct}% – {self.perda_max_pct}%")
+        if self.max_complementares < 0:
+            raise ValueError("máximo de complementares não pode ser negativo")
+        if self.orcamento_memoria_mb is not None and self.orcamento_memoria_mb <= 0:
+            raise ValueError("orçamento de memória deve ser > 0 MB (None = sem limite)")
+        if self.modo_orcamento not in ('top_k', 'disco'):
+            raise ValueError(f"modo de orçamento inválido: {self.modo_orcamento!r} (use 'top_k' ou 'disco')")
+    
+    @classmethod
+    def padrao(cls) -> 'ConfigPlano':
+        """Config com os parâmetros de negócio do BLOCO 1 (valores atuais)."""
+        return cls(
+            larguras=tuple(LARGURAS_BOBINA),
+            perda_min_pct=PERDA_MIN_PCT,
+            perda_max_pct=PERDA_MAX_PCT,
+            refilo_min_ate_3mm=REFILO_MIN_ATE_3MM,
+            refilo_min_acima_3mm=REFILO_MIN_ACIMA_3MM,
+            max_complementares=MAX_COMP_NA_COMBO,
+            orcamento_memoria_mb=ORCAMENTO_MEMORIA_MB,
+            modo_orcamento=MODO_ORCAMENTO,
+        )
+    
+    def com(self, **mudancas) -> 'ConfigPlano':
+        """Cópia com alguns campos trocados (a original não muda)."""
+        return replace(self, **mudancas)
+    
+    def refilo_min(self, espessura: float) -> float:
+        """Refilo mínimo (mm) para a espessura."""
+        return self.refilo_min_ate_3mm if espessura <= self.espessura_limite_refilo else self.refilo_min_acima_3mm
+    
+    def janela_mm(self, largura: int) -> tuple[float, float]:
+        """(perda mínima, perda máxima) em mm para a largura."""
+        return largura * self.perda_min_pct / 100, largura * self.perda_max_pct / 100
+    
+    def como_dict(self) -> dict:
+        """Campos em dict serializável (JSON)."""
+        return {**asdict(self), 'larguras': list(self.larguras)}
+
 
 # ================================================================================
 # BLOCO 2: FUNÇÕES DE CARGA E LIMPEZA DE DADOS
@@ -182,6 +356,152 @@ def listar_matrizes(df: pd.DataFrame, espessura: float, tipo: str) -> pd.DataFra
     )
 
 
+def normalizar_texto(texto) -> str:
+    """Minúsculas, sem acentos e com espaços simples (para comparar buscas)."""
+    sem_acento = unicodedata.normalize('NFKD', str(texto)).encode('ascii', 'ignore').decode()
+    return ' '.join(sem_acento.lower().split())
+
+
+def montar_indice_ancoras(df: pd.DataFrame) -> dict:
+    """
+    Índice de busca de âncoras por (espessura, tipo): nome da matriz,
+    Produto e Código, montado uma vez por catálogo.
+    
+    ENTRADA:
+        df: DataFrame de carregar_dados (Produto / Código são opcionais)
+    
+    SAÍDA:
+        {(espessura, tipo): {
+            'matrizes': DataFrame [Matriz, Dev_mm, Codigo, Produto] (= ordem de listar_matrizes),
+            'codigos':  {código: [posições]},
+            'nomes':    {nome normalizado: [posições]},
+            'tokens':   lista ORDENADA de (palavra, posição, é_nome_inteiro) para
+                        busca por prefixo com bisect,
+            'textos':   nome + produtos + códigos normalizados (busca por trecho)
+        }}
+    """
+    base = df[['Espessura', 'Tipo de material', 'Matriz', 'Desenvolvimento']].copy()
+    base['Codigo'] = df['Código'].astype(str).str.strip() if 'Código' in df.columns else ''
+    base['Produto'] = df['Produto'].astype(str).str.strip() if 'Produto' in df.columns else ''
+    
+    juntar = lambda valores: ' | '.join(dict.fromkeys(v for v in valores if v not in ('', 'nan')))
+    matrizes = (
+        base.groupby(['Espessura', 'Tipo de material', 'Matriz'])
+        .agg(Dev_mm=('Desenvolvimento', 'mean'), Codigo=('Codigo', juntar), Produto=('Produto', juntar))
+        .reset_index()
+    )
+    
+    indice = {}
+    for (esp, tipo), grupo in matrizes.groupby(['Espessura', 'Tipo de material']):
+        grupo = (
+            grupo[['Matriz', 'Dev_mm', 'Codigo', 'Produto']]
+            .sort_values('Dev_mm', ascending=False)
+            .reset_index(drop=True)
+        )
+        codigos, nomes, tokens, textos = {}, {}, [], []
+        
+        for pos, (matriz, codigo, produto) in enumerate(zip(grupo['Matriz'], grupo['Codigo'], grupo['Produto'])):
+            nome = normalizar_texto(matriz)
+            nomes.setdefault(nome, []).append(pos)
+            tokens.append((nome, pos, True))
+            
+            lista_codigos = codigo.split(' | ') if codigo else []
+            for c in lista_codigos:
+                codigos.setdefault(c, []).append(pos)
+            
+            texto = normalizar_texto(f"{matriz} {produto} {' '.join(lista_codigos)}")
+            for palavra in set(re.split(r'[\s\[\]()"/|-]+', texto)) - {''}:
+                tokens.append((palavra, pos, False))
+            textos.append(texto)
+        
+        tokens.sort()
+        indice[(esp, tipo)] = {'matrizes': grupo, 'codigos': codigos, 'nomes': nomes,
+                               'tokens': tokens, 'textos': textos}
+    
+    return indice
+
+
+# Critérios de busca de âncora, do mais forte para o mais fraco
+CRITERIOS_BUSCA_ANCORA = ['código', 'nome', 'início do nome', 'início de palavra', 'trecho']
+
+
+def buscar_ancoras(
+    indice: dict,
+    espessura: float,
+    tipo: str,
+    texto: str,
+    limite: int | None = MAX_SUGESTOES_ANCORA
+) -> pd.DataFrame:
+    """
+    Busca matrizes âncora por código, nome, prefixo ou trecho (sem
+    diferenciar maiúsculas nem acentos), já ordenadas por relevância.
+    
+    ORDEM:
+        1. Código exato          ('200197')
+        2. Nome exato            ('184 - [2.00]')
+        3. Início do nome        ('50x25' → '50X25X10 [106]')
+        4. Início de palavra     ('galv' → produto '... GALVANIZADO ...')
+        5. Trecho em qualquer lugar (nome, produto ou código)
+        Empate: nome mais curto primeiro.
+    
+    ENTRADA:
+        indice: montar_indice_ancoras(df)
+        texto: o que o usuário digitou (vazio = todas as matrizes)
+        limite: máximo de sugestões (None = todas)
+    
+    SAÍDA:
+        DataFrame [Matriz, Dev_mm, Codigo, Produto, Criterio]
+    """
+    grupo = indice.get((espessura, tipo))
+    if grupo is None:
+        return pd.DataFrame(columns=['Matriz', 'Dev_mm', 'Codigo', 'Produto', 'Criterio'])
+    
+    matrizes = grupo['matrizes']
+    q = normalizar_texto(texto)
+    if not q:
+        res = matrizes.assign(Criterio='')
+        return res if limite is None else res.head(limite)
+    
+    nivel = {}
+    
+    def marcar(posicoes, n):
+        for pos in posicoes:
+            if n < nivel.get(pos, len(CRITERIOS_BUSCA_ANCORA)):
+                nivel[pos] = n
+    
+    marcar(grupo['codigos'].get(texto.strip(), []), 0)
+    marcar(grupo['nomes'].get(q, []), 1)
+    
+    # Prefixo: as palavras que começam com q são contíguas na lista ordenada
+    tokens = grupo['tokens']
+    i = bisect_left(tokens, (q,))
+    while i < len(tokens) and tokens[i][0].startswith(q):
+        palavra, pos, inteiro = tokens[i]
+        marcar([pos], 2 if inteiro else 3)
+        i += 1
+    
+    # Trecho: só varre se ainda faltam sugestões
+    if limite is None or len(nivel) < limite:
+        marcar([pos for pos, t in enumerate(grupo['textos']) if q in t], 4)
+    
+    if not nivel:
+        return matrizes.iloc[0:0].assign(Criterio='')
+    
+    ordem = sorted(nivel, key=lambda pos: (nivel[pos], len(matrizes.at[pos, 'Matriz']), matrizes.at[pos, 'Matriz']))
+    if limite is not None:
+        ordem = ordem[:limite]
+    
+    return (
+        matrizes.iloc[ordem]
+        .assign(Criterio=[CRITERIOS_BUSCA_ANCORA[nivel[pos]] for pos in ordem])
+        .reset_index(drop=True)
+    )
+
+
+class MatrizNaoEncontrada(ValueError):
+    """A matriz não existe na espessura informada (o serviço HTTP responde 404)."""
+
+
 def obter_desenvolvimento(df: pd.DataFrame, matriz: str, espessura: float) -> float:
     """
     Obtém o desenvolvimento (largura necessária) de uma matriz específica.
@@ -195,14 +515,14 @@ def obter_desenvolvimento(df: pd.DataFrame, matriz: str, espessura: float) -> fl
         Desenvolvimento em mm (ex: 157.0)
     
     ERRO:
-        ValueError se a matriz não existir no banco
+        MatrizNaoEncontrada (ValueError) se a matriz não existir no banco
     """
     # Filtra por matriz e espessura
     mask = (df['Matriz'] == matriz) & (df['Espessura'] == espessura)
     vals = df[mask]['Desenvolvimento'].dropna()
     
     if vals.empty:
-        raise ValueError(f"Matriz '{matriz}' com espessura {espessura} mm não encontrada.")
+        raise MatrizNaoEncontrada(f"Matriz '{matriz}' com espessura {espessura} mm não encontrada.")
     
     # Retorna média (caso matriz apareça múltiplas vezes)
     return float(vals.mean())
@@ -212,7 +532,38 @@ def obter_desenvolvimento(df: pd.DataFrame, matriz: str, espessura: float) -> fl
 # BLOCO 4: MOTOR DE BUSCA COMBINATORIAL
 # ================================================================================
 
-def buscar_combinacoes_para_largura(
+class BuscaCancelada(Exception):
+    """A busca foi interrompida pelo evento 'cancelar' (ver gerar_combinacoes_para_largura)."""
+
+
+def novos_contadores() -> dict:
+    """
+    Contadores de uma largura, preenchidos por gerar_combinacoes_para_largura
+    quando o parâmetro 'contadores' é informado.
+    
+    CAMPOS:
+        candidatos:      arranjos visitados (âncora sozinha + pontos da grade
+                         de quantidades de cada grupo de complementares)
+        estouro_largura: rejeitados por passar da largura da bobina
+        estouro_limite:  rejeitados pelo limite de cortes
+        fora_janela:     cabem, mas a perda está fora da janela de %
+        validas / fora_regra: na janela (com / sem o refilo mínimo)
+        grupos_matrizes: grupos de complementares gerados por combinations
+        por_n_ancora:    {n: {candidatos, validas, fora_regra}}
+        tempos_s:        ancora (laço da âncora e filtros), combinacoes
+                         (montagem de cada grupo), grade (laço iproduct),
+                         montagem (dicts dos resultados) e total — sem o
+                         tempo em que o consumidor segura o gerador
+    """
+    return {
+        'candidatos': 0, 'estouro_largura': 0, 'estouro_limite': 0, 'fora_janela': 0,
+        'validas': 0, 'fora_regra': 0, 'grupos_matrizes': 0,
+        'por_n_ancora': {},
+        'tempos_s': {'ancora': 0.0, 'combinacoes': 0.0, 'grade': 0.0, 'montagem': 0.0, 'total': 0.0},
+    }
+
+
+def gerar_combinacoes_para_largura(
     dev_ancora: float,
     matriz_ancora: str,
     matrizes_complementares: list[str],
@@ -220,11 +571,18 @@ def buscar_combinacoes_para_largura(
     largura_bobina: int,
     max_complementares: int,
     espessura: float,
-    limite_cortes: int | None = None
-) -> list[dict]:
+    limite_cortes: int | None = None,
+    cancelar: threading.Event | None = None,
+    contadores: dict | None = None,
+    config: ConfigPlano | None = None
+) -> Iterator[dict]:
     """
     Motor principal: testa TODAS as combinações possíveis para uma largura.
     
+    Versão em fluxo (generator): cada combinação encontrada é entregue assim
+    que é montada, sem acumular a lista inteira em memória. Permite exportar
+    ou exibir direto do motor (ver exportar_excel_streaming).
+    
     ALGORITMO:
         Para cada quantidade N de cortes da âncora (1, 2, 3, ...):
             1. Calcula espaço restante = largura - (dev_ancora × N)
@@ -238,13 +596,19 @@ def buscar_combinacoes_para_largura(
         matriz_ancora: nome da matriz âncora
         matrizes_complementares: lista de nomes das outras matrizes
         devs_complementares: desenvolvimentos correspondentes
-        largura_bobina: 1000, 1200 ou 1500 mm
+        largura_bobina: largura da bobina em mm (uma de config.larguras)
         max_complementares: quantas complementares permitir (padrão: 2)
         espessura: espessura em mm (para calcular refilo mínimo)
         limite_cortes: soma máxima de cortes permitida (None = sem limite)
+        cancelar: evento opcional; se for sinalizado (por outra thread), a
+                  busca para no próximo grupo de matrizes com BuscaCancelada
+        contadores: dict opcional; se informado, recebe em contadores[largura]
+                    os contadores e tempos da busca (ver novos_contadores).
+                    Sem ele, o custo extra é o de dois inteiros locais
+        config: regras (janela de perda e refilo); None = ConfigPlano.padrao()
     
     SAÍDA:
-        Lista de dicionários, cada um representando uma combinação válida:
+        Iterador de dicionários, cada um representando uma combinação válida:
         {
             'Combinacao': '50,80-2"(x3) + 38,10(x2)',
             'N_ancora': 3,
@@ -259,170 +623,269 @@ def buscar_combinacoes_para_largura(
         }
     """
     # ── Calcula limites de validação ──
-    perda_min_mm = largura_bobina * PERDA_MIN_PCT / 100
-    perda_max_mm = largura_bobina * PERDA_MAX_PCT / 100
+    config = config or ConfigPlano.padrao()
+    perda_min_mm, perda_max_mm = config.janela_mm(largura_bobina)
     
     # Refilo mínimo depende da espessura
-    refilo_min = REFILO_MIN_ATE_3MM if espessura <= 3.0 else REFILO_MIN_ACIMA_3MM
+    refilo_min = config.refilo_min(espessura)
     
     # Máximo de cortes da âncora que cabem na bobina
     max_n_ancora = int(largura_bobina / dev_ancora)
     
-    resultados = []
+    # ── Contadores: sem 'contadores', só os dois inteiros de rejeição ──
+    medir = contadores is not None
+    estouro_largura = estouro_limite = 0
+    if medir:
+        c = contadores.setdefault(largura_bobina, novos_contadores())
+        t_inicio = time.perf_counter()
+        t_pausa = t_combinacoes = t_grade = t_montagem = 0.0
     
-    # ── Loop principal: varia quantidade de cortes da âncora ──
-    for n_ancora in range(1, max_n_ancora + 1):
-        
-        # Calcula quanto a âncora ocupa
-        soma_ancora = dev_ancora * n_ancora
-        espaco_restante = largura_bobina - soma_ancora
-        
-        # Se âncora já ultrapassou, para
-        if espaco_restante < 0:
-            break
-        
-        # ═══════════════════════════════════════════════════════════
-        # CASO 1: SÓ A ÂNCORA (sem complementares)
-        # ═══════════════════════════════════════════════════════════
-        
-        perda_mm = espaco_restante
-        total_cortes = n_ancora
-        
-        # Validação em cascata:
-        # 1º: perda % deve estar na janela
-        passa_pct = (perda_min_mm <= perda_mm <= perda_max_mm)
-        
-        # 2º: perda mm deve ser >= refilo mínimo
-        passa_refilo = (perda_mm >= refilo_min)
-        
-        # 3º: total de cortes deve respeitar limite
-        passa_cortes = (limite_cortes is None or total_cortes <= limite_cortes)
-        
-        # Se passou na janela de % E no limite de cortes
-        if passa_pct and passa_cortes:
-            # Define status baseado no refilo
-            if passa_refilo:
-                status = "✓ Válida"
-            else:
-                status = "Fora da regra"
+    try:
+        # ── Loop principal: varia quantidade de cortes da âncora ──
+        for n_ancora in range(1, max_n_ancora + 1):
             
-            # Adiciona aos resultados
-            resultados.append({
-                'Combinacao': f'{matriz_ancora}(x{n_ancora})',
-                'N_ancora': n_ancora,
-                'Num_comp': 0,
-                'Total_cortes': total_cortes,
-                'Detalhes': [{
-                    'Matriz': matriz_ancora,
-                    'Desenvolvimento_mm': dev_ancora,
-                    'N_cortes': n_ancora,
-                    'Subtotal_mm': round(soma_ancora, 3)
-                }],
-                'Soma_cortes_mm': round(soma_ancora, 3),
-                'Perda_mm': round(perda_mm, 3),
-                'Perda_pct': round(perda_mm / largura_bobina * 100, 4),
-                'Largura_bobina': largura_bobina,
-                'Status': status
-            })
-        
-        # ═══════════════════════════════════════════════════════════
-        # CASO 2: ÂNCORA + COMPLEMENTARES
-        # ═══════════════════════════════════════════════════════════
-        
-        # Se não sobrou espaço para nenhuma complementar, pula
-        if espaco_restante < min(devs_complementares, default=largura_bobina + 1):
-            continue
-        
-        # Filtra só as complementares que cabem no espaço restante
-        indices_que_cabem = [
-            i for i, dev in enumerate(devs_complementares)
-            if dev <= espaco_restante
-        ]
-        
-        if not indices_que_cabem:
-            continue
-        
-        # Testa com 1 complementar, depois 2, etc (até max_complementares)
-        for qtd_comp in range(1, min(max_complementares, len(indices_que_cabem)) + 1):
+            # Calcula quanto a âncora ocupa
+            soma_ancora = dev_ancora * n_ancora
+            espaco_restante = largura_bobina - soma_ancora
+            
+            # Se âncora já ultrapassou, para
+            if espaco_restante < 0:
+                break
+            
+            if medir:
+                por_n = c['por_n_ancora'].setdefault(n_ancora, {'candidatos': 0, 'validas': 0, 'fora_regra': 0})
+                por_n['candidatos'] += 1
+            
+            # ═══════════════════════════════════════════════════════════
+            # CASO 1: SÓ A ÂNCORA (sem complementares)
+            # ═══════════════════════════════════════════════════════════
+            
+            perda_mm = espaco_restante
+            total_cortes = n_ancora
+            
+            # Validação em cascata:
+            # 1º: perda % deve estar na janela
+            passa_pct = (perda_min_mm <= perda_mm <= perda_max_mm)
+            
+            # 2º: perda mm deve ser >= refilo mínimo
+            passa_refilo = (perda_mm >= refilo_min)
             
-            # Gera todas as combinações de 'qtd_comp' matrizes
-            # Ex: se qtd_comp=2 e temos [A,B,C], gera: (A,B), (A,C), (B,C)
-            for indices_escolhidos in combinations(indices_que_cabem, qtd_comp):
+            # 3º: total de cortes deve respeitar limite
+            passa_cortes = (limite_cortes is None or total_cortes <= limite_cortes)
+            
+            if not passa_cortes:
+                estouro_limite += 1
+            
+            # Se passou na janela de % E no limite de cortes
+            if passa_pct and passa_cortes:
+                # Define status baseado no refilo
+                if passa_refilo:
+                    status = "✓ Válida"
+                else:
+                    status = "Fora da regra"
                 
-                # Pega desenvolvimentos e nomes das escolhidas
-                devs = [devs_complementares[i] for i in indices_escolhidos]
-                nomes = [matrizes_complementares[i] for i in indices_escolhidos]
+                if medir:
+                    por_n['validas' if passa_refilo else 'fora_regra'] += 1
                 
-                # Para cada matriz, calcula quantos cortes cabem
-                max_cortes_cada = [max(1, int(espaco_restante / d)) for d in devs]
+                # Entrega o resultado
+                t_yield = time.perf_counter() if medir else 0.0
+                yield {
+                    'Combinacao': f'{matriz_ancora}(x{n_ancora})',
+                    'N_ancora': n_ancora,
+                    'Num_comp': 0,
+                    'Total_cortes': total_cortes,
+                    'Detalhes': [{
+                        'Matriz': matriz_ancora,
+                        'Desenvolvimento_mm': dev_ancora,
+                        'N_cortes': n_ancora,
+                        'Subtotal_mm': round(soma_ancora, 3)
+                    }],
+                    'Soma_cortes_mm': round(soma_ancora, 3),
+                    'Perda_mm': round(perda_mm, 3),
+                    'Perda_pct': round(perda_mm / largura_bobina * 100, 4),
+                    'Largura_bobina': largura_bobina,
+                    'Status': status
+                }
+                if medir:
+                    t_pausa += time.perf_counter() - t_yield
+            
+            # ═══════════════════════════════════════════════════════════
+            # CASO 2: ÂNCORA + COMPLEMENTARES
+            # ═══════════════════════════════════════════════════════════
+            
+            # Se não sobrou espaço para nenhuma complementar, pula
+            if espaco_restante < min(devs_complementares, default=largura_bobina + 1):
+                continue
+            
+            # Filtra só as complementares que cabem no espaço restante
+            indices_que_cabem = [
+                i for i, dev in enumerate(devs_complementares)
+                if dev <= espaco_restante
+            ]
+            
+            if not indices_que_cabem:
+                continue
+            
+            # Testa com 1 complementar, depois 2, etc (até max_complementares)
+            for qtd_comp in range(1, min(max_complementares, len(indices_que_cabem)) + 1):
                 
-                # Gera todas as combinações de quantidades de cortes
-                # Ex: se max_cortes_cada = [3, 2], gera:
-                #     (1,1), (1,2), (2,1), (2,2), (3,1), (3,2)
-                for qtds_cortes in iproduct(*[range(1, mx + 1) for mx in max_cortes_cada]):
+                # Gera todas as combinações de 'qtd_comp' matrizes
+                # Ex: se qtd_comp=2 e temos [A,B,C], gera: (A,B), (A,C), (B,C)
+                for indices_escolhidos in combinations(indices_que_cabem, qtd_comp):
                     
-                    # Calcula soma das complementares
-                    soma_comp = sum(d * n for d, n in zip(devs, qtds_cortes))
-                    soma_total = soma_ancora + soma_comp
-                    total_cortes = n_ancora + sum(qtds_cortes)
+                    # Cancelamento cooperativo (consulta substituída por outra mais nova)
+                    if cancelar is not None and cancelar.is_set():
+                        raise BuscaCancelada(matriz_ancora)
                     
-                    # Se ultrapassou a largura, pula
-                    if soma_total > largura_bobina:
-                        continue
+                    if medir:
+                        t_grupo = time.perf_counter()
+                        pausa_grupo = t_pausa
                     
-                    # Se ultrapassou limite de cortes, pula
-                    if limite_cortes is not None and total_cortes > limite_cortes:
-                        continue
+                    # Pega desenvolvimentos e nomes das escolhidas
+                    devs = [devs_complementares[i] for i in indices_escolhidos]
+                    nomes = [matrizes_complementares[i] for i in indices_escolhidos]
                     
-                    # Calcula perda
-                    perda_mm = largura_bobina - soma_total
+                    # Para cada matriz, calcula quantos cortes cabem
+                    max_cortes_cada = [max(1, int(espaco_restante / d)) for d in devs]
                     
-                    # Validação em cascata
-                    passa_pct = (perda_min_mm <= perda_mm <= perda_max_mm)
-                    passa_refilo = (perda_mm >= refilo_min)
+                    if medir:
+                        c['grupos_matrizes'] += 1
+                        por_n['candidatos'] += prod(max_cortes_cada)
+                        t_inicio_grade = time.perf_counter()
+                        t_combinacoes += t_inicio_grade - t_grupo
                     
-                    # Se passou na janela de %
-                    if passa_pct:
-                        # Define status baseado no refilo
-                        if passa_refilo:
-                            status = "✓ Válida"
-                        else:
-                            status = "Fora da regra"
+                    # Gera todas as combinações de quantidades de cortes
+                    # Ex: se max_cortes_cada = [3, 2], gera:
+                    #     (1,1), (1,2), (2,1), (2,2), (3,1), (3,2)
+                    for qtds_cortes in iproduct(*[range(1, mx + 1) for mx in max_cortes_cada]):
                         
-                        # Monta lista de detalhes (âncora + cada complementar)
-                        detalhes = [{
-                            'Matriz': matriz_ancora,
-                            'Desenvolvimento_mm': dev_ancora,
-                            'N_cortes': n_ancora,
-                            'Subtotal_mm': round(soma_ancora, 3)
-                        }]
+                        # Calcula soma das complementares
+                        soma_comp = sum(d * n for d, n in zip(devs, qtds_cortes))
+                        soma_total = soma_ancora + soma_comp
+                        total_cortes = n_ancora + sum(qtds_cortes)
                         
-                        for nome, dev, n in zip(nomes, devs, qtds_cortes):
-                            detalhes.append({
-                                'Matriz': nome,
-                                'Desenvolvimento_mm': dev,
-                                'N_cortes': n,
-                                'Subtotal_mm': round(dev * n, 3)
-                            })
+                        # Se ultrapassou a largura, pula
+                        if soma_total > largura_bobina:
+                            estouro_largura += 1
+                            continue
+                        
+                        # Se ultrapassou limite de cortes, pula
+                        if limite_cortes is not None and total_cortes > limite_cortes:
+                            estouro_limite += 1
+                            continue
                         
-                        # Monta string da combinação
-                        comp_str = ' + '.join(f'{nome}(x{n})' for nome, n in zip(nomes, qtds_cortes))
+                        # Calcula perda
+                        perda_mm = largura_bobina - soma_total
                         
-                        # Adiciona aos resultados
-                        resultados.append({
-                            'Combinacao': f'{matriz_ancora}(x{n_ancora}) + {comp_str}',
-                            'N_ancora': n_ancora,
-                            'Num_comp': qtd_comp,
-                            'Total_cortes': total_cortes,
-                            'Detalhes': detalhes,
-                            'Soma_cortes_mm': round(soma_total, 3),
-                            'Perda_mm': round(perda_mm, 3),
-                            'Perda_pct': round(perda_mm / largura_bobina * 100, 4),
-                            'Largura_bobina': largura_bobina,
-                            'Status': status
-                        })
+                        # Validação em cascata
+                        passa_pct = (perda_min_mm <= perda_mm <= perda_max_mm)
+                        passa_refilo = (perda_mm >= refilo_min)
+                        
+                        # Se passou na janela de %
+                        if passa_pct:
+                            if medir:
+                                t_montar = time.perf_counter()
+                                por_n['validas' if passa_refilo else 'fora_regra'] += 1
+                            
+                            # Define status baseado no refilo
+                            if passa_refilo:
+                                status = "✓ Válida"
+                            else:
+                                status = "Fora da regra"
+                            
+                            # Monta lista de detalhes (âncora + cada complementar)
+                            detalhes = [{
+                                'Matriz': matriz_ancora,
+                                'Desenvolvimento_mm': dev_ancora,
+                                'N_cortes': n_ancora,
+                                'Subtotal_mm': round(soma_ancora, 3)
+                            }]
+                            
+                            for nome, dev, n in zip(nomes, devs, qtds_cortes):
+                                detalhes.append({
+                                    'Matriz': nome,
+                                    'Desenvolvimento_mm': dev,
+                                    'N_cortes': n,
+                                    'Subtotal_mm': round(dev * n, 3)
+                                })
+                            
+                            # Monta string da combinação
+                            comp_str = ' + '.join(f'{nome}(x{n})' for nome, n in zip(nomes, qtds_cortes))
+                            
+                            resultado = {
+                                'Combinacao': f'{matriz_ancora}(x{n_ancora}) + {comp_str}',
+                                'N_ancora': n_ancora,
+                                'Num_comp': qtd_comp,
+                                'Total_cortes': total_cortes,
+                                'Detalhes': detalhes,
+                                'Soma_cortes_mm': round(soma_total, 3),
+                                'Perda_mm': round(perda_mm, 3),
+                                'Perda_pct': round(perda_mm / largura_bobina * 100, 4),
+                                'Largura_bobina': largura_bobina,
+                                'Status': status
+                            }
+                            
+                            # Entrega o resultado
+                            if medir:
+                                t_yield = time.perf_counter()
+                                t_montagem += t_yield - t_montar
+                            yield resultado
+                            if medir:
+                                t_pausa += time.perf_counter() - t_yield
+                    
+                    if medir:
+                        t_grade += time.perf_counter() - t_inicio_grade - (t_pausa - pausa_grupo)
     
-    return resultados
+    finally:
+        # Também na busca cancelada ou interrompida pelo consumidor
+        if medir:
+            total = time.perf_counter() - t_inicio - t_pausa
+            por_n = c['por_n_ancora'].values()
+            c['candidatos'] = sum(p['candidatos'] for p in por_n)
+            c['validas'] = sum(p['validas'] for p in por_n)
+            c['fora_regra'] = sum(p['fora_regra'] for p in por_n)
+            c['estouro_largura'] += estouro_largura
+            c['estouro_limite'] += estouro_limite
+            c['fora_janela'] = (c['candidatos'] - c['estouro_largura'] - c['estouro_limite']
+                                - c['validas'] - c['fora_regra'])
+            tempos = c['tempos_s']
+            tempos['ancora'] += total - t_combinacoes - t_grade
+            tempos['combinacoes'] += t_combinacoes
+            tempos['grade'] += t_grade - t_montagem
+            tempos['montagem'] += t_montagem
+            tempos['total'] += total
+
+
+def buscar_combinacoes_para_largura(
+    dev_ancora: float,
+    matriz_ancora: str,
+    matrizes_complementares: list[str],
+    devs_complementares: list[float],
+    largura_bobina: int,
+    max_complementares: int,
+    espessura: float,
+    limite_cortes: int | None = None,
+    contadores: dict | None = None,
+    config: ConfigPlano | None = None
+) -> list[dict]:
+    """
+    Mesma busca de gerar_combinacoes_para_largura, materializada em lista.
+    
+    SAÍDA:
+        Lista de dicionários (mesmo formato do gerador)
+    """
+    return list(gerar_combinacoes_para_largura(
+        dev_ancora=dev_ancora,
+        matriz_ancora=matriz_ancora,
+        matrizes_complementares=matrizes_complementares,
+        devs_complementares=devs_complementares,
+        largura_bobina=largura_bobina,
+        max_complementares=max_complementares,
+        espessura=espessura,
+        limite_cortes=limite_cortes,
+        contadores=contadores,
+        config=config
+    ))
 
 
 def encontrar_combinacoes(
@@ -430,16 +893,19 @@ def encontrar_combinacoes(
     espessura: float,
     tipo_material: str,
     matriz_ancora: str,
-    limite_cortes: int | None = None
+    limite_cortes: int | None = None,
+    verbose: bool = True,
+    contadores: dict | None = None,
+    destino: 'BufferResultados | None' = None,
+    config: ConfigPlano | None = None
 ) -> tuple[pd.DataFrame, int]:
     """
     Orquestrador principal: tenta larguras em sequência até encontrar resultado.
     
     ESTRATÉGIA:
-        1. Tenta largura 1200 mm (mais comum)
-        2. Se não houver resultados, tenta 1000 mm
-        3. Se ainda não houver, tenta 1500 mm
-        4. Para na primeira que retornar combinações válidas
+        1. Tenta a primeira largura de config.larguras
+        2. Se não houver resultados, tenta a seguinte, na ordem da tupla
+        3. Para na primeira que retornar combinações válidas
     
     ENTRADA:
         df: DataFrame com todas as matrizes
@@ -447,6 +913,11 @@ def encontrar_combinacoes(
         tipo_material: tipo escolhido pelo usuário
         matriz_ancora: matriz âncora escolhida pelo usuário
         limite_cortes: limite opcional de cortes totais
+        verbose: False = não imprime o andamento (lote, serviço)
+        contadores: dict opcional preenchido por largura tentada
+                    (ver novos_contadores / exibir_contadores)
+        destino: BufferResultados opcional (ver buscar_nas_larguras)
+        config: regras da consulta (None = ConfigPlano.padrao())
     
     SAÍDA:
         (DataFrame com resultados, largura_usada)
@@ -475,30 +946,293 @@ def encontrar_combinacoes(
     matrizes_comp = candidatas['Matriz'].tolist()
     devs_comp = candidatas['dev'].tolist()
     
+    return buscar_nas_larguras(
+        dev_ancora=dev_ancora,
+        matriz_ancora=matriz_ancora,
+        matrizes_comp=matrizes_comp,
+        devs_comp=devs_comp,
+        espessura=espessura,
+        limite_cortes=limite_cortes,
+        verbose=verbose,
+        contadores=contadores,
+        destino=destino,
+        config=config
+    )
+
+
+def limite_combinacoes_orcamento(config: ConfigPlano | None = None) -> int | None:
+    """
+    Quantas combinações cabem no orçamento de memória da consulta
+    (config.orcamento_memoria_mb / BYTES_POR_COMBINACAO), ou None se não
+    houver orçamento. config None = ConfigPlano.padrao().
+    """
+    orcamento_mb = (config or ConfigPlano.padrao()).orcamento_memoria_mb
+    if not orcamento_mb:
+        return None
+    return max(1, int(orcamento_mb * 2**20 // BYTES_POR_COMBINACAO))
+
+
+class ColetorTopK:
+    """
+    Junta as combinações de uma largura. Enquanto cabem no limite, guarda
+    todas; ao passar dele, vira um heap com as 'limite' melhores.
+    
+    ORDEM: a mesma do resultado final (Perda_pct, N_ancora, Num_comp e, no
+    empate, a ordem em que o motor gerou) — as combinações guardadas são
+    exatamente as primeiras 'limite' linhas da ordenação completa.
+    
+    MÉTODO: heap de máximo (chaves negadas): a raiz é a pior guardada e só
+    sai quando chega uma melhor. Memória O(limite) em vez de O(total).
+    """
+    
+    def __init__(self, limite: int | None):
+        self.limite = limite
+        self.total = 0          # combinações recebidas (guardadas ou não)
+        self.itens = []         # modo normal: todas, na ordem de geração
+        self.heap = None        # modo top-K: [(chave negada, combinação)]
+    
+    @staticmethod
+    def _chave(r: dict, seq: int) -> tuple:
+        return (-r['Perda_pct'], -r['N_ancora'], -r['Num_comp'], -seq)
+    
+    @property
+    def truncado(self) -> bool:
+        return self.heap is not None
+    
+    def adicionar(self, r: dict) -> None:
+        seq = self.total
+        self.total += 1
+        
+        if self.heap is None:
+            self.itens.append(r)
+            if self.limite is None or len(self.itens) <= self.limite:
+                return
+            # Passou do limite: troca a lista pelo heap das 'limite' melhores
+            self.heap = [(self._chave(x, i), x) for i, x in enumerate(self.itens)]
+            self.itens = []
+            heapq.heapify(self.heap)
+            heapq.heappop(self.heap)
+            return
+        
+        item = (self._chave(r, seq), r)
+        if item[0] > self.heap[0][0]:
+            heapq.heapreplace(self.heap, item)
+    
+    def resultados(self) -> list[dict]:
+        """Combinações guardadas (no modo top-K, já na ordem final)."""
+        if self.heap is None:
+            return self.itens
+        return [r for _, r in sorted(self.heap, key=lambda item: item[0], reverse=True)]
+
+
+class BufferResultados:
+    """
+    Destino de combinações com memória limitada: derrama em disco.
+    
+    Guarda até 'limite_memoria' combinações em memória; ao encher, ordena o
+    lote e o grava num arquivo temporário binário (uma "corrida"). Ao final,
+    ordenados() intercala as corridas (heapq.merge, k vias) e entrega TODAS
+    as combinações na ordem do resultado final — Perda_pct, N_ancora,
+    Num_comp e, no empate, a ordem de geração (a mesma do sort do pandas).
+    
+    USO:
+        with BufferResultados() as buffer:
+            for r in gerador:
+                buffer.adicionar(r)
+            for r in buffer.ordenados():      # pode ser percorrido de novo
+                ...
+    
+    ENTRADA:
+        limite_memoria: combinações em memória antes de derramar
+                        (None = limite_combinacoes_orcamento(config); sem
+                        orçamento, nunca derrama)
+        pasta: onde criar as corridas (None = pasta temporária do sistema)
+        config: regras da consulta, para o orçamento (None = ConfigPlano.padrao())
+    
+    NOTA: mesma interface de ColetorTopK (total, truncado, resultados()),
+          para servir de destino em buscar_nas_larguras. Os arquivos
+          (pickle em blocos de TAMANHO_BLOCO_CORRIDA) são apagados em fechar().
+    """
+    
+    def __init__(self, limite_memoria: int | None = None, pasta: str | None = None,
+                 config: ConfigPlano | None = None):
+        self.limite_memoria = (limite_memoria if limite_memoria is not None
+                               else limite_combinacoes_orcamento(config))
+        self.pasta = pasta
+        self.total = 0
+        self.itens = []         # [(chave, combinação)] ainda em memória
+        self.corridas = []      # caminhos das corridas gravadas
+    
+    @staticmethod
+    def _chave(item: tuple) -> tuple:
+        return item[0]
+    
+    @property
+    def derramado(self) -> bool:
+        return bool(self.corridas)
+    
+    truncado = derramado
+    
+    def __len__(self) -> int:
+        return self.total
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.fechar()
+    
+    def adicionar(self, r: dict) -> None:
+        self.itens.append(((r['Perda_pct'], r['N_ancora'], r['Num_comp'], self.total), r))
+        self.total += 1
+        if self.limite_memoria is not None and len(self.itens) >= self.limite_memoria:
+            self._gravar_corrida()
+    
+    def _gravar_corrida(self) -> None:
+        """Ordena o que está em memória e grava como uma nova corrida."""
+        self.itens.sort(key=self._chave)
+        descritor, caminho = tempfile.mkstemp(prefix='plano_corte_', suffix='.corrida', dir=self.pasta)
+        self.corridas.append(caminho)
+        with open(descritor, 'wb') as f:
+            for i in range(0, len(self.itens), TAMANHO_BLOCO_CORRIDA):
+                pickle.dump(self.itens[i:i + TAMANHO_BLOCO_CORRIDA], f, pickle.HIGHEST_PROTOCOL)
+        self.itens = []
+    
+    @staticmethod
+    def _ler_corrida(caminho: str) -> Iterator[tuple]:
+        with open(caminho, 'rb') as f:
+            while True:
+                try:
+                    bloco = pickle.load(f)
+                except EOFError:
+                    return
+                yield from bloco
+    
+    def ordenados(self) -> Iterator[dict]:
+        """
+        Todas as combinações, na ordem final. Depois de derramar, o que
+        sobrou em memória também vai para uma corrida: durante a leitura
+        só fica em memória um bloco por corrida.
+        """
+        if self.derramado and self.itens:
+            self._gravar_corrida()
+        self.itens.sort(key=self._chave)
+        fontes = [self._ler_corrida(c) for c in self.corridas] + [iter(self.itens)]
+        for _, r in heapq.merge(*fontes, key=self._chave):
+            yield r
+    
+    def resultados(self) -> list[dict]:
+        """
+        Para o DataFrame: todas as combinações se couberam em memória, ou as
+        'limite_memoria' melhores se derramou (as demais ficam em disco).
+        """
+        if not self.derramado:
+            return [r for _, r in self.itens]
+        return list(islice(self.ordenados(), self.limite_memoria))
+    
+    def fechar(self) -> None:
+        """Apaga as corridas e libera a memória."""
+        for caminho in self.corridas:
+            try:
+                os.remove(caminho)
+            except OSError:
+                pass
+        self.corridas = []
+        self.itens = []
+
+
+def buscar_nas_larguras(
+    dev_ancora: float,
+    matriz_ancora: str,
+    matrizes_comp: list[str],
+    devs_comp: list[float],
+    espessura: float,
+    limite_cortes: int | None = None,
+    verbose: bool = True,
+    cancelar: threading.Event | None = None,
+    parcial=None,
+    contadores: dict | None = None,
+    destino: BufferResultados | None = None,
+    config: ConfigPlano | None = None
+) -> tuple[pd.DataFrame, int]:
+    """
+    Tenta as larguras de config.larguras em ordem, com as complementares já
+    separadas (usado por encontrar_combinacoes e pelo MotorPlanejamento,
+    que mantém as complementares indexadas em memória).
+    
+    ENTRADA:
+        matrizes_comp / devs_comp: complementares, maior desenvolvimento primeiro
+        cancelar: ver gerar_combinacoes_para_largura
+        parcial: função opcional parcial(largura, lote) chamada a cada
+                 TAMANHO_LOTE_PARCIAL combinações encontradas (não ordenadas),
+                 para mostrar resultados antes do fim da busca
+        contadores: ver gerar_combinacoes_para_largura (uma entrada por largura tentada)
+        destino: BufferResultados opcional (config.modo_orcamento = 'disco'); recebe
+                 todas as combinações da largura usada — as larguras
+                 anteriores não geraram nenhuma
+        config: regras da consulta (None = ConfigPlano.padrao())
+    
+    SAÍDA:
+        (DataFrame com resultados, largura_usada) — (DataFrame vazio, 0) se nada;
+        nesse caso df_res.attrs['proximas'] traz as combinações mais próximas
+        da janela (combinacoes_proximas)
+    
+    NOTA: se a largura gerar mais combinações do que cabem no orçamento de
+          memória (limite_combinacoes_orcamento(config)), o DataFrame fica só com as
+          melhores (ColetorTopK, ou o 'destino', que derrama o resto em
+          disco) e df_res.attrs['orcamento'] registra
+          {'encontradas', 'mantidas', 'orcamento_mb', 'modo'}.
+    """
+    log = print if verbose else (lambda *args, **kwargs: None)
+    config = config or ConfigPlano.padrao()
+    
     # ── Tenta cada largura em ordem ──
-    for largura in LARGURAS_BOBINA:
-        print(f"  → Tentando largura {largura} mm ...", end=' ')
+    for largura in config.larguras:
+        log(f"  → Tentando largura {largura} mm ...", end=' ')
         
         # Verifica se âncora cabe ao menos uma vez
         if dev_ancora > largura:
-            print(f"âncora ({dev_ancora:.1f}mm) não cabe. Pulando.")
+            log(f"âncora ({dev_ancora:.1f}mm) não cabe. Pulando.")
             continue
         
         # Chama motor de busca
-        resultados = buscar_combinacoes_para_largura(
+        gerador = gerar_combinacoes_para_largura(
             dev_ancora=dev_ancora,
             matriz_ancora=matriz_ancora,
             matrizes_complementares=matrizes_comp,
             devs_complementares=devs_comp,
             largura_bobina=largura,
-            max_complementares=MAX_COMP_NA_COMBO,
+            max_complementares=config.max_complementares,
             espessura=espessura,
-            limite_cortes=limite_cortes
+            limite_cortes=limite_cortes,
+            cancelar=cancelar,
+            contadores=contadores,
+            config=config
         )
         
+        coletor = destino if destino is not None else ColetorTopK(limite_combinacoes_orcamento(config))
+        if parcial is None:
+            for r in gerador:
+                coletor.adicionar(r)
+        else:
+            lote = []
+            for r in gerador:
+                coletor.adicionar(r)
+                lote.append(r)
+                if len(lote) == TAMANHO_LOTE_PARCIAL:
+                    parcial(largura, lote)
+                    lote = []
+            if lote:
+                parcial(largura, lote)
+        resultados = coletor.resultados()
+        
         # Se encontrou resultados, para aqui
         if resultados:
-            print(f"{len(resultados)} combinações encontradas. ✓")
+            log(f"{coletor.total} combinações encontradas. ✓")
+            if coletor.truncado:
+                log(f"  ⚠ Orçamento de memória ({config.orcamento_memoria_mb} MB): "
+                    f"mantidas as {len(resultados)} melhores de {coletor.total}"
+                    + (f" (todas em disco, {len(coletor.corridas)} corridas)." if destino is not None else "."))
             
             # Converte para DataFrame e ordena
             df_res = (
@@ -506,13 +1240,156 @@ def encontrar_combinacoes(
                 .sort_values(['Perda_pct', 'N_ancora', 'Num_comp'])
                 .reset_index(drop=True)
             )
+            if coletor.truncado:
+                df_res.attrs['orcamento'] = {'encontradas': coletor.total,
+                                             'mantidas': len(resultados),
+                                             'orcamento_mb': config.orcamento_memoria_mb,
+                                             'modo': 'disco' if destino is not None else 'top_k'}
             
             return df_res, largura
         else:
-            print("nenhuma combinação válida.")
+            log("nenhuma combinação válida.")
+    
+    # Se chegou aqui, nenhuma largura teve resultado: guarda as mais próximas da janela
+    df_vazio = pd.DataFrame()
+    df_vazio.attrs['proximas'] = combinacoes_proximas(
+        dev_ancora, matriz_ancora, matrizes_comp, devs_comp, limite_cortes, config=config)
+    return df_vazio, 0
+
+
+def combinacoes_proximas(
+    dev_ancora: float,
+    matriz_ancora: str,
+    matrizes_comp: list[str],
+    devs_comp: list[float],
+    limite_cortes: int | None = None,
+    quantidade: int = MAX_SUGESTOES_PROXIMAS,
+    config: ConfigPlano | None = None
+) -> pd.DataFrame:
+    """
+    Combinações mais próximas da janela de perda, dos dois lados: perda um
+    pouco ACIMA do máximo e perda um pouco ABAIXO do mínimo, em todas as
+    larguras de config.larguras. Usada quando nenhuma combinação cai na
+    janela, para o planejador decidir uma exceção sem refazer a busca com
+    as constantes ampliadas.
+    
+    NOTA:
+        Combinações dentro da janela com refilo abaixo do mínimo já voltam
+        do motor como "Fora da regra" (a busca não fica vazia); por isso o
+        lado de baixo é medido só a partir do mínimo da janela.
+    
+    MÉTODO:
+        As somas das complementares são enumeradas uma vez por largura
+        (enumerar_somas_complementares) e ficam ordenadas. Para cada N de
+        cortes da âncora, a janela vira um intervalo de somas; os vizinhos
+        mais próximos de cada lado são os poucos elementos logo antes e logo
+        depois do intervalo (searchsorted), conferidos com a conta do motor.
+        Um heap limitado a 'quantidade' por lado guarda os melhores de todos
+        os N e larguras.
+    
+    ENTRADA:
+        como buscar_nas_larguras; quantidade: combinações por lado
+    
+    SAÍDA:
+        DataFrame no formato do motor (Combinacao, N_ancora, Num_comp,
+        Total_cortes, Detalhes, Soma_cortes_mm, Perda_mm, Perda_pct,
+        Largura_bobina, Status) + Lado ('acima' / 'abaixo'), Desvio_mm e
+        Desvio_pct (distância até a borda da janela, em mm e em pontos
+        percentuais da largura), ordenado por lado e desvio
+    """
+    config = config or ConfigPlano.padrao()
+    if not quantidade:
+        return pd.DataFrame()
+    
+    devs = np.array(devs_comp, dtype=float)
+    folga = 2 * quantidade                  # vizinhos conferidos em volta de cada ponta
+    lados = {'acima': [], 'abaixo': []}     # heaps de (−desvio_pct, −seq, candidato): pior no topo
+    somas_por_largura = {}
+    seq = 0
+    
+    for largura in config.larguras:
+        if dev_ancora > largura:
+            continue
+        perda_min_mm, perda_max_mm = config.janela_mm(largura)
+        somas = somas_por_largura[largura] = enumerar_somas_complementares(
+            devs, largura, config.max_complementares)
+        todas = np.arange(len(somas['soma']))
+        cortes_comp = somas['cortes'].sum(axis=1)
+        
+        for n_ancora in range(1, int(largura / dev_ancora) + 1):
+            if limite_cortes is not None and n_ancora > limite_cortes:
+                break
+            soma_ancora = dev_ancora * n_ancora
+            
+            # Linhas das somas que respeitam o limite de cortes (ordenadas pela soma)
+            linhas = todas if limite_cortes is None else todas[cortes_comp <= limite_cortes - n_ancora]
+            soma_comp = somas['soma'][linhas]
+            ini = np.searchsorted(soma_comp, largura - soma_ancora - perda_max_mm, 'left')
+            fim = np.searchsorted(soma_comp, largura - soma_ancora - perda_min_mm, 'right')
+            vizinhos = np.unique(np.r_[linhas[max(0, ini - folga):ini + folga],
+                                       linhas[max(0, fim - folga):fim + folga]])
+            
+            # -1 = só a âncora
+            for linha in [-1, *vizinhos.tolist()]:
+                if linha < 0:
+                    perda = largura - soma_ancora
+                else:
+                    perda = largura - (soma_ancora + somas['soma'][linha])
+                if perda > perda_max_mm:
+                    lado, desvio = 'acima', perda - perda_max_mm
+                elif 0 <= perda < perda_min_mm:
+                    lado, desvio = 'abaixo', perda_min_mm - perda
+                else:
+                    continue
+                
+                seq += 1
+                item = (-desvio / largura, -seq, (largura, n_ancora, linha, perda, desvio))
+                heap = lados[lado]
+                if len(heap) < quantidade:
+                    heapq.heappush(heap, item)
+                elif item > heap[0]:
+                    heapq.heapreplace(heap, item)
+    
+    # ── Monta as combinações no formato do motor ──
+    resultados = []
+    for lado, heap in lados.items():
+        for _, _, (largura, n_ancora, linha, perda, desvio) in heap:
+            somas = somas_por_largura[largura]
+            soma_ancora = dev_ancora * n_ancora
+            detalhes = [{'Matriz': matriz_ancora, 'Desenvolvimento_mm': dev_ancora,
+                         'N_cortes': n_ancora, 'Subtotal_mm': round(soma_ancora, 3)}]
+            if linha >= 0:
+                detalhes += [{'Matriz': matrizes_comp[i], 'Desenvolvimento_mm': devs_comp[i],
+                              'N_cortes': int(n), 'Subtotal_mm': round(devs_comp[i] * n, 3)}
+                             for i, n in zip(somas['membros'][linha], somas['cortes'][linha]) if i >= 0]
+            if lado == 'acima':
+                status = f"L{largura}: perda +{desvio / largura * 100:.4f} p.p. acima"
+            else:
+                status = f"L{largura}: perda −{desvio / largura * 100:.4f} p.p. abaixo"
+            
+            resultados.append({
+                'Combinacao': ' + '.join(f"{d['Matriz']}(x{d['N_cortes']})" for d in detalhes),
+                'N_ancora': n_ancora,
+                'Num_comp': len(detalhes) - 1,
+                'Total_cortes': sum(d['N_cortes'] for d in detalhes),
+                'Detalhes': detalhes,
+                'Soma_cortes_mm': round(largura - perda, 3),
+                'Perda_mm': round(perda, 3),
+                'Perda_pct': round(perda / largura * 100, 4),
+                'Largura_bobina': largura,
+                'Status': status,
+                'Lado': lado,
+                'Desvio_mm': round(desvio, 3),
+                'Desvio_pct': round(desvio / largura * 100, 4),
+            })
     
-    # Se chegou aqui, nenhuma largura teve resultado
-    return pd.DataFrame(), 0
+    if not resultados:
+        return pd.DataFrame()
+    return (
+        pd.DataFrame(resultados)
+        .sort_values(['Lado', 'Desvio_pct', 'Total_cortes'])
+        .reset_index(drop=True)
+    )
 
 
 # ================================================================================
@@ -551,7 +1428,7 @@ def calcular_kg_matriz(
     
     ENTRADA:
         peso_medio_bobina: peso médio calculado (kg/bobina)
-        largura_bobina: 1000, 1200 ou 1500 mm
+        largura_bobina: largura da bobina em mm
         n_cortes: quantos cortes desta matriz
         desenvolvimento: largura necessária em mm
         qtd_bobinas: quantidade de bobinas no lote
@@ -559,6 +1436,9 @@ def calcular_kg_matriz(
     SAÍDA:
         Quilos de aço para esta matriz
     
+    NOTA: n_cortes e desenvolvimento também podem ser colunas (Series/arrays)
+          — a conta é feita elemento a elemento (ver anexar_kg).
+    
     EXEMPLO:
         peso_medio = 12.000 kg
         largura = 1.200 mm
@@ -606,31 +1486,104 @@ def calcular_kg_combinacao(
     return round(total_kg, 2)
 
 
-# ================================================================================
-# BLOCO 6: VALIDAÇÃO DE RESULTADOS
-# ================================================================================
+COLUNAS_TABELA_DETALHES = ['Combo', 'Papel', 'Matriz', 'Desenvolvimento_mm', 'N_cortes', 'Subtotal_mm']
 
-def validar_resultado(df_res: pd.DataFrame, espessura: float) -> dict:
+
+def explodir_detalhes(df_res: pd.DataFrame) -> pd.DataFrame:
     """
-    Valida o resultado e retorna estatísticas.
+    Transforma a coluna aninhada 'Detalhes' em uma tabela plana.
     
     ENTRADA:
-        df_res: DataFrame com combinações encontradas
-        espessura: espessura usada (para determinar refilo)
+        df_res: DataFrame de combinações (saída de encontrar_combinacoes)
     
     SAÍDA:
-        Dicionário com estatísticas:
-        {
-            'total': 104,
-            'validas': 102,
-            'fora_regra': 2,
-            'refilo_min': 10
-        }
+        DataFrame com uma linha por matriz de cada combinação:
+        Combo (# da combinação, começando em 1), Papel (ÂNCORA/Complementar),
+        Matriz, Desenvolvimento_mm, N_cortes, Subtotal_mm
     """
-    refilo_min = REFILO_MIN_ATE_3MM if espessura <= 3.0 else REFILO_MIN_ACIMA_3MM
+    if df_res.empty:
+        return pd.DataFrame(columns=COLUNAS_TABELA_DETALHES)
     
-    validas = len(df_res[df_res['Status'] == '✓ Válida'])
-    fora_regra = len(df_res[df_res['Status'] == 'Fora da regra'])
+    detalhes = df_res['Detalhes'].reset_index(drop=True).explode()
+    df_det = pd.DataFrame(detalhes.tolist(), columns=COLUNAS_TABELA_DETALHES[2:])
+    df_det.insert(0, 'Combo', detalhes.index.to_numpy() + 1)
+    
+    # Primeira matriz de cada combinação é sempre a âncora
+    primeira = df_det.groupby('Combo').cumcount() == 0
+    df_det.insert(1, 'Papel', primeira.map({True: 'ÂNCORA', False: 'Complementar'}))
+    
+    return df_det
+
+
+def anexar_kg(
+    df_res: pd.DataFrame,
+    largura_bobina: int,
+    qtd_bobinas: int,
+    peso_total: float
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Calcula o KG de TODAS as matrizes e combinações de uma vez (vetorizado).
+    
+    Feito uma única vez após a busca; terminal, Excel e exportações
+    colunares reaproveitam as colunas 'Qtd_KG' em vez de refazer a conta
+    linha a linha.
+    
+    FÓRMULA (aplicada sobre colunas inteiras):
+        KG_i     = (Peso_médio / Largura) × N_cortes_i × Desenvolvimento_i × Qtd_bobinas
+        KG_combo = Σ KG_i  (arredondado a 2 casas, como calcular_kg_combinacao)
+    
+    ENTRADA:
+        df_res: DataFrame de combinações
+        largura_bobina: largura usada em mm
+        qtd_bobinas: quantidade de bobinas
+        peso_total: peso TOTAL do lote em kg
+    
+    SAÍDA:
+        (df_res com coluna 'Qtd_KG', df_detalhes de explodir_detalhes + 'Qtd_KG')
+    """
+    peso_medio = calcular_peso_medio_bobina(peso_total, qtd_bobinas)
+    df_det = explodir_detalhes(df_res)
+    
+    if df_res.empty:
+        df_det['Qtd_KG'] = pd.Series(dtype=float)
+        return df_res, df_det
+    
+    df_det['Qtd_KG'] = calcular_kg_matriz(
+        peso_medio, largura_bobina, df_det['N_cortes'], df_det['Desenvolvimento_mm'], qtd_bobinas
+    )
+    
+    kg_combo = df_det.groupby('Combo', sort=True)['Qtd_KG'].sum().round(2).to_numpy()
+    df_res = df_res.assign(Qtd_KG=kg_combo)
+    
+    return df_res, df_det
+
+
+# ================================================================================
+# BLOCO 6: VALIDAÇÃO DE RESULTADOS
+# ================================================================================
+
+def validar_resultado(df_res: pd.DataFrame, espessura: float, config: ConfigPlano | None = None) -> dict:
+    """
+    Valida o resultado e retorna estatísticas.
+    
+    ENTRADA:
+        df_res: DataFrame com combinações encontradas
+        espessura: espessura usada (para determinar refilo)
+        config: regras da consulta (None = ConfigPlano.padrao())
+    
+    SAÍDA:
+        Dicionário com estatísticas:
+        {
+            'total': 104,
+            'validas': 102,
+            'fora_regra': 2,
+            'refilo_min': 10
+        }
+    """
+    refilo_min = (config or ConfigPlano.padrao()).refilo_min(espessura)
+    
+    validas = len(df_res[df_res['Status'] == '✓ Válida'])
+    fora_regra = len(df_res[df_res['Status'] == 'Fora da regra'])
     
     return {
         'total': len(df_res),
@@ -641,20 +1594,136 @@ def validar_resultado(df_res: pd.DataFrame, espessura: float) -> dict:
 
 
 # ================================================================================
-# BLOCO 7: INTERFACE COM USUÁRIO (CLI)
+# BLOCO 7: INTERFACE COM USUÁRIO (CLI E PAGINADOR)
 # ================================================================================
 
+def formatar_linhas_tabela(df_res: pd.DataFrame) -> tuple[str, pd.Series]:
+    """
+    Formata a tabela de combinações de uma vez (operações vetorizadas de
+    texto do pandas), em vez de um format/print por linha.
+    
+    SAÍDA:
+        (cabeçalho com 2 linhas, Series de linhas com o mesmo índice de df_res)
+    """
+    # Coluna de KG aparece quando já calculada por anexar_kg
+    tem_kg = 'Qtd_KG' in df_res.columns
+    fmt = "  {:<5} {:<48} {:<12} {:<12} {:<12} " + ("{:>14}  " if tem_kg else "{}") + "{}"
+    cabecalho = (
+        fmt.format('#', 'Combinação', 'Soma (mm)', 'Perda (mm)', 'Perda (%)',
+                   'Qtd. KG' if tem_kg else '', 'Status') + "\n" +
+        fmt.format('-'*5, '-'*48, '-'*12, '-'*12, '-'*12, '-'*14 if tem_kg else '', '-'*16) + "\n"
+    )
+    
+    numero = pd.Series(range(1, len(df_res) + 1), index=df_res.index).astype(str)
+    linhas = (
+        "  " + numero.str.ljust(5) +
+        " " + df_res['Combinacao'].str.slice(0, 47).str.ljust(48) +
+        " " + df_res['Soma_cortes_mm'].map('{:.2f}'.format).str.ljust(12) +
+        " " + df_res['Perda_mm'].map('{:.3f}'.format).str.ljust(12) +
+        " " + (df_res['Perda_pct'].map('{:.4f}'.format) + "%").str.ljust(12) +
+        " "
+    )
+    if tem_kg:
+        linhas = linhas + df_res['Qtd_KG'].map('{:,.2f}'.format).str.rjust(14) + "  "
+    
+    return cabecalho, linhas + df_res['Status'] + "\n"
+
+
+AJUDA_PAGINADOR = (
+    "  [Enter] próxima página | v válidas | r fora da regra | c <n> nº complementares"
+    " | k <n> máx. cortes | t todas | q sair > "
+)
+
+
+def paginar_tabela(
+    df_res: pd.DataFrame,
+    cabecalho: str,
+    linhas: pd.Series,
+    inicio: int = 0,
+    tamanho_pagina: int = LINHAS_POR_PAGINA
+) -> None:
+    """
+    Paginador da tabela já formatada, com filtros que não refazem a busca
+    nem a formatação (só trocam a máscara sobre as linhas prontas).
+    
+    COMANDOS:
+        Enter      próxima página (na última página: sai)
+        v / r      só válidas / só fora da regra
+        c <n>      só combinações com n complementares
+        k <n>      só combinações com até n cortes
+        t          remove os filtros
+        q          sai
+    
+    ENTRADA:
+        inicio: quantas linhas (sem filtro) já foram mostradas
+    """
+    filtros = {}
+    visiveis = linhas
+    posicao = inicio
+    
+    while True:
+        entrada = input(AJUDA_PAGINADOR).strip().lower()
+        cmd, _, arg = entrada.partition(' ')
+        
+        try:
+            if cmd == '':
+                if posicao >= len(visiveis):
+                    return
+            elif cmd == 'q':
+                return
+            elif cmd == 'v':
+                filtros['status'] = df_res['Status'] == "✓ Válida"
+            elif cmd == 'r':
+                filtros['status'] = df_res['Status'] == "Fora da regra"
+            elif cmd == 'c':
+                filtros['comp'] = df_res['Num_comp'] == int(arg)
+            elif cmd == 'k':
+                filtros['cortes'] = df_res['Total_cortes'] <= int(arg)
+            elif cmd == 't':
+                filtros.clear()
+            else:
+                print("  ⚠ Comando desconhecido.")
+                continue
+        except ValueError:
+            print("  ⚠ Informe um número (ex.: c 1, k 8).")
+            continue
+        
+        # Filtro novo: troca só a máscara e volta ao início
+        if cmd != '':
+            mascara = pd.Series(True, index=df_res.index)
+            for f in filtros.values():
+                mascara &= f
+            visiveis = linhas[mascara]
+            posicao = 0
+            sys.stdout.write(f"\n  {len(visiveis)} combinações com o filtro\n" + cabecalho)
+            if visiveis.empty:
+                sys.stdout.write("  (nenhuma)\n")
+                continue
+        
+        pagina = visiveis.iloc[posicao:posicao + tamanho_pagina]
+        posicao += len(pagina)
+        sys.stdout.write("".join(pagina) + f"  ── {posicao} de {len(visiveis)} ──\n")
+        sys.stdout.flush()
+
+
 def exibir_terminal(
     df_res: pd.DataFrame,
     largura: int,
     ancora: str,
     espessura: float,
     tipo: str,
-    limite_cortes: int | None = None
+    limite_cortes: int | None = None,
+    max_linhas: int | None = LINHAS_POR_PAGINA,
+    paginar: bool = True,
+    config: ConfigPlano | None = None
 ) -> None:
     """
     Exibe resultados formatados no terminal.
     
+    A tabela é montada inteira em memória (formatar_linhas_tabela) e enviada
+    com uma única escrita no stdout; com muitas combinações só a primeira
+    página é mostrada e o restante fica no paginador (com filtros).
+    
     ENTRADA:
         df_res: DataFrame com combinações
         largura: largura da bobina usada
@@ -662,78 +1731,214 @@ def exibir_terminal(
         espessura: espessura em mm
         tipo: tipo de material
         limite_cortes: limite opcional de cortes
+        max_linhas: linhas da primeira página (None = todas)
+        paginar: False = não abre o paginador (mostra só a primeira página)
+        config: regras usadas na busca (None = ConfigPlano.padrao())
     """
+    config = config or ConfigPlano.padrao()
     sep = "=" * 90
-    print(f"\n{sep}")
-    print("  PLANO DE CORTE — COMBINAÇÕES VÁLIDAS")
-    print(sep)
-    print(f"  Âncora         : {ancora}")
-    print(f"  Espessura      : {espessura} mm")
-    print(f"  Tipo material  : {tipo}")
-    print(f"  Largura bobina : {largura} mm")
+    saida = [
+        f"\n{sep}",
+        "  PLANO DE CORTE — COMBINAÇÕES VÁLIDAS",
+        sep,
+        f"  Âncora         : {ancora}",
+        f"  Espessura      : {espessura} mm",
+        f"  Tipo material  : {tipo}",
+        f"  Largura bobina : {largura} mm",
+    ]
     
     # Mostra janela de perda %
-    perda_min_mm = largura * PERDA_MIN_PCT / 100
-    perda_max_mm = largura * PERDA_MAX_PCT / 100
-    print(f"  Janela de perda: {PERDA_MIN_PCT}% – {PERDA_MAX_PCT}%  "
-          f"|  {perda_min_mm:.2f} mm – {perda_max_mm:.2f} mm")
+    # (sem largura usada — nenhuma combinação — a janela só em %)
+    perda_min_mm, perda_max_mm = config.janela_mm(largura)
+    saida.append(f"  Janela de perda: {config.perda_min_pct}% – {config.perda_max_pct}%"
+                 + (f"  |  {perda_min_mm:.2f} mm – {perda_max_mm:.2f} mm" if largura else ""))
     
     # Mostra refilo mínimo
-    refilo_min = REFILO_MIN_ATE_3MM if espessura <= 3.0 else REFILO_MIN_ACIMA_3MM
-    simbolo = '≤' if espessura <= 3.0 else '>'
-    print(f"  Refilo mínimo  : {refilo_min} mm  (regra para esp {simbolo} 3.0 mm)")
+    refilo_min = config.refilo_min(espessura)
+    simbolo = '≤' if espessura <= config.espessura_limite_refilo else '>'
+    saida.append(f"  Refilo mínimo  : {refilo_min} mm  "
+                 f"(regra para esp {simbolo} {config.espessura_limite_refilo} mm)")
     
     # Mostra limite de cortes se informado
     if limite_cortes is not None:
-        print(f"  Limite cortes  : {limite_cortes} cortes (soma total)")
+        saida.append(f"  Limite cortes  : {limite_cortes} cortes (soma total)")
     
     # Se não encontrou nada
     if df_res.empty:
-        print(f"\n  ⚠  Nenhuma combinação válida encontrada.")
-        print(f"     Sugestão: amplie os parâmetros ou use outra âncora.")
-        print(sep)
+        saida.append("\n  ⚠  Nenhuma combinação válida encontrada.")
+        proximas = df_res.attrs.get('proximas')
+        if proximas is None or proximas.empty:
+            saida.append("     Sugestão: amplie os parâmetros ou use outra âncora.")
+        else:
+            # Mais próximas da janela, dos dois lados (para decidir uma exceção)
+            saida.append("     Combinações mais próximas da janela (fora dela):\n")
+            cabecalho, linhas = formatar_linhas_tabela(proximas)
+            saida.append(cabecalho + "".join(linhas).rstrip("\n"))
+        saida.append(sep)
+        sys.stdout.write("\n".join(saida) + "\n")
         return
     
     # Estatísticas
-    stats = validar_resultado(df_res, espessura)
-    print(f"  Combinações    : {stats['total']} ({stats['validas']} válidas + {stats['fora_regra']} fora da regra)\n")
-    
-    # Tabela
-    fmt = "  {:<5} {:<48} {:<12} {:<12} {:<12} {}"
-    print(fmt.format('#', 'Combinação', 'Soma (mm)', 'Perda (mm)', 'Perda (%)', 'Status'))
-    print(fmt.format('-'*5, '-'*48, '-'*12, '-'*12, '-'*12, '-'*16))
-    
-    for i, r in df_res.iterrows():
-        print(fmt.format(
-            i + 1,
-            r['Combinacao'][:47],
-            f"{r['Soma_cortes_mm']:.2f}",
-            f"{r['Perda_mm']:.3f}",
-            f"{r['Perda_pct']:.4f}%",
-            r['Status']
-        ))
+    stats = validar_resultado(df_res, espessura, config)
+    saida.append(f"  Combinações    : {stats['total']} ({stats['validas']} válidas + {stats['fora_regra']} fora da regra)\n")
+    
+    # Tabela: uma única escrita com a primeira página
+    cabecalho, linhas = formatar_linhas_tabela(df_res)
+    mostradas = len(linhas) if max_linhas is None else min(max_linhas, len(linhas))
+    restantes = len(linhas) - mostradas
+    
+    texto = "\n".join(saida) + "\n" + cabecalho + "".join(linhas.iloc[:mostradas])
+    if restantes:
+        texto += f"  ... mais {restantes} combinações\n"
+    sys.stdout.write(texto)
+    sys.stdout.flush()
+    
+    if restantes and paginar:
+        paginar_tabela(df_res, cabecalho, linhas, inicio=mostradas,
+                       tamanho_pagina=max_linhas or LINHAS_POR_PAGINA)
     
     print(sep)
 
 
-def menu_usuario(df: pd.DataFrame) -> tuple[float, str, str, int | None, int, float]:
+def exibir_contadores(contadores: dict) -> None:
+    """
+    Mostra os contadores do motor (--stats): uma linha por largura tentada
+    e, para cada largura, a distribuição por N de cortes da âncora.
+    
+    ENTRADA:
+        contadores: {largura: novos_contadores()} preenchido pela busca
+    """
+    if not contadores:
+        print("  (sem contadores: nenhuma largura foi pesquisada)")
+        return
+    
+    saida = ["", "  CONTADORES DO MOTOR",
+             f"  {'Largura':>7} {'Candidatos':>11} {'Estouro L':>10} {'Estouro lim':>11} {'Fora jan.':>10} "
+             f"{'Válidas':>8} {'Fora regra':>10} {'Grupos':>8} │ {'âncora':>7} {'comb.':>7} "
+             f"{'grade':>7} {'montag.':>7} {'total ms':>8}"]
+    for largura, c in contadores.items():
+        t = {k: v * 1000 for k, v in c['tempos_s'].items()}
+        saida.append(
+            f"  {largura:>7} {c['candidatos']:>11,} {c['estouro_largura']:>10,} {c['estouro_limite']:>11,} "
+            f"{c['fora_janela']:>10,} {c['validas']:>8,} {c['fora_regra']:>10,} {c['grupos_matrizes']:>8,} │ "
+            f"{t['ancora']:>7.1f} {t['combinacoes']:>7.1f} {t['grade']:>7.1f} {t['montagem']:>7.1f} {t['total']:>8.1f}"
+        )
+    
+    for largura, c in contadores.items():
+        partes = [f"N={n}: {p['candidatos']:,} cand. / {p['validas']} ✓ / {p['fora_regra']} fora"
+                  for n, p in sorted(c['por_n_ancora'].items()) if p['candidatos']]
+        if partes:
+            saida.append(f"\n  Por N da âncora ({largura} mm):")
+            saida += [f"    {parte}" for parte in partes]
+    
+    sys.stdout.write("\n".join(saida) + "\n")
+
+
+def escolher_ancora(indice_ancoras: dict, espessura: float, tipo: str) -> str:
+    """
+    Passo [3] do menu: escolhe a âncora digitando parte do nome, do produto
+    ou o código, em vez de percorrer a lista inteira de matrizes.
+    
+    FLUXO:
+        - Código ou nome exato → escolhido direto
+        - Uma única sugestão  → escolhida direto
+        - Várias             → lista numerada (nº escolhe, texto busca de novo)
+        - ENTER               → lista todas as matrizes (como antes)
+    
+    Com readline disponível (Linux/macOS), TAB completa o nome da matriz.
+    """
+    grupo = indice_ancoras.get((espessura, tipo), {}).get('matrizes', pd.DataFrame())
+    print(f"\n[3] Matriz âncora (esp={espessura} mm / {tipo}): {len(grupo)} matrizes")
+    print("    Digite parte do nome, do produto ou o código. ENTER = listar todas.")
+    
+    completer_anterior = _ativar_autocompletar_ancora(indice_ancoras, espessura, tipo)
+    try:
+        sugestoes = None
+        while True:
+            entrada = input("\n  Âncora: " if sugestoes is None else "\n  Número ou nova busca: ").strip()
+            
+            if sugestoes is not None and entrada.isdigit() and 1 <= int(entrada) <= len(sugestoes):
+                return sugestoes.iloc[int(entrada) - 1]['Matriz']
+            
+            sugestoes = buscar_ancoras(indice_ancoras, espessura, tipo, entrada,
+                                       limite=None if entrada == '' else MAX_SUGESTOES_ANCORA)
+            
+            if sugestoes.empty:
+                print("  ⚠ Nenhuma matriz encontrada. Tente outro trecho.")
+                sugestoes = None
+                continue
+            
+            direto = sugestoes['Criterio'].iloc[0] in ('código', 'nome')
+            if direto or len(sugestoes) == 1:
+                ancora = sugestoes.iloc[0]['Matriz']
+                print(f"  → {ancora}  (dev = {sugestoes.iloc[0]['Dev_mm']:.1f} mm)")
+                return ancora
+            
+            linhas = [
+                f"    {i:3d}. {m:<30s}  dev = {d:6.1f} mm   {c[:20]:<20s} {p[:40]}"
+                for i, (m, d, c, p) in enumerate(
+                    zip(sugestoes['Matriz'], sugestoes['Dev_mm'], sugestoes['Codigo'], sugestoes['Produto']), 1)
+            ]
+            sys.stdout.write("\n".join(linhas) + "\n")
+    finally:
+        _restaurar_autocompletar(completer_anterior)
+
+
+def _ativar_autocompletar_ancora(indice_ancoras: dict, espessura: float, tipo: str):
+    """Liga o TAB do readline para completar nomes de matriz (se houver readline)."""
+    try:
+        import readline
+    except ImportError:
+        return None
+    
+    def completar(texto, estado):
+        if estado == 0:
+            completar.opcoes = buscar_ancoras(indice_ancoras, espessura, tipo, texto)['Matriz'].tolist()
+        return completar.opcoes[estado] if estado < len(completar.opcoes) else None
+    
+    anterior = (readline.get_completer(), readline.get_completer_delims())
+    readline.set_completer(completar)
+    readline.set_completer_delims('')
+    readline.parse_and_bind('tab: complete')
+    return anterior
+
+
+def _restaurar_autocompletar(anterior) -> None:
+    """Desfaz _ativar_autocompletar_ancora."""
+    if anterior is None:
+        return
+    import readline
+    readline.set_completer(anterior[0])
+    readline.set_completer_delims(anterior[1])
+
+
+def menu_usuario(
+    df: pd.DataFrame,
+    indice_ancoras: dict | None = None,
+    config: ConfigPlano | None = None
+) -> tuple[float, str, str, int | None, int, float]:
     """
     Interface CLI: coleta todas as informações do usuário em 6 passos.
     
     PASSOS:
         [1] Escolhe espessura
         [2] Escolhe tipo de material
-        [3] Escolhe matriz âncora
+        [3] Busca a matriz âncora (nome, produto ou código)
         [4] Informa limite de cortes (opcional)
         [5] Informa quantidade de bobinas
         [6] Informa peso total das bobinas
     
+    ENTRADA:
+        indice_ancoras: montar_indice_ancoras(df) já pronto (None = monta aqui)
+        config: regras da consulta, para o cabeçalho (None = ConfigPlano.padrao())
+    
     SAÍDA:
         (espessura, tipo, ancora, limite_cortes, qtd_bobinas, peso_total)
     """
     print("\n" + "=" * 70)
     print("          SISTEMA DE PLANO DE CORTE")
-    print(f"  Larguras testadas: {' → '.join(str(l) for l in LARGURAS_BOBINA)} mm")
+    larguras = (config or ConfigPlano.padrao()).larguras
+    print(f"  Larguras testadas: {' → '.join(str(l) for l in larguras)} mm")
     print("=" * 70)
     
     # ── [1] Espessura ──
@@ -764,19 +1969,10 @@ def menu_usuario(df: pd.DataFrame) -> tuple[float, str, str, int | None, int, fl
         except (ValueError, IndexError):
             print("  ⚠ Inválido. Tente novamente.")
     
-    # ── [3] Matriz âncora ──
-    matrizes = listar_matrizes(df, espessura, tipo)
-    print(f"\n[3] Matrizes disponíveis (esp={espessura} mm / {tipo}):")
-    for i, row in matrizes.iterrows():
-        print(f"    {i+1:3d}. {row['Matriz']:<30s}  dev = {row['Dev_mm']:.1f} mm")
-    
-    while True:
-        try:
-            escolha = int(input("\n  Número da MATRIZ ÂNCORA: "))
-            ancora = matrizes.iloc[escolha - 1]['Matriz']
-            break
-        except (ValueError, IndexError):
-            print("  ⚠ Inválido. Tente novamente.")
+    # ── [3] Matriz âncora (busca por nome, produto ou código) ──
+    if indice_ancoras is None:
+        indice_ancoras = montar_indice_ancoras(df)
+    ancora = escolher_ancora(indice_ancoras, espessura, tipo)
     
     # ── [4] Limite de cortes (opcional) ──
     print(f"\n[4] Limite de cortes por combinação (restrição de máquina)")
@@ -830,9 +2026,161 @@ def menu_usuario(df: pd.DataFrame) -> tuple[float, str, str, int | None, int, fl
 
 
 # ================================================================================
-# BLOCO 8: EXPORTAÇÃO PARA EXCEL
+# BLOCO 8: EXPORTAÇÃO (EXCEL E FORMATOS COLUNARES)
 # ================================================================================
 
+# ── Paleta de cores ──
+COR_AZUL_ESC = "1F4E79"
+COR_AZUL_CLA = "BDD7EE"
+COR_VERDE    = "E2EFDA"
+COR_CINZA    = "F2F2F2"
+COR_BRANCO   = "FFFFFF"
+COR_AMARELO  = "FFF2CC"
+COR_ROXO     = "EDE7F6"
+COR_LARANJA  = "FFE0B2"
+
+# ── Formatos numéricos ──
+FMT_MM  = '#,##0.000'
+FMT_PCT = '0.0000%'
+FMT_KG  = '#,##0.00'
+
+# ── Estilos nomeados usados nas abas ──
+# Cada entrada: nome → (cor_fundo, negrito, cor_texto, alinhamento, formato, quebra)
+ESTILOS_EXCEL = {
+    'param_chave':     (COR_AZUL_CLA, True,  "000000",   "left",   None,    False),
+    'param_valor':     (COR_AZUL_CLA, False, "000000",   "left",   None,    False),
+    'cabecalho':       (COR_AZUL_ESC, True,  COR_BRANCO, "center", None,    False),
+    'verde_centro':    (COR_VERDE,    False, "000000",   "center", None,    False),
+    'verde_texto':     (COR_VERDE,    False, "000000",   "left",   None,    True),
+    'verde_mm':        (COR_VERDE,    False, "000000",   "right",  FMT_MM,  False),
+    'verde_pct':       (COR_VERDE,    False, "000000",   "right",  FMT_PCT, False),
+    'cinza_centro':    (COR_CINZA,    False, "000000",   "center", None,    False),
+    'cinza_texto':     (COR_CINZA,    False, "000000",   "left",   None,    True),
+    'cinza_mm':        (COR_CINZA,    False, "000000",   "right",  FMT_MM,  False),
+    'cinza_pct':       (COR_CINZA,    False, "000000",   "right",  FMT_PCT, False),
+    'ancora_centro':   (COR_AMARELO,  False, "000000",   "center", None,    False),
+    'kg':              (COR_ROXO,     False, "000000",   "right",  FMT_KG,  False),
+    'status_valida':   (COR_VERDE,    False, "000000",   "center", None,    False),
+    'status_fora':     (COR_LARANJA,  False, "000000",   "center", None,    False),
+    'det_id':          (COR_BRANCO,   False, "000000",   "center", None,    False),
+    'ancora_papel':    (COR_AMARELO,  True,  "000000",   "center", None,    False),
+    'ancora_texto':    (COR_AMARELO,  False, "000000",   "left",   None,    False),
+    'ancora_mm':       (COR_AMARELO,  False, "000000",   "right",  FMT_MM,  False),
+    'comp_papel':      (COR_BRANCO,   False, "000000",   "center", None,    False),
+    'comp_texto':      (COR_BRANCO,   False, "000000",   "left",   None,    False),
+    'comp_mm':         (COR_BRANCO,   False, "000000",   "right",  FMT_MM,  False),
+    'comp_centro':     (COR_BRANCO,   False, "000000",   "center", None,    False),
+}
+
+
+def registrar_estilos_excel(wb) -> dict[str, str]:
+    """
+    Registra no workbook o conjunto fixo de estilos nomeados do plano.
+    
+    Os estilos são criados UMA vez por arquivo e as células recebem apenas
+    o nome do estilo (referência), em vez de um Font/PatternFill/Alignment
+    novo por célula — o openpyxl não precisa deduplicar nada no save.
+    
+    ENTRADA:
+        wb: Workbook do openpyxl (normal ou write_only)
+    
+    SAÍDA:
+        Dicionário {chave curta → nome do estilo registrado no workbook}
+        Ex: {'cabecalho': 'pc_cabecalho', 'kg': 'pc_kg', ...}
+    """
+    from openpyxl.styles import Font, PatternFill, Alignment, Border, Side, NamedStyle
+    
+    borda_fina = Side(style='thin', color='CCCCCC')
+    borda = Border(left=borda_fina, right=borda_fina, top=borda_fina, bottom=borda_fina)
+    
+    # ── Títulos: só fonte (sem fundo nem borda) ──
+    titulos = {
+        'titulo':          NamedStyle(name='pc_titulo',
+                                      font=Font(name="Arial", size=13, bold=True, color=COR_AZUL_ESC)),
+        'titulo_detalhes': NamedStyle(name='pc_titulo_detalhes',
+                                      font=Font(name="Arial", size=12, bold=True, color=COR_AZUL_ESC)),
+    }
+    
+    nomes = {}
+    for chave, estilo in titulos.items():
+        wb.add_named_style(estilo)
+        nomes[chave] = estilo.name
+    
+    # ── Células de dados ──
+    for chave, (cor_fundo, negrito, cor_texto, alinhamento, formato, quebra) in ESTILOS_EXCEL.items():
+        estilo = NamedStyle(
+            name=f'pc_{chave}',
+            font=Font(name="Arial", size=9, bold=negrito, color=cor_texto),
+            fill=PatternFill("solid", start_color=cor_fundo, end_color=cor_fundo),
+            alignment=Alignment(horizontal=alinhamento, vertical="center", wrap_text=quebra),
+            border=borda,
+            number_format=formato or 'General',
+        )
+        wb.add_named_style(estilo)
+        nomes[chave] = estilo.name
+    
+    return nomes
+
+
+# ── Colunas das abas (título e largura) ──
+COLUNAS_COMBINACOES = ["#", "Combinação  (Âncora em destaque)", "N Âncora", "Total Cortes",
+                       "Soma Cortes (mm)", "Perda (mm)", "Perda (%)", "Qtd. KG", "Status"]
+LARGURAS_COL_COMBINACOES = [5, 52, 10, 13, 18, 13, 12, 16, 10]
+
+COLUNAS_DETALHES = ["# Combo", "Papel", "Matriz", "Desenvolvimento (mm)",
+                    "N° Cortes", "Subtotal (mm)", "Qtd. KG"]
+LARGURAS_COL_DETALHES = [10, 14, 28, 22, 12, 16, 16]
+
+
+def montar_parametros_excel(
+    largura: int,
+    ancora: str,
+    espessura: float,
+    tipo: str,
+    qtd_bobinas: int,
+    peso_total: float,
+    limite_cortes: int | None,
+    total_combinacoes,
+    config: ConfigPlano | None = None
+) -> list[tuple[str, object]]:
+    """
+    Monta as linhas (chave, valor) do cabeçalho de parâmetros da aba Combinações.
+    
+    ENTRADA:
+        total_combinacoes: número de combinações, ou uma fórmula do Excel
+                           quando o total ainda não é conhecido (exportação
+                           em streaming)
+        config: regras usadas na busca (None = ConfigPlano.padrao())
+    
+    SAÍDA:
+        Lista de tuplas na ordem em que aparecem na planilha
+    """
+    config = config or ConfigPlano.padrao()
+    peso_medio = calcular_peso_medio_bobina(peso_total, qtd_bobinas)
+    refilo_min = config.refilo_min(espessura)
+    limite_esp = config.espessura_limite_refilo
+    regra_refilo = (f"≤ {limite_esp} mm → {config.refilo_min_ate_3mm} mm | "
+                    f"> {limite_esp} mm → {config.refilo_min_acima_3mm} mm")
+    perda_min_mm, perda_max_mm = config.janela_mm(largura)
+    limite_str = str(limite_cortes) if limite_cortes is not None else "Sem limite"
+    
+    return [
+        ("Matriz Âncora", ancora),
+        ("Espessura", f"{espessura} mm"),
+        ("Tipo de Material", tipo),
+        ("Largura da Bobina", f"{largura} mm"),
+        ("Padrões Testados", " → ".join(str(l) for l in config.larguras) + f"  (usado: {largura} mm)"),
+        ("Limite de Cortes", limite_str),
+        ("Refilo Mínimo", f"{refilo_min} mm  (regra: {regra_refilo})"),
+        ("Qtd. de Bobinas", str(qtd_bobinas)),
+        ("Peso Total Lote", f"{peso_total:,.0f} kg  ({peso_total/1000:.1f} ton)"),
+        ("Peso Médio/Bobina", f"{peso_medio:,.0f} kg  ({peso_medio/1000:.2f} ton)"),
+        ("Perda Mínima (%)", f"{config.perda_min_pct}%  ({perda_min_mm:.2f} mm)"),
+        ("Perda Máxima (%)", f"{config.perda_max_pct}%  ({perda_max_mm:.2f} mm)"),
+        ("Total Combinações", total_combinacoes),
+    ]
+
+
 def exportar_excel(
     df_res: pd.DataFrame,
     largura: int,
@@ -842,11 +2190,20 @@ def exportar_excel(
     caminho: str,
     qtd_bobinas: int,
     peso_total: float,
-    limite_cortes: int | None = None
+    limite_cortes: int | None = None,
+    df_detalhes: pd.DataFrame | None = None,
+    progresso=None,
+    config: ConfigPlano | None = None
 ) -> None:
     """
     Exporta resultados para arquivo Excel com 2 abas.
     
+    KG: usa as colunas 'Qtd_KG' de anexar_kg (df_res + df_detalhes). Se não
+    forem passadas, são calculadas aqui, uma única vez.
+    
+    PROGRESSO: callback opcional progresso(linhas_gravadas, total_linhas),
+    chamado a cada INTERVALO_PROGRESSO linhas (ver exportar_em_segundo_plano).
+    
     ABA 1 - Combinações:
         Resumo de cada combinação com:
         - Cabeçalho com parâmetros usados
@@ -867,7 +2224,12 @@ def exportar_excel(
         - Status fora da regra: laranja
     """
     from openpyxl import Workbook
-    from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
+    
+    # ── KG vetorizado (reaproveita se já veio calculado) ──
+    if df_detalhes is None or 'Qtd_KG' not in df_res.columns:
+        df_res, df_detalhes = anexar_kg(df_res, largura, qtd_bobinas, peso_total)
+    
+    total_linhas = len(df_res) + len(df_detalhes)
     
     # ── Cria workbook ──
     wb = Workbook()
@@ -875,109 +2237,69 @@ def exportar_excel(
     ws_combos.title = "Combinações"
     ws_detalhes = wb.create_sheet("Detalhes")
     
-    # ── Paleta de cores ──
-    COR_AZUL_ESC = "1F4E79"
-    COR_AZUL_CLA = "BDD7EE"
-    COR_VERDE    = "E2EFDA"
-    COR_CINZA    = "F2F2F2"
-    COR_BRANCO   = "FFFFFF"
-    COR_AMARELO  = "FFF2CC"
-    COR_ROXO     = "EDE7F6"
-    COR_LARANJA  = "FFE0B2"
-    
-    # ── Estilo de borda ──
-    borda_fina = Side(style='thin', color='CCCCCC')
-    borda = Border(left=borda_fina, right=borda_fina, top=borda_fina, bottom=borda_fina)
+    # ── Registra os estilos nomeados uma única vez no workbook ──
+    estilos = registrar_estilos_excel(wb)
     
     # ── Função auxiliar para criar célula estilizada ──
-    def criar_celula(ws, linha, coluna, valor, negrito=False, cor_fundo=COR_BRANCO,
-                     cor_texto="000000", alinhamento="left", formato=None, quebra=False):
-        """Helper para criar célula com estilo completo"""
+    def criar_celula(ws, linha, coluna, valor, estilo):
+        """Helper para criar célula com um estilo nomeado (atribuído por referência)"""
         c = ws.cell(linha, coluna, valor)
-        c.font = Font(name="Arial", size=9, bold=negrito, color=cor_texto)
-        c.fill = PatternFill("solid", start_color=cor_fundo, end_color=cor_fundo)
-        c.alignment = Alignment(horizontal=alinhamento, vertical="center", wrap_text=quebra)
-        c.border = borda
-        if formato:
-            c.number_format = formato
+        c.style = estilos[estilo]
         return c
     
-    # ── Calcula peso médio ──
-    peso_medio = calcular_peso_medio_bobina(peso_total, qtd_bobinas)
-    
     # ══════════════════════════════════════════════════════════════
     # ABA 1: COMBINAÇÕES
     # ══════════════════════════════════════════════════════════════
     
     # ── Título ──
     ws_combos.row_dimensions[1].height = 22
-    ws_combos.cell(1, 1, "PLANO DE CORTE — COMBINAÇÕES VÁLIDAS").font = \
-        Font(name="Arial", size=13, bold=True, color=COR_AZUL_ESC)
+    criar_celula(ws_combos, 1, 1, "PLANO DE CORTE — COMBINAÇÕES VÁLIDAS", "titulo")
     ws_combos.merge_cells("A1:I1")
     
     # ── Cabeçalho de parâmetros ──
-    refilo_min = REFILO_MIN_ATE_3MM if espessura <= 3.0 else REFILO_MIN_ACIMA_3MM
-    regra_refilo = f"≤ 3.0 mm → {REFILO_MIN_ATE_3MM} mm | > 3.0 mm → {REFILO_MIN_ACIMA_3MM} mm"
-    limite_str = str(limite_cortes) if limite_cortes is not None else "Sem limite"
-    
-    parametros = [
-        ("Matriz Âncora", ancora),
-        ("Espessura", f"{espessura} mm"),
-        ("Tipo de Material", tipo),
-        ("Largura da Bobina", f"{largura} mm"),
-        ("Padrões Testados", " → ".join(str(l) for l in LARGURAS_BOBINA) + f"  (usado: {largura} mm)"),
-        ("Limite de Cortes", limite_str),
-        ("Refilo Mínimo", f"{refilo_min} mm  (regra: {regra_refilo})"),
-        ("Qtd. de Bobinas", str(qtd_bobinas)),
-        ("Peso Total Lote", f"{peso_total:,.0f} kg  ({peso_total/1000:.1f} ton)"),
-        ("Peso Médio/Bobina", f"{peso_medio:,.0f} kg  ({peso_medio/1000:.2f} ton)"),
-        ("Perda Mínima (%)", f"{PERDA_MIN_PCT}%  ({largura * PERDA_MIN_PCT / 100:.2f} mm)"),
-        ("Perda Máxima (%)", f"{PERDA_MAX_PCT}%  ({largura * PERDA_MAX_PCT / 100:.2f} mm)"),
-        ("Total Combinações", len(df_res)),
-    ]
+    parametros = montar_parametros_excel(
+        largura, ancora, espessura, tipo, qtd_bobinas, peso_total, limite_cortes,
+        total_combinacoes=len(df_res), config=config
+    )
     
     for r, (chave, valor) in enumerate(parametros, start=2):
-        criar_celula(ws_combos, r, 1, chave, negrito=True, cor_fundo=COR_AZUL_CLA)
-        criar_celula(ws_combos, r, 2, valor, cor_fundo=COR_AZUL_CLA)
+        criar_celula(ws_combos, r, 1, chave, "param_chave")
+        criar_celula(ws_combos, r, 2, valor, "param_valor")
         ws_combos.merge_cells(f"B{r}:I{r}")
     
     # ── Cabeçalho da tabela ──
     linha_cabecalho = len(parametros) + 3
     ws_combos.row_dimensions[linha_cabecalho].height = 28
     
-    colunas = ["#", "Combinação  (Âncora em destaque)", "N Âncora", "Total Cortes",
-               "Soma Cortes (mm)", "Perda (mm)", "Perda (%)", "Qtd. KG", "Status"]
-    
-    for col, titulo in enumerate(colunas, 1):
-        criar_celula(ws_combos, linha_cabecalho, col, titulo,
-                    negrito=True, cor_fundo=COR_AZUL_ESC, cor_texto=COR_BRANCO, alinhamento="center")
+    for col, titulo in enumerate(COLUNAS_COMBINACOES, 1):
+        criar_celula(ws_combos, linha_cabecalho, col, titulo, "cabecalho")
     
     # ── Dados das combinações ──
     for i, row in df_res.iterrows():
         linha = linha_cabecalho + 1 + i
-        cor_zebra = COR_VERDE if i % 2 == 0 else COR_CINZA
+        zebra = "verde" if i % 2 == 0 else "cinza"
         
-        # Calcula KG total
-        kg = calcular_kg_combinacao(row['Detalhes'], peso_medio, largura, qtd_bobinas)
-        
-        # Cor do status
-        cor_status = COR_VERDE if row['Status'] == "✓ Válida" else COR_LARANJA
+        # Estilo do status
+        estilo_status = "status_valida" if row['Status'] == "✓ Válida" else "status_fora"
         
         # Preenche células
-        criar_celula(ws_combos, linha, 1, i + 1, cor_fundo=cor_zebra, alinhamento="center")
-        criar_celula(ws_combos, linha, 2, row['Combinacao'], cor_fundo=cor_zebra, quebra=True)
-        criar_celula(ws_combos, linha, 3, row['N_ancora'], cor_fundo=COR_AMARELO, alinhamento="center")
-        criar_celula(ws_combos, linha, 4, row['Total_cortes'], cor_fundo=cor_zebra, alinhamento="center")
-        criar_celula(ws_combos, linha, 5, row['Soma_cortes_mm'], cor_fundo=cor_zebra, alinhamento="right", formato='#,##0.000')
-        criar_celula(ws_combos, linha, 6, row['Perda_mm'], cor_fundo=cor_zebra, alinhamento="right", formato='#,##0.000')
-        criar_celula(ws_combos, linha, 7, row['Perda_pct'] / 100, cor_fundo=cor_zebra, alinhamento="right", formato='0.0000%')
-        criar_celula(ws_combos, linha, 8, kg, cor_fundo=COR_ROXO, alinhamento="right", formato='#,##0.00')
-        criar_celula(ws_combos, linha, 9, row['Status'], cor_fundo=cor_status, alinhamento="center")
+        criar_celula(ws_combos, linha, 1, i + 1, f"{zebra}_centro")
+        criar_celula(ws_combos, linha, 2, row['Combinacao'], f"{zebra}_texto")
+        criar_celula(ws_combos, linha, 3, row['N_ancora'], "ancora_centro")
+        criar_celula(ws_combos, linha, 4, row['Total_cortes'], f"{zebra}_centro")
+        criar_celula(ws_combos, linha, 5, row['Soma_cortes_mm'], f"{zebra}_mm")
+        criar_celula(ws_combos, linha, 6, row['Perda_mm'], f"{zebra}_mm")
+        criar_celula(ws_combos, linha, 7, row['Perda_pct'] / 100, f"{zebra}_pct")
+        criar_celula(ws_combos, linha, 8, row['Qtd_KG'], "kg")
+        criar_celula(ws_combos, linha, 9, row['Status'], estilo_status)
         
         ws_combos.row_dimensions[linha].height = 16
+        
+        if progresso is not None and (i + 1) % INTERVALO_PROGRESSO == 0:
+            progresso(i + 1, total_linhas)
     
     # ── Ajusta larguras das colunas ──
-    for col, largura_col in zip("ABCDEFGHI", [5, 52, 10, 13, 18, 13, 12, 16, 10]):
+    for col, largura_col in zip("ABCDEFGHI", LARGURAS_COL_COMBINACOES):
         ws_combos.column_dimensions[col].width = largura_col
     
     # ══════════════════════════════════════════════════════════════
@@ -986,128 +2308,3843 @@ def exportar_excel(
     
     # ── Título ──
     ws_detalhes.row_dimensions[1].height = 20
-    ws_detalhes.cell(1, 1, "DETALHES POR COMBINAÇÃO").font = \
-        Font(name="Arial", size=12, bold=True, color=COR_AZUL_ESC)
+    criar_celula(ws_detalhes, 1, 1, "DETALHES POR COMBINAÇÃO", "titulo_detalhes")
     ws_detalhes.merge_cells("A1:G1")
     
     # ── Cabeçalho ──
-    colunas_det = ["# Combo", "Papel", "Matriz", "Desenvolvimento (mm)",
-                   "N° Cortes", "Subtotal (mm)", "Qtd. KG"]
+    for col, titulo in enumerate(COLUNAS_DETALHES, 1):
+        criar_celula(ws_detalhes, 2, col, titulo, "cabecalho")
     
-    for col, titulo in enumerate(colunas_det, 1):
-        criar_celula(ws_detalhes, 2, col, titulo,
-                    negrito=True, cor_fundo=COR_AZUL_ESC, cor_texto=COR_BRANCO, alinhamento="center")
-    
-    # ── Dados detalhados ──
-    linha = 3
-    for i, row in df_res.iterrows():
-        for j, detalhe in enumerate(row['Detalhes']):
-            # Primeira matriz é sempre a âncora
-            papel = "ÂNCORA" if j == 0 else "Complementar"
-            cor_papel = COR_AMARELO if j == 0 else COR_BRANCO
-            negrito_papel = (j == 0)
-            
-            # Calcula KG desta matriz
-            kg_matriz = calcular_kg_matriz(
-                peso_medio, largura,
-                detalhe['N_cortes'],
-                detalhe['Desenvolvimento_mm'],
-                qtd_bobinas
-            )
-            
-            # Preenche linha
-            criar_celula(ws_detalhes, linha, 1, i + 1, alinhamento="center")
-            criar_celula(ws_detalhes, linha, 2, papel, cor_fundo=cor_papel, alinhamento="center", negrito=negrito_papel)
-            criar_celula(ws_detalhes, linha, 3, detalhe['Matriz'], cor_fundo=cor_papel)
-            criar_celula(ws_detalhes, linha, 4, detalhe['Desenvolvimento_mm'], cor_fundo=cor_papel, alinhamento="right", formato='#,##0.000')
-            criar_celula(ws_detalhes, linha, 5, detalhe['N_cortes'], cor_fundo=cor_papel, alinhamento="center")
-            criar_celula(ws_detalhes, linha, 6, detalhe['Subtotal_mm'], cor_fundo=cor_papel, alinhamento="right", formato='#,##0.000')
-            criar_celula(ws_detalhes, linha, 7, kg_matriz, cor_fundo=COR_ROXO, alinhamento="right", formato='#,##0.00')
-            
-            linha += 1
+    # ── Dados detalhados (tabela já explodida, uma linha por matriz) ──
+    for linha, det in enumerate(df_detalhes.itertuples(index=False), start=3):
+        # Primeira matriz é sempre a âncora
+        pre = "ancora" if det.Papel == "ÂNCORA" else "comp"
+        
+        # Preenche linha
+        criar_celula(ws_detalhes, linha, 1, det.Combo, "det_id")
+        criar_celula(ws_detalhes, linha, 2, det.Papel, f"{pre}_papel")
+        criar_celula(ws_detalhes, linha, 3, det.Matriz, f"{pre}_texto")
+        criar_celula(ws_detalhes, linha, 4, det.Desenvolvimento_mm, f"{pre}_mm")
+        criar_celula(ws_detalhes, linha, 5, det.N_cortes, f"{pre}_centro")
+        criar_celula(ws_detalhes, linha, 6, det.Subtotal_mm, f"{pre}_mm")
+        criar_celula(ws_detalhes, linha, 7, det.Qtd_KG, "kg")
+        
+        feitas = len(df_res) + linha - 2
+        if progresso is not None and feitas % INTERVALO_PROGRESSO == 0:
+            progresso(feitas, total_linhas)
     
     # ── Ajusta larguras ──
-    for col, largura_col in zip("ABCDEFG", [10, 14, 28, 22, 12, 16, 16]):
+    for col, largura_col in zip("ABCDEFG", LARGURAS_COL_DETALHES):
         ws_detalhes.column_dimensions[col].width = largura_col
     
     # ── Salva arquivo ──
     os.makedirs(os.path.dirname(caminho) if os.path.dirname(caminho) else ".", exist_ok=True)
     wb.save(caminho)
+    if progresso is not None:
+        progresso(total_linhas, total_linhas)
     print(f"\n  ✓ Resultado exportado: {caminho}")
 
 
-# ================================================================================
-# BLOCO 9: FUNÇÃO PRINCIPAL (MAIN)
-# ================================================================================
+def iterar_registros(df_res: pd.DataFrame) -> Iterator[dict]:
+    """
+    Percorre o DataFrame de resultados entregando um dict por combinação,
+    sem criar a lista inteira de registros (ver exportar_excel_streaming).
+    """
+    colunas = list(df_res.columns)
+    for valores in df_res.itertuples(index=False, name=None):
+        yield dict(zip(colunas, valores))
 
-def main():
+
+def exportar_excel_streaming(
+    resultados: Iterable[dict],
+    largura: int,
+    ancora: str,
+    espessura: float,
+    tipo: str,
+    caminho: str,
+    qtd_bobinas: int,
+    peso_total: float,
+    limite_cortes: int | None = None,
+    total_combinacoes: int | None = None,
+    progresso=None,
+    config: ConfigPlano | None = None
+) -> int:
     """
-    Função principal que coordena toda a execução.
+    Exporta resultados para Excel em modo streaming (memória constante).
     
-    FLUXO:
-        1. Carrega banco de dados
-        2. Coleta informações do usuário via menu
-        3. Busca combinações válidas
-        4. Exibe resultados no terminal
-        5. Exporta para Excel
+    Mesmo layout de exportar_excel (cabeçalho de parâmetros, larguras de
+    coluna e cores), mas usando um workbook write_only: cada combinação é
+    gravada nas DUAS abas no momento em que chega, e o openpyxl descarrega
+    as linhas em disco — nada do arquivo fica inteiro em memória.
+    
+    ENTRADA:
+        resultados: qualquer iterável de dicts no formato do motor, ex:
+                    - gerar_combinacoes_para_largura(...) (direto do motor)
+                    - iterar_registros(df_res)
+        total_combinacoes: se None (fluxo de tamanho desconhecido), o campo
+                           "Total Combinações" vira uma fórmula CONT.VALORES
+        progresso: callback opcional progresso(combinacoes_gravadas, total)
+                   (total = total_combinacoes, pode ser None)
+        demais: iguais a exportar_excel
+    
+    SAÍDA:
+        Quantidade de combinações gravadas
+    
+    NOTA: a numeração (#) segue a ordem de chegada. Para manter a ordenação
+          por perda, passe os resultados já ordenados.
     """
-    # ── Carrega banco de dados ──
-    caminho_db = os.path.join(BASE_INPUT, 'db_plano_corte.xlsx')
-    print(f"\n  Carregando: {caminho_db}")
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
     
-    df = carregar_dados(caminho_db)
-    print(f"  ✓ {len(df)} produtos carregados.")
+    # ── Cria workbook em modo streaming ──
+    wb = Workbook(write_only=True)
+    ws_combos = wb.create_sheet("Combinações")
+    ws_detalhes = wb.create_sheet("Detalhes")
     
-    # ── Interface com usuário ──
-    espessura, tipo, ancora, limite_cortes, qtd_bobinas, peso_total = menu_usuario(df)
+    estilos = registrar_estilos_excel(wb)
     
-    # ── Busca combinações ──
-    print(f"\n  Buscando combinações para:")
-    print(f"    Âncora: {ancora} | Espessura: {espessura} mm | Tipo: {tipo}")
-    if limite_cortes:
-        print(f"    Limite de cortes: {limite_cortes}")
+    # ── Função auxiliar para montar uma linha estilizada ──
+    def linha_celulas(ws, celulas):
+        """Converte [(valor, estilo), ...] em células write-only estilizadas"""
+        linha = []
+        for valor, estilo in celulas:
+            c = WriteOnlyCell(ws, valor)
+            c.style = estilos[estilo]
+            linha.append(c)
+        return linha
     
-    df_resultados, largura_usada = encontrar_combinacoes(
-        df=df,
-        espessura=espessura,
-        tipo_material=tipo,
-        matriz_ancora=ancora,
-        limite_cortes=limite_cortes
-    )
+    peso_medio = calcular_peso_medio_bobina(peso_total, qtd_bobinas)
     
-    # ── Exibe no terminal ──
-    exibir_terminal(
-        df_res=df_resultados,
-        largura=largura_usada,
-        ancora=ancora,
-        espessura=espessura,
-        tipo=tipo,
-        limite_cortes=limite_cortes
+    # ══════════════════════════════════════════════════════════════
+    # LAYOUT (no modo write_only, precisa ser definido ANTES das linhas)
+    # ══════════════════════════════════════════════════════════════
+    parametros = montar_parametros_excel(
+        largura, ancora, espessura, tipo, qtd_bobinas, peso_total, limite_cortes,
+        total_combinacoes=total_combinacoes, config=config
     )
+    linha_cabecalho = len(parametros) + 3
     
-    # ── Exporta para Excel (se houver resultados) ──
-    if not df_resultados.empty:
-        # Monta nome do arquivo
-        ancora_safe = ancora.replace('/', '_').replace('"', 'in').replace(',', '-').replace(' ', '_')
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        esp_str = str(espessura).replace('.', '-')
-        tipo_str = tipo.replace(' ', '_')
-        
-        nome_arquivo = f"plano_{ancora_safe}_esp{esp_str}_{tipo_str}_L{largura_usada}_{timestamp}.xlsx"
-        caminho_completo = os.path.join(BASE_OUTPUT, nome_arquivo)
-        
-        # Exporta
-        exportar_excel(
-            df_res=df_resultados,
-            largura=largura_usada,
+    # Total desconhecido (fluxo direto do motor): conta as linhas no próprio Excel
+    if total_combinacoes is None:
+        parametros[-1] = ("Total Combinações", f"=COUNTA(A{linha_cabecalho + 1}:A1048576)")
+    
+    for col, largura_col in zip("ABCDEFGHI", LARGURAS_COL_COMBINACOES):
+        ws_combos.column_dimensions[col].width = largura_col
+    for col, largura_col in zip("ABCDEFG", LARGURAS_COL_DETALHES):
+        ws_detalhes.column_dimensions[col].width = largura_col
+    
+    # Altura 16 para as linhas de dados via altura padrão da aba
+    # (evita guardar um RowDimension por linha)
+    ws_combos.sheet_format.defaultRowHeight = 16
+    ws_combos.sheet_format.customHeight = True
+    ws_combos.row_dimensions[1].height = 22
+    ws_combos.row_dimensions[linha_cabecalho].height = 28
+    ws_detalhes.row_dimensions[1].height = 20
+    
+    ws_combos.merged_cells.add("A1:I1")
+    for r in range(2, len(parametros) + 2):
+        ws_combos.merged_cells.add(f"B{r}:I{r}")
+    ws_detalhes.merged_cells.add("A1:G1")
+    
+    # ══════════════════════════════════════════════════════════════
+    # CABEÇALHOS
+    # ══════════════════════════════════════════════════════════════
+    ws_combos.append(linha_celulas(ws_combos, [("PLANO DE CORTE — COMBINAÇÕES VÁLIDAS", "titulo")]))
+    for chave, valor in parametros:
+        ws_combos.append(linha_celulas(ws_combos, [(chave, "param_chave"), (valor, "param_valor")]))
+    ws_combos.append([])
+    ws_combos.append(linha_celulas(ws_combos, [(t, "cabecalho") for t in COLUNAS_COMBINACOES]))
+    
+    ws_detalhes.append(linha_celulas(ws_detalhes, [("DETALHES POR COMBINAÇÃO", "titulo_detalhes")]))
+    ws_detalhes.append(linha_celulas(ws_detalhes, [(t, "cabecalho") for t in COLUNAS_DETALHES]))
+    
+    # ══════════════════════════════════════════════════════════════
+    # DADOS: cada combinação vai para as duas abas assim que chega
+    # ══════════════════════════════════════════════════════════════
+    n = 0
+    for n, row in enumerate(resultados, start=1):
+        zebra = "verde" if n % 2 == 1 else "cinza"
+        
+        # KG de cada matriz uma vez só; o da combinação é a soma
+        kgs = [
+            calcular_kg_matriz(peso_medio, largura, d['N_cortes'], d['Desenvolvimento_mm'], qtd_bobinas)
+            for d in row['Detalhes']
+        ]
+        kg = row['Qtd_KG'] if 'Qtd_KG' in row else round(sum(kgs), 2)
+        estilo_status = "status_valida" if row['Status'] == "✓ Válida" else "status_fora"
+        
+        ws_combos.append(linha_celulas(ws_combos, [
+            (n, f"{zebra}_centro"),
+            (row['Combinacao'], f"{zebra}_texto"),
+            (row['N_ancora'], "ancora_centro"),
+            (row['Total_cortes'], f"{zebra}_centro"),
+            (row['Soma_cortes_mm'], f"{zebra}_mm"),
+            (row['Perda_mm'], f"{zebra}_mm"),
+            (row['Perda_pct'] / 100, f"{zebra}_pct"),
+            (kg, "kg"),
+            (row['Status'], estilo_status),
+        ]))
+        
+        for j, (detalhe, kg_matriz) in enumerate(zip(row['Detalhes'], kgs)):
+            papel = "ÂNCORA" if j == 0 else "Complementar"
+            pre = "ancora" if j == 0 else "comp"
+            ws_detalhes.append(linha_celulas(ws_detalhes, [
+                (n, "det_id"),
+                (papel, f"{pre}_papel"),
+                (detalhe['Matriz'], f"{pre}_texto"),
+                (detalhe['Desenvolvimento_mm'], f"{pre}_mm"),
+                (detalhe['N_cortes'], f"{pre}_centro"),
+                (detalhe['Subtotal_mm'], f"{pre}_mm"),
+                (kg_matriz, "kg"),
+            ]))
+        
+        if progresso is not None and n % INTERVALO_PROGRESSO == 0:
+            progresso(n, total_combinacoes)
+    
+    # ── Salva arquivo ──
+    os.makedirs(os.path.dirname(caminho) if os.path.dirname(caminho) else ".", exist_ok=True)
+    wb.save(caminho)
+    if progresso is not None:
+        progresso(n, n)
+    print(f"\n  ✓ Resultado exportado (streaming, {n} combinações): {caminho}")
+    
+    return n
+
+
+def montar_metadados_plano(
+    largura: int,
+    ancora: str,
+    espessura: float,
+    tipo: str,
+    qtd_bobinas: int,
+    peso_total: float,
+    limite_cortes: int | None = None,
+    config: ConfigPlano | None = None
+) -> dict:
+    """
+    Parâmetros do plano em formato legível por máquina (JSON).
+    
+    Vai embutido no Parquet (metadados do schema) e num arquivo
+    "<base>_meta.json" ao lado do CSV / JSON Lines.
+    """
+    config = config or ConfigPlano.padrao()
+    perda_min_mm, perda_max_mm = config.janela_mm(largura)
+    return {
+        'ancora': ancora,
+        'espessura_mm': espessura,
+        'tipo_material': tipo,
+        'largura_bobina_mm': largura,
+        'larguras_testadas_mm': list(config.larguras),
+        'perda_min_pct': config.perda_min_pct,
+        'perda_max_pct': config.perda_max_pct,
+        'perda_min_mm': round(perda_min_mm, 3),
+        'perda_max_mm': round(perda_max_mm, 3),
+        'refilo_min_mm': config.refilo_min(espessura),
+        'max_complementares': config.max_complementares,
+        'limite_cortes': limite_cortes,
+        'qtd_bobinas': qtd_bobinas,
+        'peso_total_kg': peso_total,
+        'peso_medio_bobina_kg': calcular_peso_medio_bobina(peso_total, qtd_bobinas),
+        'gerado_em': datetime.now().isoformat(timespec='seconds'),
+    }
+
+
+def exportar_colunar(
+    df_res: pd.DataFrame,
+    largura: int,
+    ancora: str,
+    espessura: float,
+    tipo: str,
+    caminho_base: str,
+    qtd_bobinas: int,
+    peso_total: float,
+    limite_cortes: int | None = None,
+    formatos: Iterable[str] = ('csv',),
+    df_detalhes: pd.DataFrame | None = None,
+    config: ConfigPlano | None = None
+) -> list[str]:
+    """
+    Exporta combinações e detalhes em formatos colunares (sem estilo).
+    
+    Alternativa rápida ao Excel para sistemas MES/BI: as tabelas são
+    gravadas em bloco, direto do DataFrame, e lidas sem nenhum parse
+    de planilha do outro lado.
+    
+    ENTRADA:
+        caminho_base: caminho SEM extensão; gera, por formato:
+                      <base>_combinacoes.<ext> e <base>_detalhes.<ext>
+        formatos: qualquer subconjunto de ('csv', 'jsonl', 'parquet')
+        df_detalhes: tabela de anexar_kg (calculada aqui se não vier)
+        demais: iguais a exportar_excel
+    
+    TABELAS:
+        <base>_combinacoes: uma linha por combinação (Combo = # do Excel,
+                            sem a coluna aninhada 'Detalhes', com 'Qtd_KG')
+        <base>_detalhes:    uma linha por matriz (ver explodir_detalhes)
+    
+    SAÍDA:
+        Lista dos arquivos gravados
+    
+    METADADOS (largura, janela de perda, refilo, peso da bobina...):
+        - parquet: embutidos no schema (chave b'plano_corte')
+        - csv / jsonl: arquivo <base>_meta.json
+    """
+    import json
+    
+    if df_detalhes is None or 'Qtd_KG' not in df_res.columns:
+        df_res, df_detalhes = anexar_kg(df_res, largura, qtd_bobinas, peso_total)
+    
+    df_combos = df_res.drop(columns=['Detalhes'])
+    df_combos.insert(0, 'Combo', range(1, len(df_combos) + 1))
+    
+    meta = montar_metadados_plano(largura, ancora, espessura, tipo, qtd_bobinas, peso_total, limite_cortes,
+                                  config)
+    
+    os.makedirs(os.path.dirname(caminho_base) if os.path.dirname(caminho_base) else ".", exist_ok=True)
+    
+    gravados = []
+    for formato in formatos:
+        for nome, tabela in (('combinacoes', df_combos), ('detalhes', df_detalhes)):
+            caminho = f"{caminho_base}_{nome}.{formato}"
+            
+            if formato == 'csv':
+                tabela.to_csv(caminho, index=False, encoding='utf-8')
+            elif formato == 'jsonl':
+                tabela.to_json(caminho, orient='records', lines=True, force_ascii=False)
+            elif formato == 'parquet':
+                try:
+                    import pyarrow as pa
+                    import pyarrow.parquet as pq
+                except ImportError:
+                    print("  ⚠ Parquet ignorado: instale 'pyarrow' para habilitar.")
+                    break
+                tabela_pa = pa.Table.from_pandas(tabela, preserve_index=False)
+                tabela_pa = tabela_pa.replace_schema_metadata({
+                    **(tabela_pa.schema.metadata or {}),
+                    b'plano_corte': json.dumps(meta, ensure_ascii=False).encode('utf-8'),
+                })
+                pq.write_table(tabela_pa, caminho)
+            else:
+                raise ValueError(f"Formato de exportação desconhecido: {formato}")
+            
+            gravados.append(caminho)
+    
+    # ── Metadados ao lado dos formatos de texto ──
+    if any(f in ('csv', 'jsonl') for f in formatos):
+        caminho_meta = f"{caminho_base}_meta.json"
+        with open(caminho_meta, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+        gravados.append(caminho_meta)
+    
+    for caminho in gravados:
+        print(f"  ✓ Exportado: {caminho}")
+    
+    return gravados
+
+
+def exportar_colunar_em_blocos(
+    resultados: Iterable[dict],
+    largura: int,
+    ancora: str,
+    espessura: float,
+    tipo: str,
+    caminho_base: str,
+    qtd_bobinas: int,
+    peso_total: float,
+    limite_cortes: int | None = None,
+    formatos: Iterable[str] = ('csv',),
+    config: ConfigPlano | None = None
+) -> list[str]:
+    """
+    Mesmas tabelas de exportar_colunar, gravadas em blocos de
+    TAMANHO_BLOCO_EXPORTACAO combinações a partir de um fluxo (ex:
+    BufferResultados.ordenados()) — memória de um bloco, qualquer total.
+    
+    MÉTODO: cada bloco vira um DataFrame, passa por anexar_kg e é acrescentado
+            aos arquivos (Combo continua a numeração do bloco anterior);
+            o Parquet usa um ParquetWriter aberto no primeiro bloco.
+    
+    SAÍDA:
+        Lista dos arquivos gravados
+    """
+    import json
+    
+    formatos = list(formatos)
+    if 'parquet' in formatos:
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            print("  ⚠ Parquet ignorado: instale 'pyarrow' para habilitar.")
+            formatos.remove('parquet')
+    for formato in formatos:
+        if formato not in ('csv', 'jsonl', 'parquet'):
+            raise ValueError(f"Formato de exportação desconhecido: {formato}")
+    
+    meta = montar_metadados_plano(largura, ancora, espessura, tipo, qtd_bobinas, peso_total, limite_cortes,
+                                  config)
+    os.makedirs(os.path.dirname(caminho_base) if os.path.dirname(caminho_base) else ".", exist_ok=True)
+    
+    escritores_parquet = {}
+    feitas = 0
+    try:
+        iterador = iter(resultados)
+        while True:
+            bloco = list(islice(iterador, TAMANHO_BLOCO_EXPORTACAO))
+            if not bloco:
+                break
+            
+            df_bloco, df_det = anexar_kg(pd.DataFrame(bloco), largura, qtd_bobinas, peso_total)
+            df_combos = df_bloco.drop(columns=['Detalhes'])
+            df_combos.insert(0, 'Combo', range(feitas + 1, feitas + len(df_combos) + 1))
+            df_det['Combo'] += feitas
+            
+            for formato in formatos:
+                for nome, tabela in (('combinacoes', df_combos), ('detalhes', df_det)):
+                    caminho = f"{caminho_base}_{nome}.{formato}"
+                    
+                    if formato == 'csv':
+                        tabela.to_csv(caminho, index=False, encoding='utf-8',
+                                      mode='a' if feitas else 'w', header=not feitas)
+                    elif formato == 'jsonl':
+                        tabela.to_json(caminho, orient='records', lines=True, force_ascii=False,
+                                       mode='a' if feitas else 'w')
+                    else:
+                        tabela_pa = pa.Table.from_pandas(tabela, preserve_index=False)
+                        if caminho not in escritores_parquet:
+                            schema = tabela_pa.schema.with_metadata({
+                                **(tabela_pa.schema.metadata or {}),
+                                b'plano_corte': json.dumps(meta, ensure_ascii=False).encode('utf-8'),
+                            })
+                            escritores_parquet[caminho] = pq.ParquetWriter(caminho, schema)
+                        escritores_parquet[caminho].write_table(
+                            tabela_pa.cast(escritores_parquet[caminho].schema))
+            
+            feitas += len(df_combos)
+    finally:
+        for escritor in escritores_parquet.values():
+            escritor.close()
+    
+    gravados = [f"{caminho_base}_{nome}.{formato}" for formato in formatos
+                for nome in ('combinacoes', 'detalhes')] if feitas else []
+    
+    # ── Metadados ao lado dos formatos de texto ──
+    if feitas and any(f in ('csv', 'jsonl') for f in formatos):
+        caminho_meta = f"{caminho_base}_meta.json"
+        with open(caminho_meta, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+        gravados.append(caminho_meta)
+    
+    for caminho in gravados:
+        print(f"  ✓ Exportado ({feitas} combinações): {caminho}")
+    
+    return gravados
+
+
+def reservar_caminho_saida(
+    ancora: str,
+    espessura: float,
+    tipo: str,
+    largura: int,
+    extensao: str = '.xlsx',
+    pasta: str | None = None
+) -> str:
+    """
+    Monta o nome do arquivo de saída em BASE_OUTPUT (ou em 'pasta') e o
+    reserva no disco.
+    
+    O nome segue o padrão plano_<ancora>_esp<esp>_<tipo>_L<largura>_<timestamp>.
+    Se duas exportações caírem no mesmo segundo (fila em segundo plano,
+    lote), acrescenta _2, _3, ... — a criação exclusiva do arquivo (O_EXCL)
+    garante que nenhuma sobrescreve a outra, mesmo entre threads/processos.
+    
+    SAÍDA:
+        Caminho completo reservado (arquivo vazio já criado)
+    """
+    ancora_safe = ancora.replace('/', '_').replace('"', 'in').replace(',', '-').replace(' ', '_')
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    esp_str = str(espessura).replace('.', '-')
+    tipo_str = tipo.replace(' ', '_')
+    
+    base = f"plano_{ancora_safe}_esp{esp_str}_{tipo_str}_L{largura}_{timestamp}"
+    pasta = pasta or BASE_OUTPUT
+    os.makedirs(pasta, exist_ok=True)
+    
+    sufixo = 1
+    while True:
+        nome = base + (f"_{sufixo}" if sufixo > 1 else "") + extensao
+        caminho = os.path.join(pasta, nome)
+        try:
+            os.close(os.open(caminho, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return caminho
+        except FileExistsError:
+            sufixo += 1
+
+
+def descartar_reserva(caminho: str) -> None:
+    """
+    Apaga o arquivo reservado por reservar_caminho_saida (vazio ou gravado
+    pela metade) quando a exportação falha: não deixa em BASE_OUTPUT um
+    .xlsx que o Excel não abre.
+    """
+    try:
+        os.remove(caminho)
+    except OSError:
+        pass
+
+
+def exportar_plano(
+    df_res: pd.DataFrame,
+    df_detalhes: pd.DataFrame | None,
+    largura: int,
+    ancora: str,
+    espessura: float,
+    tipo: str,
+    qtd_bobinas: int,
+    peso_total: float,
+    limite_cortes: int | None = None,
+    caminho: str | None = None,
+    progresso=None,
+    completo: BufferResultados | None = None,
+    config: ConfigPlano | None = None
+) -> list[str]:
+    """
+    Grava todas as saídas de um plano: Excel (normal ou streaming, conforme
+    LIMITE_COMBOS_EXCEL_NORMAL) + formatos de FORMATOS_COLUNARES.
+    
+    ENTRADA:
+        caminho: caminho do .xlsx (None = reservar_caminho_saida em BASE_OUTPUT)
+        progresso: callback opcional progresso(feitas, total) chamado
+                   durante a gravação do Excel
+        completo: BufferResultados que derramou em disco
+                  (config.modo_orcamento = 'disco'): as saídas são gravadas
+                  a partir dele, com todas as combinações, e não de df_res
+                  (só as melhores). É fechado (corridas apagadas) ao final.
+        config: regras usadas na busca, para cabeçalho e metadados
+    
+    SAÍDA:
+        Lista de arquivos gravados (o .xlsx primeiro)
+    
+    ERRO:
+        Se a gravação do Excel falhar, o .xlsx reservado é apagado
+        (descartar_reserva) e a exceção segue para o chamador
+    """
+    if caminho is None:
+        caminho = reservar_caminho_saida(ancora, espessura, tipo, largura)
+    
+    if completo is not None:
+        try:
+            return _exportar_plano_completo(completo, largura, ancora, espessura, tipo, qtd_bobinas,
+                                            peso_total, limite_cortes, caminho, progresso, config)
+        finally:
+            completo.fechar()
+    
+    # ── Excel (resultados grandes vão pelo modo streaming, memória constante) ──
+    try:
+        if len(df_res) > LIMITE_COMBOS_EXCEL_NORMAL:
+            no_excel = combinacoes_no_excel(len(df_res), config)
+            exportar_excel_streaming(
+                resultados=islice(iterar_registros(df_res), no_excel),
+                largura=largura,
+                ancora=ancora,
+                espessura=espessura,
+                tipo=tipo,
+                caminho=caminho,
+                qtd_bobinas=qtd_bobinas,
+                peso_total=peso_total,
+                limite_cortes=limite_cortes,
+                total_combinacoes=no_excel,
+                progresso=progresso,
+                config=config
+            )
+        else:
+            exportar_excel(
+                df_res=df_res,
+                largura=largura,
+                ancora=ancora,
+                espessura=espessura,
+                tipo=tipo,
+                caminho=caminho,
+                qtd_bobinas=qtd_bobinas,
+                peso_total=peso_total,
+                limite_cortes=limite_cortes,
+                df_detalhes=df_detalhes,
+                progresso=progresso,
+                config=config
+            )
+    except BaseException:
+        descartar_reserva(caminho)
+        raise
+    gravados = [caminho]
+    
+    # ── Saídas colunares para MES/BI (mesmo nome base do Excel) ──
+    if FORMATOS_COLUNARES:
+        gravados += exportar_colunar(
+            df_res=df_res,
+            largura=largura,
+            ancora=ancora,
+            espessura=espessura,
+            tipo=tipo,
+            caminho_base=os.path.splitext(caminho)[0],
+            qtd_bobinas=qtd_bobinas,
+            peso_total=peso_total,
+            limite_cortes=limite_cortes,
+            formatos=FORMATOS_COLUNARES,
+            df_detalhes=df_detalhes,
+            config=config
+        )
+    
+    return gravados
+
+
+def combinacoes_no_excel(total: int, config: ConfigPlano | None = None) -> int:
+    """
+    Quantas das 'total' combinações (já ordenadas) cabem no Excel: a aba
+    Detalhes tem até 1 + max_complementares linhas por combinação e não
+    pode passar de LINHAS_MAX_EXCEL. Avisa no terminal quando corta.
+    """
+    config = config or ConfigPlano.padrao()
+    max_excel = (LINHAS_MAX_EXCEL - 2) // (1 + config.max_complementares)
+    no_excel = min(total, max_excel)
+    if no_excel < total:
+        resto = "as demais só nos formatos colunares" if FORMATOS_COLUNARES else "as demais ficam de fora"
+        print(f"\n  ⚠ Excel com as {no_excel} melhores de {total} combinações "
+              f"(limite de linhas da planilha); {resto}.")
+    return no_excel
+
+
+def _exportar_plano_completo(
+    completo: BufferResultados,
+    largura: int,
+    ancora: str,
+    espessura: float,
+    tipo: str,
+    qtd_bobinas: int,
+    peso_total: float,
+    limite_cortes: int | None,
+    caminho: str,
+    progresso=None,
+    config: ConfigPlano | None = None
+) -> list[str]:
+    """
+    exportar_plano a partir das corridas em disco: Excel em streaming até
+    o limite de linhas da aba Detalhes, formatos colunares com tudo.
+    """
+    config = config or ConfigPlano.padrao()
+    no_excel = combinacoes_no_excel(len(completo), config)
+    
+    try:
+        exportar_excel_streaming(
+            resultados=islice(completo.ordenados(), no_excel),
+            largura=largura,
+            ancora=ancora,
+            espessura=espessura,
+            tipo=tipo,
+            caminho=caminho,
+            qtd_bobinas=qtd_bobinas,
+            peso_total=peso_total,
+            limite_cortes=limite_cortes,
+            total_combinacoes=no_excel,
+            progresso=progresso,
+            config=config
+        )
+    except BaseException:
+        descartar_reserva(caminho)
+        raise
+    gravados = [caminho]
+    
+    if FORMATOS_COLUNARES:
+        gravados += exportar_colunar_em_blocos(
+            resultados=completo.ordenados(),
+            largura=largura,
             ancora=ancora,
             espessura=espessura,
             tipo=tipo,
-            caminho=caminho_completo,
+            caminho_base=os.path.splitext(caminho)[0],
             qtd_bobinas=qtd_bobinas,
             peso_total=peso_total,
-            limite_cortes=limite_cortes
+            limite_cortes=limite_cortes,
+            formatos=FORMATOS_COLUNARES,
+            config=config
+        )
+    
+    return gravados
+
+
+# Exportações em segundo plano ainda não concluídas (para aguardar na saída):
+# cada uma sai da lista ao terminar. A numeração (#1, #2, ...) vem de um
+# contador próprio, seguro entre threads.
+EXPORTACOES_EM_ANDAMENTO = []
+_NUMERO_EXPORTACAO = count(1)
+
+
+def exportar_em_segundo_plano(executor, **kwargs):
+    """
+    Enfileira exportar_plano em uma thread de trabalho e retorna na hora.
+    
+    Enquanto o arquivo é gravado, o terminal fica livre para a próxima
+    consulta. O progresso é informado a cada 25% e, ao terminar, uma
+    mensagem de conclusão (ou de erro) é exibida.
+    
+    ENTRADA:
+        executor: concurrent.futures.ThreadPoolExecutor
+        kwargs: argumentos de exportar_plano
+    
+    SAÍDA:
+        Future com a lista de arquivos gravados
+    """
+    numero = next(_NUMERO_EXPORTACAO)
+    ancora = kwargs['ancora']
+    
+    # Caminho reservado já na thread principal: o nome com timestamp
+    # reflete o momento da consulta, não o da gravação
+    if kwargs.get('caminho') is None:
+        kwargs['caminho'] = reservar_caminho_saida(
+            ancora, kwargs['espessura'], kwargs['tipo'], kwargs['largura']
+        )
+    
+    ultimo_marco = [0]
+    
+    def progresso(feitas, total):
+        if not total:
+            return
+        marco = int(feitas * 100 / total) // 25 * 25
+        if marco > ultimo_marco[0] and marco < 100:
+            ultimo_marco[0] = marco
+            print(f"\n  … Exportação #{numero} ({ancora}): {marco}%")
+    
+    inicio = time.perf_counter()
+    future = executor.submit(exportar_plano, progresso=progresso, **kwargs)
+    
+    def concluida(f):
+        try:
+            EXPORTACOES_EM_ANDAMENTO.remove(f)
+        except ValueError:
+            pass
+        if f.exception() is not None:
+            print(f"\n  ✗ Exportação #{numero} ({ancora}) falhou: {f.exception()}")
+        else:
+            print(f"\n  ✓ Exportação #{numero} ({ancora}) concluída em "
+                  f"{time.perf_counter() - inicio:.1f} s → {f.result()[0]}")
+    
+    # Na lista antes do callback: se a exportação já terminou, o callback
+    # roda agora mesmo e já encontra o future para retirar
+    EXPORTACOES_EM_ANDAMENTO.append(future)
+    future.add_done_callback(concluida)
+    print(f"\n  → Exportação #{numero} enviada para segundo plano: {kwargs['caminho']}")
+    
+    return future
+
+
+# ================================================================================
+# BLOCO 9: FUNÇÃO PRINCIPAL (MAIN)
+# ================================================================================
+
+def executar_consulta(
+    df: pd.DataFrame,
+    executor,
+    mostrar_contadores: bool = False,
+    perfil: 'PerfilExecucao | None' = None,
+    config: ConfigPlano | None = None
+) -> None:
+    """
+    Uma consulta completa: menu → busca → terminal → exportação.
+    
+    ENTRADA:
+        df: catálogo já carregado
+        executor: pool de threads onde a exportação é enfileirada
+        mostrar_contadores: exibe os contadores do motor após a tabela (--stats)
+        perfil: mede cada etapa (--perfil); a exportação passa a ser feita
+                na própria thread, para entrar na medição e no cProfile
+        config: regras da consulta (None = ConfigPlano.padrao())
+    """
+    config = config or ConfigPlano.padrao()
+    
+    # ── Interface com usuário ──
+    with etapa_perfil(perfil, 'menu'):
+        espessura, tipo, ancora, limite_cortes, qtd_bobinas, peso_total = menu_usuario(df, config=config)
+    
+    # ── Busca combinações ──
+    print(f"\n  Buscando combinações para:")
+    print(f"    Âncora: {ancora} | Espessura: {espessura} mm | Tipo: {tipo}")
+    if limite_cortes:
+        print(f"    Limite de cortes: {limite_cortes}")
+    
+    contadores = {} if mostrar_contadores else None
+    destino = BufferResultados(config=config) if config.modo_orcamento == 'disco' else None
+    with etapa_perfil(perfil, 'busca'):
+        try:
+            df_resultados, largura_usada = encontrar_combinacoes(
+                df=df,
+                espessura=espessura,
+                tipo_material=tipo,
+                matriz_ancora=ancora,
+                limite_cortes=limite_cortes,
+                contadores=contadores,
+                destino=destino,
+                config=config
+            )
+        except BaseException:
+            if destino is not None:
+                destino.fechar()
+            raise
+    
+    # Sem derramar, o DataFrame já tem tudo: o buffer não é mais necessário
+    if destino is not None and not destino.derramado:
+        destino.fechar()
+        destino = None
+    
+    # ── KG de todas as matrizes/combinações, calculado uma única vez ──
+    with etapa_perfil(perfil, 'kg'):
+        df_resultados, df_detalhes = anexar_kg(df_resultados, largura_usada, qtd_bobinas, peso_total)
+    
+    # ── Exibe no terminal ──
+    with etapa_perfil(perfil, 'exibicao'):
+        exibir_terminal(
+            df_res=df_resultados,
+            largura=largura_usada,
+            ancora=ancora,
+            espessura=espessura,
+            tipo=tipo,
+            limite_cortes=limite_cortes,
+            config=config
         )
+    if mostrar_contadores:
+        exibir_contadores(contadores)
+    
+    if df_resultados.empty:
+        return
+    
+    # ── Com perfil: exporta aqui mesmo, dentro da medição ──
+    if perfil is not None:
+        with etapa_perfil(perfil, 'exportacao'):
+            exportar_plano(
+                df_res=df_resultados,
+                df_detalhes=df_detalhes,
+                largura=largura_usada,
+                ancora=ancora,
+                espessura=espessura,
+                tipo=tipo,
+                qtd_bobinas=qtd_bobinas,
+                peso_total=peso_total,
+                limite_cortes=limite_cortes,
+                completo=destino,
+                config=config
+            )
+        return
+    
+    # ── Exporta em segundo plano ──
+    exportar_em_segundo_plano(
+        executor=executor,
+        df_res=df_resultados,
+        df_detalhes=df_detalhes,
+        largura=largura_usada,
+        ancora=ancora,
+        espessura=espessura,
+        tipo=tipo,
+        qtd_bobinas=qtd_bobinas,
+        peso_total=peso_total,
+        limite_cortes=limite_cortes,
+        completo=destino,
+        config=config
+    )
+
+
+def main(argv: list[str] | None = None):
+    """
+    Função principal que coordena toda a execução.
+    
+    MODOS (linha de comando):
+        (sem argumentos)         menu interativo, descrito abaixo
+        --lote ARQ [--processos N] [--saida PASTA]
+                                 processa um arquivo de consultas (ver BLOCO 10)
+        --sessao                 sessão interativa: troca um parâmetro e
+                                 recalcula na hora (ver BLOCO 11)
+        --servidor [--host H] [--porta P] [--processos N]
+                                 serviço HTTP/JSON local (ver BLOCO 12)
+        --demanda ARQ [--peso-bobina KG] [--saida PASTA]
+                                 plano de produção para uma carteira de
+                                 pedidos em kg por matriz (ver BLOCO 14)
+        --demanda ARQ --estoque ARQ
+                                 padrão de corte de cada bobina física do
+                                 estoque para a carteira (ver BLOCO 16)
+        --atlas [--processos N]  viabilidade de todas as matrizes em todas
+                                 as larguras (ver BLOCO 17)
+        --sensibilidade [--perdas-min G] [--perdas-max G] [--larguras G]
+                        [--espessura E] [--tipo T] [--ancora A]
+                                 válidas e melhor perda em cada janela de
+                                 perda × largura da grade (G = '0.5,1' ou
+                                 '0.5:2:0.1'), para uma âncora, uma
+                                 espessura ou o catálogo (ver BLOCO 19)
+        --largura-otima [INICIO:FIM] [--objetivo validas|perda]
+                        [--espessura E] [--tipo T] [--ancora A]
+                                 avalia cada largura inteira da faixa
+                                 (padrão: FAIXA_LARGURA_OTIMA) e ordena
+                                 pelo objetivo (ver BLOCO 20)
+        --catalogo ARQ           usa outro arquivo de matrizes (padrão:
+                                 BASE_INPUT/db_plano_corte.xlsx)
+        --stats                  contadores do motor (candidatos, rejeições,
+                                 tempos por etapa) no menu, na sessão e no
+                                 serviço HTTP
+        --perfil [--cprofile]    tempo de parede e de CPU por etapa (carga,
+                                 menu, busca, kg, exibição, exportação) e,
+                                 com --cprofile, o pstats da execução, gravados
+                                 em BASE_OUTPUT (ver BLOCO 18)
+        --memoria                com --perfil: pico de memória por etapa
+                                 (tracemalloc)
+        --orcamento-mb MB        orçamento de memória da busca (0 = sem
+                                 limite; padrão: ORCAMENTO_MEMORIA_MB)
+        --modo-orcamento top_k|disco
+                                 orçamento estourado: só as melhores, ou
+                                 todas via disco na exportação (menu e lote)
+    
+    FLUXO (interativo):
+        1. Carrega banco de dados (uma vez)
+        2. Coleta informações do usuário via menu
+        3. Busca combinações válidas
+        4. Exibe resultados no terminal
+        5. Exporta para Excel (+ formatos colunares) em SEGUNDO PLANO
+        6. Oferece nova consulta sem esperar a exportação terminar
+    """
+    import argparse
+    from concurrent.futures import ThreadPoolExecutor, wait
+    
+    parser = argparse.ArgumentParser(description="Plano de corte — otimizador de combinações de matrizes")
+    parser.add_argument('--catalogo', help="arquivo Excel de matrizes (padrão: BASE_INPUT/db_plano_corte.xlsx)")
+    parser.add_argument('--lote', metavar='ARQ', help="arquivo CSV/JSON de consultas para processar sem menu")
+    parser.add_argument('--processos', type=int, default=None,
+                        help="processos do lote / do serviço (padrão: nº de núcleos)")
+    parser.add_argument('--saida', metavar='PASTA', default=None, help="pasta de saída (padrão: BASE_OUTPUT)")
+    parser.add_argument('--sessao', action='store_true', help="sessão interativa com catálogo e caches em memória")
+    parser.add_argument('--servidor', action='store_true', help="sobe o serviço HTTP local de planejamento (JSON)")
+    parser.add_argument('--host', default='127.0.0.1', help="endereço do serviço (padrão: 127.0.0.1)")
+    parser.add_argument('--porta', type=int, default=8765, help="porta do serviço (padrão: 8765)")
+    parser.add_argument('--demanda', metavar='ARQ', help="CSV/JSON de pedidos (kg por matriz) para o plano de produção")
+    parser.add_argument('--estoque', metavar='ARQ', help="CSV/JSON de bobinas em estoque (usar com --demanda)")
+    parser.add_argument('--peso-bobina', type=float, default=float(PESO_MEDIO_BOB_PAD),
+                        help="peso de cada bobina no plano por demanda (padrão: PESO_MEDIO_BOB_PAD)")
+    parser.add_argument('--atlas', action='store_true', help="gera o atlas de viabilidade do catálogo inteiro")
+    parser.add_argument('--sensibilidade', action='store_true',
+                        help="varre janelas de perda e larguras (válidas e melhor perda por cenário)")
+    parser.add_argument('--largura-otima', metavar='FAIXA', nargs='?',
+                        const=f"{FAIXA_LARGURA_OTIMA[0]}:{FAIXA_LARGURA_OTIMA[1]}",
+                        help="avalia todas as larguras da faixa (ex.: 900:1600) e ordena pelo objetivo")
+    parser.add_argument('--objetivo', choices=('validas', 'perda'), default='validas',
+                        help="largura ótima: mais válidas ou menor perda média (padrão: validas)")
+    parser.add_argument('--perdas-min', metavar='GRADE', help="perdas mínimas em %% (ex.: 0.5,0.67 ou 0.3:1:0.1)")
+    parser.add_argument('--perdas-max', metavar='GRADE', help="perdas máximas em %% (ex.: 1.7,2.0 ou 1:2.5:0.1)")
+    parser.add_argument('--larguras', metavar='GRADE', help="larguras de bobina candidatas em mm (ex.: 1200,1250)")
+    parser.add_argument('--espessura', type=float, help="escopo da varredura / largura ótima: espessura (mm)")
+    parser.add_argument('--tipo', help="escopo da varredura / largura ótima: tipo de material")
+    parser.add_argument('--ancora', help="escopo da varredura / largura ótima: matriz âncora")
+    parser.add_argument('--stats', action='store_true',
+                        help="mostra/retorna os contadores do motor (candidatos, rejeições, tempos)")
+    parser.add_argument('--perfil', action='store_true',
+                        help="mede parede/CPU por etapa e grava o relatório em BASE_OUTPUT")
+    parser.add_argument('--cprofile', action='store_true',
+                        help="com --perfil: grava também o pstats (cProfile) da execução")
+    parser.add_argument('--memoria', action='store_true',
+                        help="com --perfil: mede o pico de memória por etapa (tracemalloc)")
+    parser.add_argument('--orcamento-mb', type=float, default=None,
+                        help="orçamento de memória da busca em MB (0 = sem limite)")
+    parser.add_argument('--modo-orcamento', choices=('top_k', 'disco'), default=None,
+                        help="orçamento estourado: guarda só as melhores (top_k) ou derrama em disco")
+    args = parser.parse_args(argv)
+    if args.estoque and not args.demanda:
+        parser.error("--estoque requer --demanda (matrizes alvo e kg pedidos)")
+    
+    # Regras da execução: vão como dado para as consultas e os processos de
+    # trabalho (as constantes do módulo não mudam)
+    config = ConfigPlano.padrao()
+    if args.orcamento_mb is not None:
+        config = config.com(orcamento_memoria_mb=args.orcamento_mb or None)
+    if args.modo_orcamento is not None:
+        config = config.com(modo_orcamento=args.modo_orcamento)
+    
+    perfil = (PerfilExecucao(cprofile=args.cprofile, memoria=args.memoria,
+                             orcamento_mb=config.orcamento_memoria_mb)
+              if (args.perfil or args.cprofile or args.memoria) else None)
+    
+    # Modos sem menu, em ordem de prioridade (medidos como uma etapa só)
+    modo = next((m for m in ('servidor', 'sessao', 'atlas', 'sensibilidade', 'largura_otima',
+                             'estoque', 'demanda', 'lote')
+                 if getattr(args, m)), None)
+    
+    try:
+        # ── Carrega banco de dados ──
+        caminho_db = args.catalogo or os.path.join(BASE_INPUT, 'db_plano_corte.xlsx')
+        print(f"\n  Carregando: {caminho_db}")
+        
+        with etapa_perfil(perfil, 'carga'):
+            df = carregar_dados(caminho_db)
+        print(f"  ✓ {len(df)} produtos carregados.")
+        
+        if modo is not None:
+            with etapa_perfil(perfil, modo):
+                executar_modo(modo, args, df, config)
+            return
+        
+        # ── Fila de exportações (várias podem rodar ao mesmo tempo) ──
+        with ThreadPoolExecutor(max_workers=MAX_EXPORTACOES_SIMULTANEAS,
+                                thread_name_prefix='exportacao') as executor:
+            while True:
+                executar_consulta(df, executor, mostrar_contadores=args.stats, perfil=perfil, config=config)
+                
+                resposta = input("\n  Nova consulta? [s/N]: ").strip().lower()
+                if resposta not in ('s', 'sim'):
+                    break
+            
+            # ── Aguarda exportações pendentes antes de sair ──
+            pendentes = [f for f in list(EXPORTACOES_EM_ANDAMENTO) if not f.done()]
+            if pendentes:
+                print(f"\n  Aguardando {len(pendentes)} exportação(ões) em andamento...")
+                wait(pendentes)
+    
+    finally:
+        if perfil is not None:
+            perfil.gravar(args.saida, comando=argv if argv is not None else sys.argv[1:])
+
+
+def executar_modo(modo: str, args, df: pd.DataFrame, config: ConfigPlano | None = None) -> None:
+    """
+    Executa um dos modos sem menu de main (servidor, sessao, atlas,
+    sensibilidade, largura_otima, estoque, demanda, lote) com os argumentos
+    da linha de comando e as regras da execução (config; None =
+    ConfigPlano.padrao()).
+    """
+    # ── Serviço HTTP local ──
+    if modo == 'servidor':
+        servir(df, args.host, args.porta, args.processos, contadores=args.stats, config=config)
+    
+    # ── Sessão interativa: catálogo e caches ficam em memória ──
+    elif modo == 'sessao':
+        sessao_interativa(df, contadores=args.stats, config=config)
+    
+    # ── Atlas de viabilidade ──
+    elif modo == 'atlas':
+        gerar_atlas(df, args.processos, args.saida, config)
+    
+    # ── Sensibilidade: janelas de perda × larguras ──
+    elif modo == 'sensibilidade':
+        varrer_sensibilidade(
+            df,
+            perdas_min=ler_grade(args.perdas_min) if args.perdas_min else None,
+            perdas_max=ler_grade(args.perdas_max) if args.perdas_max else None,
+            larguras=ler_grade(args.larguras, int) if args.larguras else None,
+            espessura=args.espessura, tipo=args.tipo, ancora=args.ancora,
+            processos=args.processos, pasta_saida=args.saida, config=config,
+        )
+    
+    # ── Largura ótima: todas as larguras de uma faixa ──
+    elif modo == 'largura_otima':
+        buscar_largura_otima(
+            df, larguras=ler_grade(args.largura_otima, int), objetivo=args.objetivo,
+            espessura=args.espessura, tipo=args.tipo, ancora=args.ancora,
+            processos=args.processos, pasta_saida=args.saida, config=config,
+        )
+    
+    # ── Bobinas do estoque para a carteira ──
+    elif modo == 'estoque':
+        processar_estoque(df, ler_estoque(args.estoque), ler_demanda(args.demanda), args.saida, config)
+    
+    # ── Plano de produção por demanda ──
+    elif modo == 'demanda':
+        processar_demanda(df, ler_demanda(args.demanda), args.peso_bobina, args.saida, config)
+    
+    # ── Modo lote: sem menu ──
+    elif modo == 'lote':
+        jobs = ler_lote(args.lote)
+        processar_lote(df, jobs, processos=args.processos, pasta_saida=args.saida, config=config)
+
+
+# ================================================================================
+# BLOCO 10: PROCESSAMENTO EM LOTE (SEM MENU)
+# ================================================================================
+
+# Colunas do arquivo de lote (as três últimas são opcionais)
+COLUNAS_LOTE = ['espessura', 'tipo', 'ancora', 'limite_cortes', 'qtd_bobinas', 'peso_total']
+
+
+def ler_lote(caminho: str) -> list[dict]:
+    """
+    Lê o arquivo de consultas do lote (CSV ou JSON).
+    
+    FORMATO:
+        CSV  (separador , ou ;) com cabeçalho:
+            espessura;tipo;ancora;limite_cortes;qtd_bobinas;peso_total
+            2.0;COMERCIAL;184 - [2.00];;2;24000
+        JSON: lista de objetos com as mesmas chaves
+            [{"espessura": 2.0, "tipo": "COMERCIAL", "ancora": "184 - [2.00]"}]
+    
+        limite_cortes, qtd_bobinas e peso_total podem ficar vazios
+        (sem limite / QTD_BOBINAS_PAD / PESO_MEDIO_BOB_PAD).
+    
+    SAÍDA:
+        Lista de dicts normalizados, um por consulta, com a chave 'job'
+        (número sequencial a partir de 1)
+    
+    ERRO:
+        ValueError se faltar coluna obrigatória, se o arquivo não tiver
+        nenhuma consulta ou se uma linha tiver campo obrigatório vazio,
+        valor não numérico, limite_cortes < 1, qtd_bobinas < 1 ou
+        peso_total ≤ 0 (a mensagem indica o job)
+    """
+    if caminho.lower().endswith('.json'):
+        tabela = pd.read_json(caminho, orient='records', dtype=False)
+    else:
+        tabela = pd.read_csv(caminho, sep=None, engine='python', dtype=str)
+    
+    tabela.columns = [str(c).strip().lower() for c in tabela.columns]
+    faltando = [c for c in COLUNAS_LOTE[:3] if c not in tabela.columns]
+    if faltando:
+        raise ValueError(f"Arquivo de lote sem as colunas obrigatórias: {', '.join(faltando)}")
+    
+    if tabela.empty:
+        raise ValueError(f"Arquivo de lote sem consultas: {caminho}")
+    
+    def campo(n, linha, coluna, conv=str, padrao=None, obrigatorio=False):
+        v = linha.get(coluna)
+        if v is None or (isinstance(v, float) and pd.isna(v)) or str(v).strip() == '':
+            if obrigatorio:
+                raise ValueError(f"Lote, job {n}: {coluna} é obrigatório")
+            return padrao
+        texto = str(v).strip()
+        try:
+            return conv(texto.replace(',', '.')) if conv is not str else texto
+        except ValueError:
+            raise ValueError(f"Lote, job {n}: {coluna} deve ser numérico (recebido {texto!r})") from None
+    
+    def inteiro(texto):
+        return int(float(texto))
+    
+    jobs = []
+    for n, linha in enumerate(tabela.to_dict('records'), start=1):
+        job = {
+            'job': n,
+            'espessura': campo(n, linha, 'espessura', float, obrigatorio=True),
+            'tipo': campo(n, linha, 'tipo', obrigatorio=True),
+            'ancora': campo(n, linha, 'ancora', obrigatorio=True),
+            'limite_cortes': campo(n, linha, 'limite_cortes', inteiro),
+            'qtd_bobinas': campo(n, linha, 'qtd_bobinas', inteiro, QTD_BOBINAS_PAD),
+            'peso_total': campo(n, linha, 'peso_total', float, float(PESO_MEDIO_BOB_PAD)),
+        }
+        
+        # Valores que quebrariam a busca ou o cálculo de KG (divisão por zero / peso negativo)
+        if job['limite_cortes'] is not None and job['limite_cortes'] < 1:
+            raise ValueError(f"Lote, job {n}: limite_cortes deve ser ≥ 1 (recebido {job['limite_cortes']})")
+        if job['qtd_bobinas'] < 1:
+            raise ValueError(f"Lote, job {n}: qtd_bobinas deve ser ≥ 1 (recebido {job['qtd_bobinas']})")
+        if job['peso_total'] <= 0:
+            raise ValueError(f"Lote, job {n}: peso_total deve ser > 0 (recebido {job['peso_total']})")
+        jobs.append(job)
+    
+    return jobs
+
+
+# Catálogo do processo de trabalho (carregado uma vez por processo)
+_CATALOGO_LOTE = None
+
+
+def _inicializar_processo_lote(df: pd.DataFrame) -> None:
+    """Initializer do pool: recebe o catálogo uma única vez por processo."""
+    global _CATALOGO_LOTE
+    _CATALOGO_LOTE = df
+
+
+def processar_job(
+    job: dict,
+    pasta_saida: str | None = None,
+    df: pd.DataFrame | None = None,
+    config: ConfigPlano | None = None
+) -> dict:
+    """
+    Executa UMA consulta do lote: busca, KG e exportação do plano.
+    
+    ENTRADA:
+        job: dict de ler_lote
+        pasta_saida: onde gravar o plano (None = BASE_OUTPUT)
+        df: catálogo (None = o carregado no processo pelo initializer)
+        config: regras das consultas (None = ConfigPlano.padrao())
+    
+    SAÍDA:
+        Linha do resumo consolidado (dict). Erros da consulta (ex: âncora
+        inexistente, ou qualquer outra exceção) não derrubam o lote: ficam
+        na coluna 'Erro'.
+    """
+    df = _CATALOGO_LOTE if df is None else df
+    config = config or ConfigPlano.padrao()
+    inicio = time.perf_counter()
+    
+    resumo = {
+        'Job': job['job'],
+        'Espessura': job['espessura'],
+        'Tipo': job['tipo'],
+        'Ancora': job['ancora'],
+        'Limite_cortes': job['limite_cortes'],
+        'Qtd_bobinas': job['qtd_bobinas'],
+        'Peso_total': job['peso_total'],
+        'Largura_bobina': 0,
+        'Total': 0,
+        'Validas': 0,
+        'Fora_regra': 0,
+        'Melhor_perda_pct': None,
+        'Melhor_combinacao': None,
+        'Mais_proxima': None,
+        'Arquivo': None,
+        'Tempo_s': None,
+        'Erro': None,
+    }
+    
+    destino = BufferResultados(config=config) if config.modo_orcamento == 'disco' else None
+    try:
+        df_res, largura = encontrar_combinacoes(
+            df=df,
+            espessura=job['espessura'],
+            tipo_material=job['tipo'],
+            matriz_ancora=job['ancora'],
+            limite_cortes=job['limite_cortes'],
+            verbose=False,
+            destino=destino,
+            config=config
+        )
+        
+        if not df_res.empty:
+            df_res, df_det = anexar_kg(df_res, largura, job['qtd_bobinas'], job['peso_total'])
+            stats = validar_resultado(df_res, job['espessura'], config)
+            
+            caminho = reservar_caminho_saida(job['ancora'], job['espessura'], job['tipo'], largura,
+                                             pasta=pasta_saida)
+            exportar_plano(
+                df_res=df_res,
+                df_detalhes=df_det,
+                largura=largura,
+                ancora=job['ancora'],
+                espessura=job['espessura'],
+                tipo=job['tipo'],
+                qtd_bobinas=job['qtd_bobinas'],
+                peso_total=job['peso_total'],
+                limite_cortes=job['limite_cortes'],
+                caminho=caminho,
+                completo=destino if destino is not None and destino.derramado else None,
+                config=config
+            )
+            
+            resumo.update({
+                'Largura_bobina': largura,
+                'Total': stats['total'],
+                'Validas': stats['validas'],
+                'Fora_regra': stats['fora_regra'],
+                'Melhor_perda_pct': df_res.iloc[0]['Perda_pct'],
+                'Melhor_combinacao': df_res.iloc[0]['Combinacao'],
+                'Arquivo': os.path.basename(caminho),
+            })
+        elif not df_res.attrs.get('proximas', pd.DataFrame()).empty:
+            # Sem combinação na janela: a mais próxima, para decidir uma exceção
+            proxima = df_res.attrs['proximas'].sort_values('Desvio_pct').iloc[0]
+            resumo['Mais_proxima'] = f"{proxima['Combinacao']} | {proxima['Status']}"
+    except ValueError as e:
+        resumo['Erro'] = str(e)
+    except Exception as e:
+        # Erro inesperado numa consulta também não derruba o lote nem o resumo
+        resumo['Erro'] = f"{type(e).__name__}: {e}"
+    finally:
+        if destino is not None:
+            destino.fechar()
+    
+    resumo['Tempo_s'] = round(time.perf_counter() - inicio, 3)
+    return resumo
+
+
+def processar_lote(
+    df: pd.DataFrame,
+    jobs: list[dict],
+    processos: int | None = None,
+    pasta_saida: str | None = None,
+    config: ConfigPlano | None = None
+) -> pd.DataFrame:
+    """
+    Processa todas as consultas do lote em paralelo (pool de processos).
+    
+    O catálogo é carregado UMA vez (pelo chamador) e enviado a cada
+    processo de trabalho no initializer; cada consulta grava o seu próprio
+    plano e, no fim, é gravado um resumo consolidado:
+        resumo_lote_<timestamp>.xlsx / .csv  (uma linha por consulta)
+    
+    ENTRADA:
+        df: catálogo já carregado
+        jobs: consultas de ler_lote
+        processos: nº de processos (None = nº de núcleos; 1 = sem pool)
+        pasta_saida: pasta dos planos e do resumo (None = BASE_OUTPUT)
+        config: regras de todas as consultas (None = ConfigPlano.padrao())
+    
+    SAÍDA:
+        DataFrame do resumo consolidado (vazio, sem gravar arquivos, se
+        não houver consultas)
+    """
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    from functools import partial
+    
+    pasta_saida = pasta_saida or BASE_OUTPUT
+    inicio = time.perf_counter()
+    print(f"\n  Lote: {len(jobs)} consultas")
+    if not jobs:
+        print("  ⚠ Lote sem consultas: nada a processar.")
+        return pd.DataFrame()
+    
+    resumos = []
+    if processos == 1:
+        for job in jobs:
+            resumos.append(processar_job(job, pasta_saida, df, config))
+            print(f"    [{len(resumos)}/{len(jobs)}] job {job['job']} ({job['ancora']}) ✓")
+    else:
+        with ProcessPoolExecutor(max_workers=processos,
+                                 initializer=_inicializar_processo_lote,
+                                 initargs=(df,)) as executor:
+            tarefas = {
+                executor.submit(partial(processar_job, pasta_saida=pasta_saida, config=config), job): job
+                for job in jobs
+            }
+            for tarefa in as_completed(tarefas):
+                job = tarefas[tarefa]
+                resumos.append(tarefa.result())
+                print(f"    [{len(resumos)}/{len(jobs)}] job {job['job']} ({job['ancora']}) ✓")
+    
+    df_resumo = pd.DataFrame(resumos).sort_values('Job').reset_index(drop=True)
+    df_resumo['Limite_cortes'] = df_resumo['Limite_cortes'].astype('Int64')
+    
+    # ── Resumo consolidado ──
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    caminho_resumo = os.path.join(pasta_saida, f"resumo_lote_{timestamp}")
+    os.makedirs(pasta_saida, exist_ok=True)
+    df_resumo.to_excel(caminho_resumo + '.xlsx', index=False, sheet_name='Resumo')
+    df_resumo.to_csv(caminho_resumo + '.csv', index=False, encoding='utf-8')
+    
+    erros = df_resumo['Erro'].notna().sum()
+    sem_resultado = ((df_resumo['Total'] == 0) & df_resumo['Erro'].isna()).sum()
+    print(f"\n  ✓ Lote concluído em {time.perf_counter() - inicio:.1f} s "
+          f"({len(jobs) - erros - sem_resultado} com plano, {sem_resultado} sem combinação, {erros} com erro)")
+    print(f"  ✓ Resumo: {caminho_resumo}.xlsx")
+    
+    return df_resumo
+
+
+# ================================================================================
+# BLOCO 11: MOTOR EM MEMÓRIA E SESSÃO INTERATIVA
+# ================================================================================
+
+class MotorPlanejamento:
+    """
+    Catálogo carregado + índices + cache de consultas, mantidos em memória.
+    
+    Substitui as filtragens repetidas de encontrar_combinacoes (máscaras e
+    groupby sobre o catálogo inteiro a cada consulta) por dicionários
+    montados uma vez, e guarda o resultado das buscas para que repetir ou
+    variar só o peso/quantidade de bobinas seja instantâneo.
+    
+    ÍNDICES:
+        grupos: (espessura, tipo) → DataFrame [Matriz, Dev_mm] (= listar_matrizes)
+        devs:   (matriz, espessura) → desenvolvimento médio (= obter_desenvolvimento)
+        indice_ancoras: busca por nome/produto/código (= montar_indice_ancoras)
+    
+    CACHE (LRU, até MAX_CONSULTAS_EM_CACHE):
+        (config, espessura, tipo, ancora, limite_cortes) → (df_res sem KG, largura, contadores)
+        O KG depende só de peso/quantidade e é recalculado (vetorizado) a cada consulta.
+        A ConfigPlano faz parte da chave: consultas com regras diferentes
+        (janela de perda, larguras...) nunca trocam resultados entre si.
+    
+    CONTADORES:
+        MotorPlanejamento(df, contadores=True) coleta os contadores do motor
+        em cada busca real (ver novos_contadores); eles ficam no cache junto
+        com o resultado e voltam em consultar()['contadores'].
+    
+    Seguro para uso por várias threads (serviço HTTP).
+    """
+    
+    def __init__(self, df: pd.DataFrame, contadores: bool = False):
+        self.df = df
+        self.coletar_contadores = contadores
+        
+        medias = (
+            df.groupby(['Espessura', 'Tipo de material', 'Matriz'])['Desenvolvimento']
+            .mean()
+            .reset_index()
+            .rename(columns={'Desenvolvimento': 'Dev_mm'})
+        )
+        self.grupos = {
+            (esp, tipo): (
+                grupo[['Matriz', 'Dev_mm']]
+                .sort_values('Dev_mm', ascending=False)
+                .reset_index(drop=True)
+            )
+            for (esp, tipo), grupo in medias.groupby(['Espessura', 'Tipo de material'])
+        }
+        self.devs = df.groupby(['Matriz', 'Espessura'])['Desenvolvimento'].mean().to_dict()
+        self.indice_ancoras = montar_indice_ancoras(df)
+        
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.acertos_cache = 0
+        self.buscas = 0
+    
+    def listar_matrizes(self, espessura: float, tipo: str) -> pd.DataFrame:
+        """Mesmo resultado de listar_matrizes(df, ...), direto do índice."""
+        return self.grupos.get((espessura, tipo), pd.DataFrame(columns=['Matriz', 'Dev_mm']))
+    
+    def buscar(
+        self,
+        espessura: float,
+        tipo: str,
+        ancora: str,
+        limite_cortes: int | None = None,
+        executor=None,
+        cancelar: threading.Event | None = None,
+        parcial=None,
+        config: ConfigPlano | None = None
+    ) -> tuple[pd.DataFrame, int, bool, dict | None]:
+        """
+        Equivalente a encontrar_combinacoes, usando índices e cache.
+        
+        ENTRADA:
+            executor: pool de processos opcional (ver iniciar_pool_motor);
+                      se informado, a busca pesada roda em outro processo e
+                      só o resultado volta para o cache deste motor
+            cancelar / parcial: ver buscar_nas_larguras (só na própria thread,
+                      sem executor); busca cancelada não entra no cache
+            config: regras da consulta (None = ConfigPlano.padrao())
+        
+        SAÍDA:
+            (df_res, largura_usada, veio_do_cache, contadores)
+            contadores: None se o motor foi criado sem contadores
+        
+        ERRO:
+            ValueError se a âncora não existir na espessura
+        """
+        config = config or ConfigPlano.padrao()
+        chave = (config, espessura, tipo, ancora, limite_cortes)
+        with self._lock:
+            if chave in self._cache:
+                self._cache.move_to_end(chave)
+                self.acertos_cache += 1
+                df_res, largura, contadores = self._cache[chave]
+                return df_res, largura, True, contadores
+        
+        if executor is not None:
+            df_res, largura, contadores = executor.submit(
+                _buscar_no_processo, espessura, tipo, ancora, limite_cortes, self.coletar_contadores, config
+            ).result()
+        else:
+            contadores = {} if self.coletar_contadores else None
+            df_res, largura = self._buscar_sem_cache(espessura, tipo, ancora, limite_cortes,
+                                                     cancelar, parcial, contadores, config)
+        
+        with self._lock:
+            self.buscas += 1
+            self._cache[chave] = (df_res, largura, contadores)
+            self._cache.move_to_end(chave)
+            while len(self._cache) > MAX_CONSULTAS_EM_CACHE:
+                self._cache.popitem(last=False)
+        
+        return df_res, largura, False, contadores
+    
+    def _buscar_sem_cache(
+        self,
+        espessura: float,
+        tipo: str,
+        ancora: str,
+        limite_cortes: int | None,
+        cancelar: threading.Event | None = None,
+        parcial=None,
+        contadores: dict | None = None,
+        config: ConfigPlano | None = None
+    ) -> tuple[pd.DataFrame, int]:
+        """Busca de fato (sem cache), usando os índices."""
+        dev_ancora = self.devs.get((ancora, espessura))
+        if dev_ancora is None:
+            raise MatrizNaoEncontrada(f"Matriz '{ancora}' com espessura {espessura} mm não encontrada.")
+        
+        grupo = self.listar_matrizes(espessura, tipo)
+        comp = grupo[grupo['Matriz'] != ancora]
+        
+        return buscar_nas_larguras(
+            dev_ancora=dev_ancora,
+            matriz_ancora=ancora,
+            matrizes_comp=comp['Matriz'].tolist(),
+            devs_comp=comp['Dev_mm'].tolist(),
+            espessura=espessura,
+            limite_cortes=limite_cortes,
+            verbose=False,
+            cancelar=cancelar,
+            parcial=parcial,
+            contadores=contadores,
+            config=config
+        )
+    
+    def consultar(
+        self,
+        espessura: float,
+        tipo: str,
+        ancora: str,
+        limite_cortes: int | None = None,
+        qtd_bobinas: int = QTD_BOBINAS_PAD,
+        peso_total: float = PESO_MEDIO_BOB_PAD,
+        executor=None,
+        cancelar: threading.Event | None = None,
+        parcial=None,
+        config: ConfigPlano | None = None
+    ) -> dict:
+        """
+        Consulta completa (busca + KG) com tempos por etapa.
+        executor / cancelar / parcial / config: ver buscar()
+        
+        SAÍDA:
+            {
+                'df_res': DataFrame com 'Qtd_KG',
+                'df_detalhes': tabela de anexar_kg,
+                'largura': 1200,
+                'cache': True/False,
+                'tempos_ms': {'busca': 0.1, 'kg': 3.2, 'total': 3.3},
+                'contadores': {largura: novos_contadores()} ou None
+            }
+        """
+        inicio = time.perf_counter()
+        df_res, largura, do_cache, contadores = self.buscar(espessura, tipo, ancora, limite_cortes,
+                                                            executor, cancelar, parcial, config)
+        t_busca = time.perf_counter()
+        
+        df_res, df_det = anexar_kg(df_res, largura, qtd_bobinas, peso_total)
+        t_kg = time.perf_counter()
+        
+        return {
+            'df_res': df_res,
+            'df_detalhes': df_det,
+            'largura': largura,
+            'cache': do_cache,
+            'tempos_ms': {
+                'busca': round((t_busca - inicio) * 1000, 2),
+                'kg': round((t_kg - t_busca) * 1000, 2),
+                'total': round((t_kg - inicio) * 1000, 2),
+            },
+            'contadores': contadores,
+        }
+
+
+# Motor do processo de trabalho (pool de buscas pesadas)
+_MOTOR_PROCESSO = None
+
+
+def _inicializar_processo_motor(df: pd.DataFrame) -> None:
+    """Initializer do pool: cada processo monta o seu motor uma única vez."""
+    global _MOTOR_PROCESSO
+    _MOTOR_PROCESSO = MotorPlanejamento(df)
+
+
+def _buscar_no_processo(espessura, tipo, ancora, limite_cortes, coletar_contadores=False, config=None):
+    """Busca executada dentro do processo de trabalho: (df_res, largura, contadores)."""
+    contadores = {} if coletar_contadores else None
+    df_res, largura = _MOTOR_PROCESSO._buscar_sem_cache(espessura, tipo, ancora, limite_cortes,
+                                                        contadores=contadores, config=config)
+    return df_res, largura, contadores
+
+
+def iniciar_pool_motor(df: pd.DataFrame, processos: int | None = None):
+    """
+    Cria o pool de processos para buscas pesadas, já com o catálogo carregado
+    em cada processo.
+    
+    SAÍDA:
+        concurrent.futures.ProcessPoolExecutor (encerrar com .shutdown())
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    return ProcessPoolExecutor(max_workers=processos,
+                               initializer=_inicializar_processo_motor,
+                               initargs=(df,))
+
+
+AJUDA_SESSAO = """
+  Comandos (troque só o que mudou e a consulta é refeita na hora):
+    a <busca|nº>  nova âncora (código ou trecho do nome/produto; nº escolhe
+                  da lista de sugestões mostrada logo antes)
+    l <n|->       limite de cortes  ( - = sem limite )
+    b <n>         quantidade de bobinas
+    p <kg>        peso total do lote
+    j <min> <max> janela de perda em %  ( ex: j 0.5 2.0 )
+    w <larguras>  larguras de bobina, na ordem de tentativa  ( ex: w 1200,1500 )
+    n <n>         máximo de complementares na combinação
+    m             refazer o menu completo (espessura, tipo, ...)
+    x             exportar a consulta atual (segundo plano)
+    c             estatísticas do cache
+    ?             esta ajuda
+    s             sair
+"""
+
+
+def sessao_interativa(df: pd.DataFrame, contadores: bool = False, config: ConfigPlano | None = None) -> None:
+    """
+    Sessão interativa: o catálogo, os índices e os resultados ficam em
+    memória entre as consultas.
+    
+    FLUXO:
+        1. Menu completo (menu_usuario) uma vez
+        2. Resultado + tempo da consulta
+        3. Comandos curtos para trocar UM parâmetro (âncora, limite, peso...)
+           e recalcular sem reler o Excel nem refazer índices
+    
+    Repetir uma âncora já consultada (ou só mudar peso/bobinas) usa o cache
+    de MotorPlanejamento: apenas o KG é recalculado.
+    
+    contadores=True (--stats) mostra os contadores do motor após cada consulta.
+    config: regras iniciais (None = ConfigPlano.padrao()); os comandos j/w/n
+    trocam a partir delas.
+    """
+    from concurrent.futures import ThreadPoolExecutor, wait
+    
+    inicio = time.perf_counter()
+    motor = MotorPlanejamento(df, contadores=contadores)
+    print(f"  ✓ Índices montados em {(time.perf_counter() - inicio) * 1000:.0f} ms "
+          f"({len(motor.grupos)} grupos espessura/tipo)")
+    
+    config = config or ConfigPlano.padrao()
+    espessura, tipo, ancora, limite_cortes, qtd_bobinas, peso_total = menu_usuario(df, motor.indice_ancoras, config)
+    print(AJUDA_SESSAO)
+    
+    with ThreadPoolExecutor(max_workers=MAX_EXPORTACOES_SIMULTANEAS,
+                            thread_name_prefix='exportacao') as executor:
+        consulta = None
+        recalcular = True
+        opcoes = []     # sugestões de âncora numeradas pelo último comando 'a'
+        
+        while True:
+            if recalcular:
+                try:
+                    consulta = motor.consultar(espessura, tipo, ancora, limite_cortes, qtd_bobinas, peso_total,
+                                               config=config)
+                except ValueError as e:
+                    print(f"  ⚠ {e}")
+                    consulta = None
+                else:
+                    exibir_terminal(consulta['df_res'], consulta['largura'], ancora, espessura, tipo, limite_cortes,
+                                    config=config)
+                    t = consulta['tempos_ms']
+                    origem = "cache" if consulta['cache'] else "busca"
+                    print(f"  ⏱ {t['total']:.1f} ms  ({origem}: {t['busca']:.1f} ms | KG: {t['kg']:.1f} ms)")
+                    if contadores:
+                        exibir_contadores(consulta['contadores'])
+            recalcular = False
+            
+            entrada = input(f"\n  [{ancora} | esp {espessura} | lim {limite_cortes or '-'} | "
+                            f"{qtd_bobinas} bob | {peso_total:,.0f} kg] > ").strip()
+            if not entrada:
+                continue
+            
+            cmd, _, arg = entrada.partition(' ')
+            cmd, arg = cmd.lower(), arg.strip()
+            escolhas, opcoes = opcoes, []   # a numeração só vale no comando seguinte
+            
+            try:
+                if cmd == 's':
+                    break
+                elif cmd == '?':
+                    print(AJUDA_SESSAO)
+                elif cmd == 'a':
+                    if arg.isdigit() and 1 <= int(arg) <= len(escolhas):
+                        ancora = escolhas[int(arg) - 1]
+                    else:
+                        sugestoes = buscar_ancoras(motor.indice_ancoras, espessura, tipo, arg)
+                        if sugestoes.empty:
+                            raise ValueError(f"matriz '{arg}' não existe em esp {espessura} / {tipo}")
+                        elif sugestoes['Criterio'].iloc[0] in ('código', 'nome') or len(sugestoes) == 1:
+                            ancora = sugestoes.iloc[0]['Matriz']
+                        else:
+                            opcoes = sugestoes['Matriz'].head(8).tolist()
+                            print("  Várias matrizes (a <nº> escolhe):")
+                            for i, matriz in enumerate(opcoes, 1):
+                                print(f"    {i}. {matriz}")
+                            continue
+                    recalcular = True
+                elif cmd == 'l':
+                    limite_cortes = None if arg in ('', '-') else int(arg)
+                    if limite_cortes is not None and limite_cortes < 1:
+                        raise ValueError("limite deve ser positivo")
+                    recalcular = True
+                elif cmd == 'b':
+                    qtd_bobinas = int(arg)
+                    if qtd_bobinas < 1:
+                        raise ValueError("quantidade deve ser positiva")
+                    recalcular = True
+                elif cmd == 'p':
+                    peso_total = float(arg.replace(',', '.').replace('.', '', arg.count('.') - 1))
+                    if peso_total <= 0:
+                        raise ValueError("peso deve ser positivo")
+                    recalcular = True
+                elif cmd == 'j':
+                    minimo, maximo = (float(v.replace(',', '.')) for v in arg.split())
+                    config = config.com(perda_min_pct=minimo, perda_max_pct=maximo)
+                    recalcular = True
+                elif cmd == 'w':
+                    config = config.com(larguras=tuple(int(v) for v in arg.replace(',', ' ').split()))
+                    recalcular = True
+                elif cmd == 'n':
+                    config = config.com(max_complementares=int(arg))
+                    recalcular = True
+                elif cmd == 'm':
+                    espessura, tipo, ancora, limite_cortes, qtd_bobinas, peso_total = menu_usuario(
+                        df, motor.indice_ancoras, config)
+                    recalcular = True
+                elif cmd == 'x':
+                    if consulta is None or consulta['df_res'].empty:
+                        print("  ⚠ Nada para exportar.")
+                    else:
+                        exportar_em_segundo_plano(
+                            executor=executor,
+                            df_res=consulta['df_res'],
+                            df_detalhes=consulta['df_detalhes'],
+                            largura=consulta['largura'],
+                            ancora=ancora,
+                            espessura=espessura,
+                            tipo=tipo,
+                            qtd_bobinas=qtd_bobinas,
+                            peso_total=peso_total,
+                            limite_cortes=limite_cortes,
+                            config=config
+                        )
+                elif cmd == 'c':
+                    print(f"  Cache: {len(motor._cache)} consultas guardadas | "
+                          f"{motor.acertos_cache} acertos | {motor.buscas} buscas reais")
+                else:
+                    print("  ⚠ Comando desconhecido (? = ajuda).")
+            except (ValueError, IndexError) as e:
+                print(f"  ⚠ Inválido: {e}")
+        
+        pendentes = [f for f in list(EXPORTACOES_EM_ANDAMENTO) if not f.done()]
+        if pendentes:
+            print(f"\n  Aguardando {len(pendentes)} exportação(ões) em andamento...")
+            wait(pendentes)
+
+
+# ================================================================================
+# BLOCO 12: SERVIÇO HTTP LOCAL
+# ================================================================================
+
+def resultado_para_json(df_res: pd.DataFrame, df_detalhes: pd.DataFrame, max_combinacoes: int | None = None) -> list[dict]:
+    """
+    Converte o resultado (com KG) em lista de dicts serializável em JSON.
+    
+    Cada combinação leva a sua lista 'Detalhes' (uma entrada por matriz,
+    com Papel e Qtd_KG) montada a partir da tabela de anexar_kg.
+    
+    ENTRADA:
+        max_combinacoes: corta a lista nas N melhores (None = todas)
+    """
+    import json
+    
+    if df_res.empty:
+        return []
+    
+    if max_combinacoes is not None:
+        df_res = df_res.head(max_combinacoes)
+        df_detalhes = df_detalhes[df_detalhes['Combo'] <= max_combinacoes]
+    
+    combos = json.loads(df_res.drop(columns=['Detalhes']).to_json(orient='records', force_ascii=False))
+    detalhes = json.loads(df_detalhes.to_json(orient='records', force_ascii=False))
+    
+    for combo in combos:
+        combo['Detalhes'] = []
+    for det in detalhes:
+        combos[det.pop('Combo') - 1]['Detalhes'].append(det)
+    
+    return combos
+
+
+def criar_servidor(
+    motor: MotorPlanejamento,
+    host: str = '127.0.0.1',
+    porta: int = 8765,
+    executor=None,
+    config: ConfigPlano | None = None
+):
+    """
+    Cria o servidor HTTP de planejamento (JSON) sobre um motor já carregado.
+    
+    ROTAS (GET):
+        /saude                                     → status e nº de produtos
+        /espessuras                                → lista de espessuras
+        /tipos?espessura=2.0                       → tipos da espessura
+        /matrizes?espessura=2.0&tipo=COMERCIAL     → matrizes e desenvolvimentos
+        /ancoras?espessura=2.0&tipo=COMERCIAL&q=50x → sugestões de âncora (buscar_ancoras)
+        /combinacoes?espessura=2.0&tipo=COMERCIAL&ancora=...
+                    [&limite_cortes=8][&qtd_bobinas=2][&peso_total=24000][&max=100]
+                    [&perda_min=0.5][&perda_max=2.0][&larguras=1200,1500][&max_comp=1]
+                    [&sessao=planejador-1]
+                                                   → melhores combinações com KG
+                                                     (regras da própria requisição:
+                                                     ConfigPlano, com cache próprio)
+                                                     (+ 'contadores' do motor, se o
+                                                     motor foi criado com contadores;
+                                                     + 'orcamento' se o resultado foi
+                                                     cortado pelo orçamento de memória)
+        /metricas                                  → tempos por rota e cache
+    
+    ERROS:
+        Parâmetro ausente ou inválido (qtd_bobinas < 1, peso_total ≤ 0,
+        max < 0, largura ≤ 0, max_comp > MAX_COMP_NA_COMBO, janela
+        invertida) → 400; âncora/matriz inexistente → 404; consulta
+        substituída por outra mais nova da mesma sessão → 409.
+    
+    CONCORRÊNCIA:
+        Uma thread por requisição (ThreadingHTTPServer). Buscas que não estão
+        no cache vão para o pool de processos 'executor', se informado.
+        Com 'sessao', a busca passa pelo FrontendAssincrono (threads, sem o
+        pool): uma requisição nova da mesma sessão cancela a anterior, que
+        para no próximo grupo de matrizes e responde 409.
+    
+    ENTRADA:
+        porta: 0 = porta livre escolhida pelo sistema (testes)
+        config: regras base; os parâmetros da requisição trocam a partir
+                delas (None = ConfigPlano.padrao())
+    
+    SAÍDA:
+        ThreadingHTTPServer (use .serve_forever() / .shutdown();
+        a porta real está em .server_address[1]; .server_close() encerra
+        também o front-end assíncrono)
+    """
+    import asyncio
+    import json
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import urlparse, parse_qs
+    
+    base = config or ConfigPlano.padrao()
+    
+    # Consultas com 'sessao': event loop próprio numa thread de fundo
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name='frontend', daemon=True).start()
+    frontend = FrontendAssincrono(motor)
+    metricas = {}
+    lock_metricas = threading.Lock()
+    
+    def registrar(rota, ms, erro):
+        with lock_metricas:
+            m = metricas.setdefault(rota, {'requisicoes': 0, 'erros': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+            m['requisicoes'] += 1
+            m['erros'] += int(erro)
+            m['total_ms'] += ms
+            m['max_ms'] = max(m['max_ms'], ms)
+    
+    def param(q, nome, conv=str, padrao=None, obrigatorio=False):
+        valores = q.get(nome)
+        if not valores or valores[0].strip() == '':
+            if obrigatorio:
+                raise ValueError(f"parâmetro obrigatório ausente: {nome}")
+            return padrao
+        return conv(valores[0].strip())
+    
+    def rota_combinacoes(q):
+        espessura = param(q, 'espessura', float, obrigatorio=True)
+        tipo = param(q, 'tipo', obrigatorio=True)
+        ancora = param(q, 'ancora', obrigatorio=True)
+        limite = param(q, 'limite_cortes', int)
+        qtd = param(q, 'qtd_bobinas', int, QTD_BOBINAS_PAD)
+        peso = param(q, 'peso_total', float, float(PESO_MEDIO_BOB_PAD))
+        maximo = param(q, 'max', int, 100)
+        if qtd < 1:
+            raise ValueError(f"qtd_bobinas deve ser ≥ 1 (recebido {qtd})")
+        if peso <= 0:
+            raise ValueError(f"peso_total deve ser > 0 (recebido {peso})")
+        if maximo < 0:
+            raise ValueError(f"max deve ser ≥ 0 (recebido {maximo})")
+        
+        # Regras da requisição (o que não vier fica com o padrão)
+        mudancas = {
+            'perda_min_pct': param(q, 'perda_min', float),
+            'perda_max_pct': param(q, 'perda_max', float),
+            'larguras': param(q, 'larguras', lambda v: tuple(int(l) for l in v.split(','))),
+            'max_complementares': param(q, 'max_comp', int),
+        }
+        if mudancas['larguras'] is not None and min(mudancas['larguras']) <= 0:
+            raise ValueError(f"larguras devem ser > 0 mm (recebido {list(mudancas['larguras'])})")
+        # O nº de complementares multiplica o custo da busca: a requisição
+        # pode reduzir, mas não passar do máximo do servidor
+        if mudancas['max_complementares'] is not None and mudancas['max_complementares'] > MAX_COMP_NA_COMBO:
+            raise ValueError(f"max_comp deve ser ≤ {MAX_COMP_NA_COMBO} (recebido {mudancas['max_complementares']})")
+        config = base.com(**{k: v for k, v in mudancas.items() if v is not None})
+        
+        sessao = param(q, 'sessao')
+        if sessao is None:
+            consulta = motor.consultar(espessura, tipo, ancora, limite, qtd, peso, executor=executor, config=config)
+        else:
+            consulta = asyncio.run_coroutine_threadsafe(
+                frontend.consultar_resultado(sessao, espessura, tipo, ancora, limite, qtd, peso, config=config),
+                loop).result()
+            if consulta is None:
+                raise BuscaCancelada(ancora)
+        df_res = consulta['df_res']
+        
+        proximas = df_res.attrs.get('proximas')
+        if df_res.empty:
+            estatisticas = {'total': 0, 'validas': 0, 'fora_regra': 0,
+                            'refilo_min': config.refilo_min(espessura)}
+        else:
+            estatisticas = {k: int(v) for k, v in validar_resultado(df_res, espessura, config).items()}
+        
+        return {
+            'parametros': {'espessura': espessura, 'tipo': tipo, 'ancora': ancora,
+                           'limite_cortes': limite, 'qtd_bobinas': qtd, 'peso_total': peso,
+                           'config': config.como_dict()},
+            'largura_bobina': consulta['largura'],
+            'estatisticas': estatisticas,
+            'cache': consulta['cache'],
+            'tempos_ms': consulta['tempos_ms'],
+            **({'contadores': consulta['contadores']} if motor.coletar_contadores else {}),
+            **({'orcamento': df_res.attrs['orcamento']} if 'orcamento' in df_res.attrs else {}),
+            'combinacoes': resultado_para_json(df_res, consulta['df_detalhes'], maximo),
+            **({'proximas': resultado_para_json(proximas, explodir_detalhes(proximas))}
+               if df_res.empty and proximas is not None else {}),
+        }
+    
+    def rota_metricas(q):
+        with lock_metricas:
+            rotas = {
+                rota: {**m, 'media_ms': round(m['total_ms'] / m['requisicoes'], 2),
+                       'total_ms': round(m['total_ms'], 2), 'max_ms': round(m['max_ms'], 2)}
+                for rota, m in metricas.items()
+            }
+        return {'rotas': rotas,
+                'cache': {'consultas': len(motor._cache), 'acertos': motor.acertos_cache,
+                          'buscas': motor.buscas}}
+    
+    rotas = {
+        '/saude':       lambda q: {'status': 'ok', 'produtos': len(motor.df)},
+        '/espessuras':  lambda q: [float(e) for e in listar_espessuras(motor.df)],
+        '/tipos':       lambda q: listar_tipos(motor.df, param(q, 'espessura', float, obrigatorio=True)),
+        '/matrizes':    lambda q: json.loads(motor.listar_matrizes(
+                            param(q, 'espessura', float, obrigatorio=True),
+                            param(q, 'tipo', obrigatorio=True)).to_json(orient='records', force_ascii=False)),
+        '/ancoras':     lambda q: json.loads(buscar_ancoras(
+                            motor.indice_ancoras,
+                            param(q, 'espessura', float, obrigatorio=True),
+                            param(q, 'tipo', obrigatorio=True),
+                            param(q, 'q', padrao=''),
+                            param(q, 'max', int, MAX_SUGESTOES_ANCORA)).to_json(orient='records', force_ascii=False)),
+        '/combinacoes': rota_combinacoes,
+        '/metricas':    rota_metricas,
+    }
+    
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            inicio = time.perf_counter()
+            url = urlparse(self.path)
+            rota = url.path.rstrip('/') or '/saude'
+            
+            if rota not in rotas:
+                codigo, corpo = 404, {'erro': f"rota desconhecida: {rota}"}
+            else:
+                try:
+                    codigo, corpo = 200, rotas[rota](parse_qs(url.query))
+                except BuscaCancelada:
+                    codigo, corpo = 409, {'erro': "consulta substituída por outra mais nova da mesma sessão"}
+                except MatrizNaoEncontrada as e:
+                    codigo, corpo = 404, {'erro': str(e)}
+                except ValueError as e:
+                    codigo, corpo = 400, {'erro': str(e)}
+                except Exception as e:
+                    codigo, corpo = 500, {'erro': f"{type(e).__name__}: {e}"}
+            
+            ms = (time.perf_counter() - inicio) * 1000
+            dados = json.dumps(corpo, ensure_ascii=False).encode('utf-8')
+            
+            self.send_response(codigo)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(dados)))
+            self.send_header('X-Tempo-ms', f"{ms:.2f}")
+            self.end_headers()
+            self.wfile.write(dados)
+            
+            if rota in rotas:
+                registrar(rota, ms, codigo != 200)
+        
+        def log_message(self, formato, *args):
+            pass  # sem log por requisição no terminal (ver /metricas)
+    
+    class Servidor(ThreadingHTTPServer):
+        def server_close(self):
+            super().server_close()
+            frontend.encerrar()
+            loop.call_soon_threadsafe(loop.stop)
+    
+    return Servidor((host, porta), Handler)
+
+
+def servir(
+    df: pd.DataFrame,
+    host: str = '127.0.0.1',
+    porta: int = 8765,
+    processos: int | None = None,
+    contadores: bool = False,
+    config: ConfigPlano | None = None
+) -> None:
+    """
+    Sobe o serviço HTTP local com o motor aquecido até Ctrl+C.
+    
+    ENTRADA:
+        processos: tamanho do pool de buscas pesadas (None = nº de núcleos,
+                   0 = buscas na própria thread da requisição)
+        contadores: /combinacoes devolve também os contadores do motor (--stats)
+        config: regras base de cada requisição (None = ConfigPlano.padrao())
+    """
+    motor = MotorPlanejamento(df, contadores=contadores)
+    executor = iniciar_pool_motor(df, processos) if processos != 0 else None
+    servidor = criar_servidor(motor, host, porta, executor, config)
+    
+    print(f"\n  ✓ Serviço de planejamento em http://{host}:{servidor.server_address[1]}/")
+    print("    Rotas: /espessuras /tipos /matrizes /combinacoes /metricas  (Ctrl+C para parar)")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        print("\n  Encerrando serviço...")
+    finally:
+        servidor.server_close()
+        if executor is not None:
+            executor.shutdown()
+
+
+# ================================================================================
+# BLOCO 13: FRONT-END ASSÍNCRONO (CANCELAMENTO DE CONSULTAS SUPERADAS)
+# ================================================================================
+
+class FrontendAssincrono:
+    """
+    Front-end asyncio para o MotorPlanejamento.
+    
+    Cada consulta roda como uma tarefa cancelável: a busca (CPU) vai para um
+    pool de threads e os resultados parciais voltam para o event loop por uma
+    asyncio.Queue, à medida que o motor os encontra. Uma consulta nova da
+    mesma sessão cancela a anterior: o evento 'cancelar' da busca antiga é
+    sinalizado e o motor para no próximo grupo de matrizes, liberando a CPU.
+    
+    Usado pelo serviço HTTP nas requisições com 'sessao' (ver criar_servidor).
+    
+    USO:
+        frontend = FrontendAssincrono(motor)
+        async for evento in frontend.consultar('planejador-1', 2.0, 'COMERCIAL', '184 - [2.00]'):
+            if evento['evento'] == 'parcial':   ...  # lote de combinações (sem ordem)
+            elif evento['evento'] == 'final':   ...  # mesmo dict de motor.consultar
+            elif evento['evento'] == 'cancelada': ... # substituída por consulta mais nova
+            elif evento['evento'] == 'erro':    ...  # 'erro' (texto) e 'excecao' (ex.: MatrizNaoEncontrada)
+    
+    NOTA:
+        Threads (e não processos) porque o evento de cancelamento e o cache
+        são compartilhados em memória; o laço do motor devolve o GIL ao
+        event loop periodicamente, que continua respondendo.
+    """
+    
+    def __init__(self, motor: MotorPlanejamento, max_buscas: int | None = None):
+        from concurrent.futures import ThreadPoolExecutor
+        
+        self.motor = motor
+        self.executor = ThreadPoolExecutor(max_workers=max_buscas, thread_name_prefix='busca')
+        self._ativas = {}          # sessão → evento 'cancelar' da consulta em andamento
+        self.canceladas = 0
+    
+    def cancelar(self, sessao) -> bool:
+        """Cancela a consulta em andamento da sessão (se houver)."""
+        evento = self._ativas.pop(sessao, None)
+        if evento is None:
+            return False
+        evento.set()
+        return True
+    
+    async def consultar(
+        self,
+        sessao,
+        espessura: float,
+        tipo: str,
+        ancora: str,
+        limite_cortes: int | None = None,
+        qtd_bobinas: int = QTD_BOBINAS_PAD,
+        peso_total: float = PESO_MEDIO_BOB_PAD,
+        config: ConfigPlano | None = None
+    ):
+        """
+        Gerador assíncrono de eventos de uma consulta (ver docstring da classe).
+        
+        Sempre termina com exatamente um evento 'final', 'cancelada' ou 'erro'.
+        """
+        import asyncio
+        
+        self.cancelar(sessao)
+        cancelar = threading.Event()
+        self._ativas[sessao] = cancelar
+        
+        loop = asyncio.get_running_loop()
+        fila = asyncio.Queue()
+        
+        def parcial(largura, lote):
+            loop.call_soon_threadsafe(fila.put_nowait,
+                                      {'evento': 'parcial', 'largura': largura, 'combinacoes': lote})
+        
+        def trabalho():
+            try:
+                consulta = self.motor.consultar(espessura, tipo, ancora, limite_cortes, qtd_bobinas,
+                                                peso_total, cancelar=cancelar, parcial=parcial,
+                                                config=config)
+                item = {'evento': 'final', **consulta}
+            except BuscaCancelada:
+                item = {'evento': 'cancelada', 'ancora': ancora}
+            except Exception as e:
+                item = {'evento': 'erro', 'erro': str(e), 'excecao': e}
+            loop.call_soon_threadsafe(fila.put_nowait, item)
+        
+        futuro = loop.run_in_executor(self.executor, trabalho)
+        try:
+            while True:
+                item = await fila.get()
+                yield item
+                if item['evento'] != 'parcial':
+                    if item['evento'] == 'cancelada':
+                        self.canceladas += 1
+                    break
+        finally:
+            # Consumidor desistiu (break / tarefa cancelada): para a busca também
+            cancelar.set()
+            if self._ativas.get(sessao) is cancelar:
+                del self._ativas[sessao]
+            await asyncio.shield(futuro)
+    
+    async def consultar_resultado(self, sessao, *args, **kwargs) -> dict | None:
+        """
+        Versão sem parciais: devolve o dict de motor.consultar, ou None se a
+        consulta foi substituída por outra mais nova.
+        
+        ERRO:
+            a exceção do motor (ex.: MatrizNaoEncontrada para âncora inexistente)
+        """
+        async for evento in self.consultar(sessao, *args, **kwargs):
+            if evento['evento'] == 'final':
+                return evento
+            if evento['evento'] == 'erro':
+                raise evento['excecao']
+        return None
+    
+    def encerrar(self) -> None:
+        """Cancela tudo o que estiver rodando e libera as threads."""
+        for sessao in list(self._ativas):
+            self.cancelar(sessao)
+        self.executor.shutdown(wait=True)
+
+
+# ================================================================================
+# BLOCO 14: PLANEJAMENTO POR DEMANDA (VÁRIAS BOBINAS)
+# ================================================================================
+
+COLUNAS_DEMANDA = ['espessura', 'tipo', 'matriz', 'kg']
+
+
+def ler_demanda(caminho: str) -> pd.DataFrame:
+    """
+    Lê a carteira de pedidos (kg por matriz) de um CSV ou JSON.
+    
+    FORMATO:
+        CSV (separador , ou ;):
+            espessura;tipo;matriz;kg
+            2.0;COMERCIAL;184 - [2.00];18000
+        JSON: lista de objetos com as mesmas chaves
+    
+        A mesma matriz repetida (vários pedidos) é somada.
+    
+    SAÍDA:
+        DataFrame [Espessura, Tipo, Matriz, KG]
+    """
+    if caminho.lower().endswith('.json'):
+        tabela = pd.read_json(caminho, orient='records', dtype=False)
+    else:
+        tabela = pd.read_csv(caminho, sep=None, engine='python', dtype=str)
+    
+    tabela.columns = [str(c).strip().lower() for c in tabela.columns]
+    faltando = [c for c in COLUNAS_DEMANDA if c not in tabela.columns]
+    if faltando:
+        raise ValueError(f"Arquivo de demanda sem as colunas obrigatórias: {', '.join(faltando)}")
+    
+    numero = lambda col: pd.to_numeric(tabela[col].astype(str).str.strip().str.replace(',', '.'), errors='coerce')
+    demanda = pd.DataFrame({
+        'Espessura': numero('espessura'),
+        'Tipo': tabela['tipo'].astype(str).str.strip(),
+        'Matriz': tabela['matriz'].astype(str).str.strip(),
+        'KG': numero('kg'),
+    }).dropna()
+    
+    return (
+        demanda[demanda['KG'] > 0]
+        .groupby(['Espessura', 'Tipo', 'Matriz'], as_index=False)['KG'].sum()
+    )
+
+
+def gerar_padroes_demanda(
+    df: pd.DataFrame,
+    espessura: float,
+    tipo: str,
+    matrizes: list[str],
+    larguras: list[int] | None = None,
+    config: ConfigPlano | None = None
+) -> list[dict]:
+    """
+    Monta o conjunto de padrões de corte candidatos para o plano.
+    
+    Cada matriz pedida é usada como âncora no motor (gerar_combinacoes_para_largura),
+    com as OUTRAS matrizes pedidas como complementares, em cada largura.
+    Só entram padrões "✓ Válida"; o mesmo padrão achado por âncoras
+    diferentes (A+B com âncora A ou B) entra uma única vez.
+    
+    ENTRADA:
+        matrizes: matrizes da demanda (as que não existem na espessura/tipo são ignoradas)
+        larguras: larguras de bobina disponíveis (None = config.larguras)
+        config: regras dos padrões (None = ConfigPlano.padrao())
+    
+    SAÍDA:
+        Lista de resultados do motor (mesmo formato de gerar_combinacoes_para_largura)
+    """
+    config = config or ConfigPlano.padrao()
+    catalogo = listar_matrizes(df, espessura, tipo)
+    catalogo = catalogo[catalogo['Matriz'].isin(matrizes)]
+    nomes, devs = catalogo['Matriz'].tolist(), catalogo['Dev_mm'].tolist()
+    
+    vistos = set()
+    padroes = []
+    for largura in (larguras or config.larguras):
+        for i, (ancora, dev) in enumerate(zip(nomes, devs)):
+            if dev > largura:
+                continue
+            for r in gerar_combinacoes_para_largura(
+                dev_ancora=dev,
+                matriz_ancora=ancora,
+                matrizes_complementares=nomes[:i] + nomes[i + 1:],
+                devs_complementares=devs[:i] + devs[i + 1:],
+                largura_bobina=largura,
+                max_complementares=config.max_complementares,
+                espessura=espessura,
+                config=config
+            ):
+                if r['Status'] != "✓ Válida":
+                    continue
+                chave = (largura, tuple(sorted((d['Matriz'], d['N_cortes']) for d in r['Detalhes'])))
+                if chave not in vistos:
+                    vistos.add(chave)
+                    padroes.append(r)
+    
+    return padroes
+
+
+def _arredondar_plano(x_lp: np.ndarray, rendimento: np.ndarray, demanda: np.ndarray, perda: np.ndarray) -> np.ndarray:
+    """
+    Solução inteira a partir do LP: arredonda para baixo, completa o que
+    faltou com o padrão que mais cobre o saldo (guloso) e depois tira
+    bobinas que sobraram (as de maior perda primeiro).
+    """
+    return _completar_plano(np.floor(x_lp + 1e-9), rendimento, demanda, perda)
+
+
+def _resolver_inteiro(colunas: list[int], rendimento: np.ndarray, demanda: np.ndarray) -> np.ndarray | None:
+    """
+    Problema inteiro (MILP, scipy/HiGHS) só com os padrões que a geração de
+    colunas escolheu, com limite de TEMPO_MAX_PLANO_INTEIRO_S segundos.
+    
+    SAÍDA:
+        Bobinas por padrão (todos os padrões), ou None se não houver solução no tempo
+    """
+    from scipy.optimize import milp, LinearConstraint, Bounds
+    
+    sub = rendimento[:, colunas]
+    res = milp(np.ones(len(colunas)), constraints=LinearConstraint(sub, lb=demanda),
+               integrality=np.ones(len(colunas)), bounds=Bounds(0, np.inf),
+               options={'time_limit': TEMPO_MAX_PLANO_INTEIRO_S})
+    if res.x is None:
+        return None
+    
+    x = np.zeros(rendimento.shape[1])
+    x[colunas] = np.round(res.x)
+    return x
+
+
+def _completar_plano(x: np.ndarray, rendimento: np.ndarray, demanda: np.ndarray, perda: np.ndarray) -> np.ndarray:
+    """Completa a demanda com o padrão que mais cobre o saldo e tira bobinas sobrando."""
+    x = x.copy()
+    
+    # Completa a demanda (guloso: padrão que mais cobre o saldo por bobina)
+    saldo = demanda - rendimento @ x
+    while (saldo > 1e-6).any():
+        cobertura = np.minimum(rendimento, np.clip(saldo, 0, None)[:, None]).sum(axis=0)
+        p = int(np.argmax(cobertura))
+        if cobertura[p] <= 0:
+            break
+        x[p] += 1
+        saldo -= rendimento[:, p]
+    
+    # Remove bobinas desnecessárias
+    for p in np.argsort(-perda):
+        while x[p] > 0 and (rendimento @ x - rendimento[:, p] >= demanda - 1e-6).all():
+            x[p] -= 1
+    
+    return x
+
+
+def planejar_demanda(
+    df: pd.DataFrame,
+    espessura: float,
+    tipo: str,
+    demanda: dict[str, float],
+    peso_bobina: float = PESO_MEDIO_BOB_PAD,
+    larguras: list[int] | None = None,
+    config: ConfigPlano | None = None
+) -> dict:
+    """
+    Plano de produção para uma carteira de pedidos: quantas bobinas de
+    cada padrão cortar para atender os kg de cada matriz gastando o mínimo
+    de bobinas (= mínimo de perda + excedente).
+    
+    MÉTODO (geração de colunas):
+        1. Padrões candidatos pelo motor (gerar_padroes_demanda)
+        2. Rendimento de cada padrão (kg de cada matriz por bobina) com
+           calcular_kg_matriz
+        3. LP restrito, começando com o padrão de menor perda de cada matriz;
+           a cada iteração os preços duais da demanda escolhem os padrões de
+           custo reduzido negativo (até MAX_COLUNAS_POR_ITERACAO), até não
+           haver mais nenhum
+        4. Solução inteira: a melhor entre arredondar o LP para baixo e
+           completar (_arredondar_plano) e o problema inteiro restrito às
+           colunas geradas (_resolver_inteiro, com limite de tempo)
+    
+        O LP usa scipy (HiGHS). Sem scipy, o plano sai só do completar
+        guloso, sem o limite inferior.
+    
+    ENTRADA:
+        demanda: {matriz: kg pedidos}
+        peso_bobina: peso de cada bobina (kg), igual para todas as larguras
+        larguras: larguras de bobina disponíveis (None = config.larguras)
+        config: regras dos padrões (None = ConfigPlano.padrao())
+    
+    SAÍDA:
+        {
+            'plano':       DataFrame [Combinacao, Largura_bobina, Bobinas, Total_cortes,
+                                      Perda_pct, Perda_kg, Detalhes],
+            'atendimento': DataFrame [Matriz, Demanda_kg, Produzido_kg, Excedente_kg],
+            'sem_padrao':  matrizes pedidas sem nenhum padrão válido (não planejadas),
+            'resumo':      {'bobinas', 'kg_consumido', 'perda_kg', 'excedente_kg',
+                            'limite_lp_bobinas', 'iteracoes', 'padroes', 'tempo_s'}
+        }
+    """
+    inicio = time.perf_counter()
+    
+    padroes = gerar_padroes_demanda(df, espessura, tipo, list(demanda), larguras, config)
+    
+    cobertas = {d['Matriz'] for r in padroes for d in r['Detalhes']}
+    sem_padrao = [m for m in demanda if m not in cobertas]
+    matrizes = [m for m in demanda if m in cobertas]
+    linha = {m: i for i, m in enumerate(matrizes)}
+    d = np.array([demanda[m] for m in matrizes], dtype=float)
+    
+    # ── Rendimento: kg de cada matriz por bobina de cada padrão ──
+    rendimento = np.zeros((len(matrizes), len(padroes)))
+    for j, r in enumerate(padroes):
+        for det in r['Detalhes']:
+            rendimento[linha[det['Matriz']], j] += calcular_kg_matriz(
+                peso_bobina, r['Largura_bobina'], det['N_cortes'], det['Desenvolvimento_mm'], 1)
+    perda = np.array([r['Perda_pct'] for r in padroes])
+    
+    # ── Geração de colunas (LP restrito + preços duais) ──
+    iteracoes, limite_lp = 0, None
+    x_lp = np.zeros(len(padroes))
+    try:
+        from scipy.optimize import linprog
+    except ImportError:
+        print("  ⚠ scipy não instalado: plano guloso, sem LP.")
+        linprog = None
+    
+    if linprog is not None and matrizes:
+        colunas = sorted({int(np.argmin(np.where(rendimento[i] > 0, perda, np.inf))) for i in range(len(matrizes))})
+        while True:
+            iteracoes += 1
+            lp = linprog(np.ones(len(colunas)), A_ub=-rendimento[:, colunas], b_ub=-d,
+                         bounds=(0, None), method='highs')
+            duais = -lp.ineqlin.marginals
+            custo_reduzido = 1 - duais @ rendimento
+            custo_reduzido[colunas] = 0
+            novas = [int(j) for j in np.argsort(custo_reduzido)[:MAX_COLUNAS_POR_ITERACAO]
+                     if custo_reduzido[j] < -1e-9]
+            if not novas:
+                break
+            colunas = sorted(set(colunas) | set(novas))
+        
+        x_lp[colunas] = lp.x
+        limite_lp = float(lp.fun)
+    
+    # ── Solução inteira: arredondamento e, com LP, o MILP nas colunas geradas ──
+    x = _arredondar_plano(x_lp, rendimento, d, perda)
+    if linprog is not None and matrizes:
+        x_inteiro = _resolver_inteiro(colunas, rendimento, d)
+        if x_inteiro is not None:
+            x_inteiro = _completar_plano(x_inteiro, rendimento, d, perda)
+            if (x_inteiro.sum(), x_inteiro @ perda) < (x.sum(), x @ perda):
+                x = x_inteiro
+    
+    # ── Montagem do resultado ──
+    usados = np.flatnonzero(x)
+    plano = pd.DataFrame([padroes[j] for j in usados],
+                         columns=['Combinacao', 'Largura_bobina', 'Total_cortes', 'Perda_pct', 'Perda_mm', 'Detalhes'])
+    plano.insert(2, 'Bobinas', x[usados].astype(int))
+    plano['Perda_kg'] = (plano['Bobinas'] * peso_bobina * plano['Perda_mm'] / plano['Largura_bobina']).round(1)
+    plano = (
+        plano.drop(columns=['Perda_mm'])
+        .sort_values(['Largura_bobina', 'Bobinas'], ascending=[True, False])
+        .reset_index(drop=True)
+    )
+    
+    produzido = rendimento @ x
+    atendimento = pd.DataFrame({
+        'Matriz': matrizes,
+        'Demanda_kg': d,
+        'Produzido_kg': produzido.round(1),
+        'Excedente_kg': (produzido - d).round(1),
+    })
+    
+    bobinas = int(x.sum())
+    return {
+        'plano': plano,
+        'atendimento': atendimento,
+        'sem_padrao': sem_padrao,
+        'resumo': {
+            'bobinas': bobinas,
+            'kg_consumido': bobinas * peso_bobina,
+            'perda_kg': float(plano['Perda_kg'].sum()),
+            'excedente_kg': float(atendimento['Excedente_kg'].sum()),
+            'limite_lp_bobinas': round(limite_lp, 3) if limite_lp is not None else None,
+            'iteracoes': iteracoes,
+            'padroes': len(padroes),
+            'tempo_s': round(time.perf_counter() - inicio, 2),
+        },
+    }
+
+
+def exportar_plano_demanda(plano: dict, espessura: float, tipo: str, pasta: str | None = None) -> str:
+    """
+    Grava o plano por demanda em Excel (abas Plano, Atendimento e Resumo).
+    
+    SAÍDA:
+        Caminho do arquivo: plano_demanda_esp<esp>_<tipo>_<timestamp>.xlsx
+    """
+    pasta = pasta or BASE_OUTPUT
+    os.makedirs(pasta, exist_ok=True)
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    esp_str = str(espessura).replace('.', '-')
+    caminho = os.path.join(pasta, f"plano_demanda_esp{esp_str}_{tipo}_{timestamp}.xlsx")
+    
+    resumo = pd.DataFrame(
+        list(plano['resumo'].items()) + [('sem_padrao', ', '.join(plano['sem_padrao']) or '-')],
+        columns=['Item', 'Valor']
+    )
+    with pd.ExcelWriter(caminho) as writer:
+        plano['plano'].drop(columns=['Detalhes']).to_excel(writer, sheet_name='Plano', index=False)
+        plano['atendimento'].to_excel(writer, sheet_name='Atendimento', index=False)
+        resumo.to_excel(writer, sheet_name='Resumo', index=False)
+    
+    return caminho
+
+
+def processar_demanda(
+    df: pd.DataFrame,
+    demanda: pd.DataFrame,
+    peso_bobina: float = PESO_MEDIO_BOB_PAD,
+    pasta_saida: str | None = None,
+    config: ConfigPlano | None = None
+) -> list[dict]:
+    """
+    Planeja cada espessura/tipo da carteira (ler_demanda), ordena os padrões
+    para a menor troca de facas (sequenciar_padroes, BLOCO 15), mostra o
+    resumo no terminal e grava um Excel por grupo.
+    config: regras dos padrões (None = ConfigPlano.padrao())
+    """
+    planos = []
+    for (espessura, tipo), grupo in demanda.groupby(['Espessura', 'Tipo']):
+        print(f"\n  Demanda esp {espessura} mm / {tipo}: {len(grupo)} matrizes, "
+              f"{grupo['KG'].sum():,.0f} kg")
+        plano = planejar_demanda(df, espessura, tipo, dict(zip(grupo['Matriz'], grupo['KG'])), peso_bobina,
+                                 config=config)
+        r = plano['resumo']
+        
+        # Ordem de produção: menor tempo de troca de facas entre os padrões
+        if not plano['plano'].empty:
+            plano['plano'], seq = sequenciar_padroes(plano['plano'])
+            r['setup_min'] = seq['custo_total']
+        
+        print(f"  ✓ {r['bobinas']} bobinas de {peso_bobina:,.0f} kg "
+              f"(LP: {r['limite_lp_bobinas'] if r['limite_lp_bobinas'] is not None else '-'}) | "
+              f"perda {r['perda_kg']:,.0f} kg | excedente {r['excedente_kg']:,.0f} kg | "
+              f"{r['padroes']} padrões, {r['iteracoes']} iterações, {r['tempo_s']} s")
+        if plano['sem_padrao']:
+            print(f"  ⚠ Sem padrão válido (fora do plano): {', '.join(plano['sem_padrao'])}")
+        if not plano['plano'].empty:
+            print(f"  ✓ Sequência de produção: {r['setup_min']:.1f} min de troca de facas "
+                  f"(ordem sem sequenciar: {seq['custo_ordem_original']:.1f} min)")
+            print(plano['plano'].drop(columns=['Detalhes']).to_string(index=False))
+            print(f"  ✓ Plano: {exportar_plano_demanda(plano, espessura, tipo, pasta_saida)}")
+        planos.append(plano)
+    
+    return planos
+
+
+# ================================================================================
+# BLOCO 15: SEQUENCIAMENTO DE PADRÕES (TROCA DE FACAS)
+# ================================================================================
+
+def posicoes_facas(detalhes: list[dict], largura_bobina: int, centralizar: bool = True) -> np.ndarray:
+    """
+    Posições das facas (mm, a partir da borda da bobina) de um padrão.
+    
+    As facas ficam nos desenvolvimentos acumulados dos cortes, na ordem de
+    'Detalhes' (âncora e depois complementares), mais as duas do refilo.
+    
+    EXEMPLO:
+        184(x1) + 185(x2) em 1200 mm, centralizado (refilo de 646 mm → 323 de cada lado):
+        [323, 507, 692, 877]
+    
+    ENTRADA:
+        centralizar: True = refilo dividido nas duas bordas; False = tudo no fim
+    """
+    cortes = np.repeat([d['Desenvolvimento_mm'] for d in detalhes], [d['N_cortes'] for d in detalhes])
+    inicio = (largura_bobina - cortes.sum()) / 2 if centralizar else 0.0
+    return inicio + np.concatenate(([0.0], np.cumsum(cortes)))
+
+
+def matriz_custo_setup(facas: list[np.ndarray], custo: dict | None = None) -> np.ndarray:
+    """
+    Custo de trocar do padrão i para o padrão j, para todos os pares.
+    
+    MODELO (custo: CUSTO_TROCA_FACAS, com as chaves informadas substituídas):
+        fixo + mm × (deslocamento das facas aproveitadas) + faca × (facas colocadas/retiradas)
+        As facas são casadas em ordem (esquerda → direita) pela programação
+        dinâmica de edição; padrões idênticos custam 0.
+    
+    A programação dinâmica roda para todos os pares ao mesmo tempo: cada
+    célula (faca i da origem, faca j do destino) é um array n × n.
+    
+    SAÍDA:
+        Matriz n × n (simétrica, diagonal 0)
+    """
+    custo = {**CUSTO_TROCA_FACAS, **(custo or {})}
+    n = len(facas)
+    if n == 0:
+        return np.zeros((0, 0))
+    
+    qtd = np.array([len(f) for f in facas])
+    k = int(qtd.max())
+    pos = np.full((n, k), np.nan)
+    for i, f in enumerate(facas):
+        pos[i, :len(f)] = f
+    
+    colunas = np.arange(n)
+    resultado = np.zeros((n, n))
+    
+    # Linha 0: origem sem facas → colocar as j primeiras facas do destino
+    anterior = [np.full((n, n), j * custo['faca']) for j in range(k + 1)]
+    for i in range(1, k + 1):
+        a = pos[:, i - 1][:, None]
+        atual = [anterior[0] + custo['faca']]
+        for j in range(1, k + 1):
+            mover = anterior[j - 1] + custo['mm'] * np.abs(a - pos[:, j - 1][None, :])
+            trocar = np.minimum(anterior[j], atual[j - 1]) + custo['faca']
+            atual.append(np.fmin(mover, trocar))   # fmin: células além das facas (nan) são ignoradas
+        
+        # Origens com exatamente i facas: resultado na coluna qtd[destino]
+        origens = np.flatnonzero(qtd == i)
+        if origens.size:
+            tabela = np.stack(atual)
+            resultado[origens] = tabela[qtd[None, :], origens[:, None], colunas[None, :]]
+        anterior = atual
+    
+    resultado += custo['fixo']
+    
+    # Padrões idênticos: sem troca
+    chaves = [tuple(np.round(f, 3)) for f in facas]
+    ids = np.array([chaves.index(c) for c in chaves])
+    resultado[ids[:, None] == ids[None, :]] = 0.0
+    return resultado
+
+
+def _custo_caminho(custos: np.ndarray, ordem: np.ndarray) -> float:
+    """Soma dos custos das trocas consecutivas."""
+    return float(custos[ordem[:-1], ordem[1:]].sum()) if len(ordem) > 1 else 0.0
+
+
+def _vizinho_mais_proximo(custos: np.ndarray, inicio: int) -> np.ndarray:
+    """Caminho guloso: sempre o padrão mais barato a partir do atual."""
+    n = len(custos)
+    livre = np.ones(n, dtype=bool)
+    ordem = [inicio]
+    livre[inicio] = False
+    for _ in range(n - 1):
+        linha = np.where(livre, custos[ordem[-1]], np.inf)
+        prox = int(np.argmin(linha))
+        ordem.append(prox)
+        livre[prox] = False
+    return np.array(ordem)
+
+
+def _melhorar_2opt(custos: np.ndarray, ordem: np.ndarray, limite_s: float) -> tuple[np.ndarray, int]:
+    """
+    Busca local 2-opt para caminho aberto: inverte o trecho [i..j] que mais
+    reduz o custo, até não haver melhoria (ou acabar o tempo).
+    
+    Um nó fictício de custo 0 nas duas pontas transforma o caminho aberto em
+    ciclo; todas as trocas (i, j) são avaliadas de uma vez com numpy.
+    """
+    n = len(ordem)
+    c = np.zeros((n + 1, n + 1))
+    c[:n, :n] = custos
+    caminho = np.concatenate(([n], ordem, [n]))
+    fim = time.perf_counter() + limite_s
+    triangulo = np.triu(np.ones((n, n), dtype=bool), k=1)
+    melhorias = 0
+    
+    while time.perf_counter() < fim:
+        ant, cur, prox = caminho[:n], caminho[1:n + 1], caminho[2:n + 2]
+        delta = (c[ant[:, None], cur[None, :]] + c[cur[:, None], prox[None, :]]
+                 - c[ant, cur][:, None] - c[cur, prox][None, :])
+        delta[~triangulo] = 0.0
+        
+        i, j = np.unravel_index(np.argmin(delta), delta.shape)
+        if delta[i, j] > -1e-9:
+            break
+        caminho[i + 1:j + 2] = caminho[i + 1:j + 2][::-1].copy()
+        melhorias += 1
+    
+    return caminho[1:n + 1], melhorias
+
+
+def sequenciar_padroes(
+    padroes: pd.DataFrame,
+    custo: dict | None = None,
+    centralizar: bool = True,
+    tempo_max_s: float = TEMPO_MAX_SEQUENCIAMENTO_S
+) -> tuple[pd.DataFrame, dict]:
+    """
+    Ordena os padrões escolhidos para minimizar o custo total de troca de
+    facas entre setups consecutivos (caixeiro-viajante de caminho aberto).
+    
+    MÉTODO:
+        1. Posições das facas de cada padrão (posicoes_facas, a partir de 'Detalhes')
+        2. Custo de troca entre todos os pares (matriz_custo_setup)
+        3. Vizinho mais próximo a partir de vários padrões iniciais
+        4. Busca local 2-opt vetorizada no melhor caminho (no máximo tempo_max_s)
+    
+    ENTRADA:
+        padroes: DataFrame com 'Detalhes' e 'Largura_bobina' (resultado da
+                 busca, ou o 'plano' de planejar_demanda)
+        custo: substitui chaves de CUSTO_TROCA_FACAS (ex.: {'fixo': 8})
+        centralizar: ver posicoes_facas
+        tempo_max_s: limite da busca local (o resto é proporcional a n²)
+    
+    SAÍDA:
+        (padroes na ordem de produção com 'Ordem', 'Facas' e 'Custo_setup'
+         (custo da troca vindo do padrão anterior),
+         {'custo_total', 'custo_ordem_original', 'melhorias_2opt', 'tempo_s'})
+    """
+    inicio = time.perf_counter()
+    n = len(padroes)
+    
+    facas = [posicoes_facas(d, l, centralizar) for d, l in zip(padroes['Detalhes'], padroes['Largura_bobina'])]
+    custos = matriz_custo_setup(facas, custo)
+    
+    original = np.arange(n)
+    ordem, melhorias = original, 0
+    if n > 2:
+        # Vizinho mais próximo: até 20 inícios espalhados, fica o mais barato
+        inicios = np.unique(np.linspace(0, n - 1, min(n, 20)).astype(int))
+        ordem = min((_vizinho_mais_proximo(custos, int(i)) for i in inicios),
+                    key=lambda o: _custo_caminho(custos, o))
+        ordem, melhorias = _melhorar_2opt(custos, ordem, tempo_max_s)
+    
+    sequencia = padroes.iloc[ordem].reset_index(drop=True)
+    sequencia.insert(0, 'Ordem', np.arange(1, n + 1))
+    sequencia['Facas'] = [len(facas[i]) for i in ordem]
+    sequencia['Custo_setup'] = np.concatenate(([0.0], custos[ordem[:-1], ordem[1:]])).round(2) if n else []
+    
+    return sequencia, {
+        'custo_total': round(_custo_caminho(custos, ordem), 2),
+        'custo_ordem_original': round(_custo_caminho(custos, original), 2),
+        'melhorias_2opt': melhorias,
+        'tempo_s': round(time.perf_counter() - inicio, 3),
+    }
+
+
+# ================================================================================
+# BLOCO 16: ATRIBUIÇÃO DE BOBINAS DO ESTOQUE
+# ================================================================================
+
+COLUNAS_ESTOQUE = ['bobina', 'espessura', 'tipo', 'largura', 'peso']
+
+
+def ler_estoque(caminho: str) -> pd.DataFrame:
+    """
+    Lê o estoque de bobinas físicas (CSV ou JSON), uma linha por bobina.
+    
+    FORMATO:
+        bobina;espessura;tipo;largura;peso
+        B-1021;2.0;COMERCIAL;1200;11850
+    
+    SAÍDA:
+        DataFrame [Bobina, Espessura, Tipo, Largura_bobina, Peso_kg]
+    """
+    if caminho.lower().endswith('.json'):
+        tabela = pd.read_json(caminho, orient='records', dtype=False)
+    else:
+        tabela = pd.read_csv(caminho, sep=None, engine='python', dtype=str)
+    
+    tabela.columns = [str(c).strip().lower() for c in tabela.columns]
+    faltando = [c for c in COLUNAS_ESTOQUE if c not in tabela.columns]
+    if faltando:
+        raise ValueError(f"Arquivo de estoque sem as colunas obrigatórias: {', '.join(faltando)}")
+    
+    numero = lambda col: pd.to_numeric(tabela[col].astype(str).str.strip().str.replace(',', '.'), errors='coerce')
+    estoque = pd.DataFrame({
+        'Bobina': tabela['bobina'].astype(str).str.strip(),
+        'Espessura': numero('espessura'),
+        'Tipo': tabela['tipo'].astype(str).str.strip(),
+        'Largura_bobina': numero('largura'),
+        'Peso_kg': numero('peso'),
+    }).dropna()
+    estoque = estoque[(estoque['Largura_bobina'] > 0) & (estoque['Peso_kg'] > 0)]
+    estoque['Largura_bobina'] = estoque['Largura_bobina'].astype(int)
+    
+    return estoque.reset_index(drop=True)
+
+
+def atribuir_bobinas(
+    df: pd.DataFrame,
+    espessura: float,
+    tipo: str,
+    estoque: pd.DataFrame,
+    matrizes: list[str],
+    demanda: dict[str, float] | None = None,
+    config: ConfigPlano | None = None
+) -> dict:
+    """
+    Escolhe o padrão de corte de cada bobina física do estoque.
+    
+    MÉTODO:
+        1. Para cada largura presente no estoque, padrões válidos entre as
+           matrizes alvo (gerar_padroes_demanda) e o rendimento por kg de
+           bobina de cada matriz em cada padrão (calcular_kg_matriz com peso 1)
+        2. Sem demanda: cada bobina recebe o padrão de menor perda da sua
+           largura; o KG é peso_real × rendimento, para todas as bobinas de
+           uma vez (produto externo numpy)
+        3. Com demanda: bobinas da mais pesada para a mais leve; cada uma
+           recebe o padrão que mais cobre o saldo dos pedidos (avaliando
+           todos os padrões da largura de uma vez); bobinas que não cobrem
+           mais nada ficam no estoque
+    
+    ENTRADA:
+        estoque: ler_estoque (só as bobinas desta espessura/tipo são usadas)
+        matrizes: matrizes alvo (as que podem ser cortadas)
+        demanda: {matriz: kg} opcional
+        config: regras dos padrões (None = ConfigPlano.padrao()); as larguras
+                vêm do estoque
+    
+    SAÍDA:
+        {
+            'bobinas':     DataFrame [Bobina, Largura_bobina, Peso_kg, Combinacao,
+                                      Total_cortes, Perda_pct, Perda_kg] (Combinacao vazia = não usada),
+            'detalhes':    DataFrame [Bobina, Matriz, Desenvolvimento_mm, N_cortes, Qtd_KG],
+            'atendimento': DataFrame [Matriz, Demanda_kg, Atribuido_kg, Saldo_kg] (None sem demanda),
+            'sem_padrao':  larguras do estoque sem nenhum padrão válido
+        }
+    """
+    bobinas = estoque[(estoque['Espessura'] == espessura) & (estoque['Tipo'] == tipo)].reset_index(drop=True)
+    linha = {m: i for i, m in enumerate(matrizes)}
+    
+    # ── Padrões e rendimento (kg por kg de bobina) por largura ──
+    padroes, rendimento, perda = {}, {}, {}
+    for largura in sorted(bobinas['Largura_bobina'].unique()):
+        lista = gerar_padroes_demanda(df, espessura, tipo, matrizes, [int(largura)], config)
+        r = np.zeros((len(matrizes), len(lista)))
+        for j, p in enumerate(lista):
+            for det in p['Detalhes']:
+                r[linha[det['Matriz']], j] += calcular_kg_matriz(1.0, largura, det['N_cortes'],
+                                                                 det['Desenvolvimento_mm'], 1)
+        padroes[largura], rendimento[largura] = lista, r
+        perda[largura] = np.array([p['Perda_pct'] for p in lista])
+    
+    sem_padrao = [int(l) for l, lista in padroes.items() if not lista]
+    escolha = np.full(len(bobinas), -1)
+    larguras = bobinas['Largura_bobina'].to_numpy()
+    pesos = bobinas['Peso_kg'].to_numpy(dtype=float)
+    
+    if demanda is None:
+        # Menor perda (desempate: menos cortes), igual para toda a largura
+        for largura, lista in padroes.items():
+            if lista:
+                cortes = np.array([p['Total_cortes'] for p in lista])
+                escolha[larguras == largura] = np.lexsort((cortes, perda[largura]))[0]
+    else:
+        saldo = np.array([demanda.get(m, 0.0) for m in matrizes], dtype=float)
+        for b in np.argsort(-pesos, kind='stable'):
+            largura = larguras[b]
+            if not padroes[largura] or (saldo <= 1e-6).all():
+                continue
+            kg = rendimento[largura] * pesos[b]
+            cobertura = np.minimum(kg, np.clip(saldo, 0, None)[:, None]).sum(axis=0)
+            j = int(np.argmax(cobertura - 1e-6 * perda[largura]))
+            if cobertura[j] <= 0:
+                continue
+            escolha[b] = j
+            saldo -= kg[:, j]
+    
+    # ── Resultado por bobina e por matriz (KG pelo peso real de cada bobina) ──
+    registros, detalhes = [], []
+    atribuido = np.zeros(len(matrizes))
+    for b, (bobina, largura, peso, j) in enumerate(zip(bobinas['Bobina'], larguras, pesos, escolha)):
+        if j < 0:
+            registros.append((bobina, largura, peso, '', 0, np.nan, 0.0))
+            continue
+        p = padroes[largura][j]
+        registros.append((bobina, largura, peso, p['Combinacao'], p['Total_cortes'], p['Perda_pct'],
+                          round(peso * p['Perda_mm'] / largura, 1)))
+        for det in p['Detalhes']:
+            detalhes.append((bobina, det['Matriz'], det['Desenvolvimento_mm'], det['N_cortes'],
+                             calcular_kg_matriz(peso, largura, det['N_cortes'], det['Desenvolvimento_mm'], 1)))
+        atribuido += rendimento[largura][:, j] * peso
+    
+    df_bobinas = pd.DataFrame(registros, columns=['Bobina', 'Largura_bobina', 'Peso_kg', 'Combinacao',
+                                                  'Total_cortes', 'Perda_pct', 'Perda_kg'])
+    df_detalhes = pd.DataFrame(detalhes, columns=['Bobina', 'Matriz', 'Desenvolvimento_mm', 'N_cortes', 'Qtd_KG'])
+    df_detalhes['Qtd_KG'] = df_detalhes['Qtd_KG'].round(1)
+    
+    atendimento = None
+    if demanda is not None:
+        pedido = np.array([demanda.get(m, 0.0) for m in matrizes])
+        atendimento = pd.DataFrame({
+            'Matriz': matrizes,
+            'Demanda_kg': pedido,
+            'Atribuido_kg': atribuido.round(1),
+            'Saldo_kg': (pedido - atribuido).round(1),
+        })
+    
+    return {'bobinas': df_bobinas, 'detalhes': df_detalhes, 'atendimento': atendimento, 'sem_padrao': sem_padrao}
+
+
+def processar_estoque(
+    df: pd.DataFrame,
+    estoque: pd.DataFrame,
+    demanda: pd.DataFrame,
+    pasta_saida: str | None = None,
+    config: ConfigPlano | None = None
+) -> list[dict]:
+    """
+    Atribui as bobinas do estoque a cada espessura/tipo da carteira
+    (ler_demanda), mostra o resumo e grava um Excel por grupo:
+        atribuicao_esp<esp>_<tipo>_<timestamp>.xlsx (abas Bobinas, Detalhes, Atendimento)
+    config: regras dos padrões (None = ConfigPlano.padrao())
+    """
+    pasta_saida = pasta_saida or BASE_OUTPUT
+    os.makedirs(pasta_saida, exist_ok=True)
+    
+    resultados = []
+    for (espessura, tipo), grupo in demanda.groupby(['Espessura', 'Tipo']):
+        inicio = time.perf_counter()
+        res = atribuir_bobinas(df, espessura, tipo, estoque, grupo['Matriz'].tolist(),
+                               dict(zip(grupo['Matriz'], grupo['KG'])), config)
+        b = res['bobinas']
+        usadas = b[b['Combinacao'] != '']
+        
+        print(f"\n  Estoque esp {espessura} mm / {tipo}: {len(b)} bobinas, {len(usadas)} atribuídas "
+              f"({usadas['Peso_kg'].sum():,.0f} kg) | perda {usadas['Perda_kg'].sum():,.0f} kg | "
+              f"saldo a produzir {res['atendimento']['Saldo_kg'].clip(lower=0).sum():,.0f} kg | "
+              f"{time.perf_counter() - inicio:.2f} s")
+        if res['sem_padrao']:
+            print(f"  ⚠ Larguras sem padrão válido: {', '.join(map(str, res['sem_padrao']))} mm")
+        
+        if len(b):
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            caminho = os.path.join(pasta_saida, f"atribuicao_esp{str(espessura).replace('.', '-')}_{tipo}_{timestamp}.xlsx")
+            with pd.ExcelWriter(caminho) as writer:
+                b.to_excel(writer, sheet_name='Bobinas', index=False)
+                res['detalhes'].to_excel(writer, sheet_name='Detalhes', index=False)
+                res['atendimento'].to_excel(writer, sheet_name='Atendimento', index=False)
+            print(f"  ✓ Atribuição: {caminho}")
+        resultados.append(res)
+    
+    return resultados
+
+
+# ================================================================================
+# BLOCO 17: ATLAS DE VIABILIDADE DO CATÁLOGO
+# ================================================================================
+
+def enumerar_somas_complementares(devs: np.ndarray, largura: int, max_complementares: int) -> dict:
+    """
+    Todas as combinações de 1 até max_complementares matrizes DISTINTAS do
+    grupo (cada uma com ≥ 1 corte) cuja soma cabe na largura, de uma vez.
+    
+    É a parte das complementares do motor (gerar_combinacoes_para_largura),
+    feita uma única vez por grupo e largura e compartilhada por todas as
+    âncoras. As somas seguem a mesma ordem de adição do motor (matrizes na
+    ordem do grupo), então os valores em ponto flutuante são idênticos.
+    
+    SAÍDA:
+        {'soma': somas ORDENADAS (mm),
+         'membros': índices das matrizes (linhas × max_complementares, -1 = vazio),
+         'cortes':  cortes de cada membro (mesmo formato)}
+    """
+    m = len(devs)
+    # Nível 1: uma complementar
+    nivel_soma, nivel_membros, nivel_cortes, nivel_ultimo = [], [], [], []
+    for j, d in enumerate(devs):
+        n = np.arange(1, int(largura / d) + 1)
+        nivel_soma.append(d * n)
+        nivel_membros.append(np.full((len(n), 1), j))
+        nivel_cortes.append(n[:, None])
+        nivel_ultimo.append(np.full(len(n), j))
+    
+    soma = np.concatenate(nivel_soma) if m else np.zeros(0)
+    memb = np.concatenate(nivel_membros) if m else np.zeros((0, 1), dtype=int)
+    cort = np.concatenate(nivel_cortes) if m else np.zeros((0, 1), dtype=int)
+    ult = np.concatenate(nivel_ultimo) if m else np.zeros(0, dtype=int)
+    niveis = [(soma, memb, cort)]
+    
+    # Níveis seguintes: acrescenta uma matriz de índice maior que a última
+    for _ in range(1, max_complementares):
+        nivel = ([], [], [], [])
+        for j, d in enumerate(devs):
+            base = ult < j
+            if not base.any():
+                continue
+            n = np.arange(1, int(largura / d) + 1)
+            nova = soma[base][:, None] + d * n[None, :]
+            cabe = nova <= largura
+            linhas, colunas = np.nonzero(cabe)
+            nivel[0].append(nova[cabe])
+            nivel[1].append(np.hstack([memb[base][linhas], np.full((len(linhas), 1), j)]))
+            nivel[2].append(np.hstack([cort[base][linhas], n[colunas][:, None]]))
+            nivel[3].append(np.full(len(linhas), j))
+        if not nivel[0]:
+            break
+        soma, memb, cort, ult = (np.concatenate(x) for x in nivel)
+        niveis.append((soma, memb, cort))
+    
+    # Junta os níveis (membros/cortes completados com -1 / 0) e ordena pela soma
+    k = len(niveis)
+    soma = np.concatenate([s_ for s_, _, _ in niveis])
+    memb = np.concatenate([np.pad(mb, ((0, 0), (0, k - mb.shape[1])), constant_values=-1) for _, mb, _ in niveis])
+    cort = np.concatenate([np.pad(c, ((0, 0), (0, k - c.shape[1]))) for _, _, c in niveis])
+    ordem = np.argsort(soma, kind='stable')
+    
+    return {'soma': soma[ordem], 'membros': memb[ordem], 'cortes': cort[ordem]}
+
+
+def atlas_grupo(
+    espessura: float,
+    tipo: str,
+    matrizes: list[str],
+    devs_grupo: list[float],
+    devs_ancora: list[float],
+    larguras: list[int] | None = None,
+    config: ConfigPlano | None = None
+) -> list[dict]:
+    """
+    Viabilidade de cada matriz do grupo (espessura, tipo) como âncora, em
+    cada largura, com as mesmas regras e os mesmos números do motor.
+    
+    MÉTODO:
+        Para cada largura, as somas das complementares são enumeradas uma
+        vez (enumerar_somas_complementares). Para cada âncora e cada N de
+        cortes da âncora, a janela de perda vira um intervalo de somas
+        procurado com searchsorted; os candidatos são conferidos com a
+        mesma conta do motor (largura − (soma_âncora + soma_comp)) e os que
+        usam a própria âncora são descartados.
+    
+    ENTRADA:
+        matrizes / devs_grupo: o grupo na ordem de listar_matrizes (complementares)
+        devs_ancora: desenvolvimento de cada matriz como âncora
+                     (= obter_desenvolvimento: média por matriz e espessura)
+        larguras: None = config.larguras
+        config: regras (None = ConfigPlano.padrao())
+    
+    SAÍDA:
+        Uma linha por (matriz, largura):
+        {Espessura, Tipo, Matriz, Dev_mm, Largura_bobina, Validas, Fora_regra,
+         Melhor_perda_pct, Melhor_combinacao}
+    """
+    config = config or ConfigPlano.padrao()
+    devs = np.array(devs_grupo, dtype=float)
+    refilo_min = config.refilo_min(espessura)
+    linhas = []
+    
+    for largura in (larguras or config.larguras):
+        perda_min_mm, perda_max_mm = config.janela_mm(largura)
+        somas = enumerar_somas_complementares(devs, largura, config.max_complementares)
+        soma_comp = somas['soma']
+        
+        for a, (ancora, dev_ancora) in enumerate(zip(matrizes, devs_ancora)):
+            validas = fora = 0
+            melhor = None   # (perda_mm, n_ancora, num_comp, linha das somas ou -1)
+            
+            for n_ancora in range(1, int(largura / dev_ancora) + 1):
+                soma_ancora = dev_ancora * n_ancora
+                
+                # Só a âncora
+                perda = largura - soma_ancora
+                if perda_min_mm <= perda <= perda_max_mm:
+                    if perda >= refilo_min:
+                        validas += 1
+                        melhor = min(melhor or (np.inf,), (perda, n_ancora, 0, -1))
+                    else:
+                        fora += 1
+                
+                # Âncora + complementares: intervalo de somas pela janela de perda
+                ini = np.searchsorted(soma_comp, largura - soma_ancora - perda_max_mm - 1e-6, 'left')
+                fim = np.searchsorted(soma_comp, largura - soma_ancora - perda_min_mm + 1e-6, 'right')
+                if ini >= fim:
+                    continue
+                
+                perdas = largura - (soma_ancora + soma_comp[ini:fim])
+                membros = somas['membros'][ini:fim]
+                ok = ((perdas >= perda_min_mm) & (perdas <= perda_max_mm)
+                      & ~(membros == a).any(axis=1))
+                valida = ok & (perdas >= refilo_min)
+                validas += int(valida.sum())
+                fora += int((ok & ~valida).sum())
+                
+                if valida.any():
+                    num_comp = (membros >= 0).sum(axis=1)
+                    cand = np.flatnonzero(valida)
+                    b = cand[np.lexsort((num_comp[cand], perdas[cand]))[0]]
+                    melhor = min(melhor or (np.inf,), (perdas[b], n_ancora, int(num_comp[b]), ini + b))
+            
+            combinacao = None
+            if melhor is not None:
+                partes = [f"{ancora}(x{melhor[1]})"]
+                if melhor[3] >= 0:
+                    partes += [f"{matrizes[i]}(x{n})" for i, n in
+                               zip(somas['membros'][melhor[3]], somas['cortes'][melhor[3]]) if i >= 0]
+                combinacao = ' + '.join(partes)
+            
+            linhas.append({
+                'Espessura': espessura,
+                'Tipo': tipo,
+                'Matriz': ancora,
+                'Dev_mm': dev_ancora,
+                'Largura_bobina': largura,
+                'Validas': validas,
+                'Fora_regra': fora,
+                'Melhor_perda_pct': round(melhor[0] / largura * 100, 4) if melhor is not None else np.nan,
+                'Melhor_combinacao': combinacao,
+            })
+    
+    return linhas
+
+
+def _atlas_tarefa(args) -> list[dict]:
+    """Wrapper para o pool de processos."""
+    return atlas_grupo(*args)
+
+
+def gerar_atlas(
+    df: pd.DataFrame,
+    processos: int | None = None,
+    pasta_saida: str | None = None,
+    config: ConfigPlano | None = None
+) -> pd.DataFrame:
+    """
+    Atlas de viabilidade do catálogo inteiro: para cada (Espessura, Tipo de
+    material, Matriz) e cada largura de config.larguras, quantas combinações
+    válidas existem e qual a melhor perda.
+    
+    Os grupos (espessura, tipo) são distribuídos entre os núcleos; dentro de
+    cada grupo a enumeração das complementares é compartilhada pelas âncoras
+    (atlas_grupo).
+    
+    ARQUIVOS (em pasta_saida, padrão BASE_OUTPUT):
+        atlas_<timestamp>.csv   uma linha por matriz e largura
+        atlas_<timestamp>.xlsx  abas Resumo (idem) e Mapa (matriz × largura
+                                com a melhor perda %, em escala de cores)
+    
+    ENTRADA:
+        processos: nº de processos (None = nº de núcleos; 1 = sem pool)
+        config: regras (None = ConfigPlano.padrao())
+    
+    SAÍDA:
+        DataFrame do resumo (com a coluna 'Viavel')
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    
+    inicio = time.perf_counter()
+    config = config or ConfigPlano.padrao()
+    motor = MotorPlanejamento(df)
+    tarefas = [
+        (esp, tipo, grupo['Matriz'].tolist(), grupo['Dev_mm'].tolist(),
+         [motor.devs[(m, esp)] for m in grupo['Matriz']], None, config)
+        for (esp, tipo), grupo in sorted(motor.grupos.items())
+    ]
+    # Grupos maiores primeiro: equilibra o pool
+    tarefas.sort(key=lambda t: -len(t[2]))
+    
+    if processos == 1:
+        partes = [_atlas_tarefa(t) for t in tarefas]
+    else:
+        with ProcessPoolExecutor(max_workers=processos) as executor:
+            partes = list(executor.map(_atlas_tarefa, tarefas))
+    
+    atlas = (
+        pd.DataFrame([linha for parte in partes for linha in parte])
+        .sort_values(['Espessura', 'Tipo', 'Matriz', 'Largura_bobina'])
+        .reset_index(drop=True)
+    )
+    atlas['Viavel'] = atlas['Validas'] > 0
+    
+    # ── Arquivos ──
+    pasta_saida = pasta_saida or BASE_OUTPUT
+    os.makedirs(pasta_saida, exist_ok=True)
+    base = os.path.join(pasta_saida, f"atlas_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+    atlas.to_csv(base + '.csv', index=False, encoding='utf-8')
+    
+    mapa = atlas.pivot_table(index=['Espessura', 'Tipo', 'Matriz'], columns='Largura_bobina',
+                             values='Melhor_perda_pct', aggfunc='first')
+    mapa.columns = [f"L{c}" for c in mapa.columns]
+    with pd.ExcelWriter(base + '.xlsx') as writer:
+        atlas.to_excel(writer, sheet_name='Resumo', index=False)
+        mapa.reset_index().to_excel(writer, sheet_name='Mapa', index=False)
+        _colorir_mapa(writer.sheets['Mapa'], linhas=len(mapa), primeira_coluna=4, colunas=mapa.shape[1])
+    
+    viaveis = atlas.groupby(['Espessura', 'Tipo', 'Matriz'])['Viavel'].any()
+    print(f"\n  ✓ Atlas: {len(viaveis)} matrizes × {len(config.larguras)} larguras em "
+          f"{time.perf_counter() - inicio:.1f} s | {int(viaveis.sum())} viáveis em ao menos uma largura")
+    print(f"  ✓ {base}.xlsx / .csv")
+    
+    return atlas
+
+
+def _colorir_mapa(ws, linhas: int, primeira_coluna: int, colunas: int, maior_melhor: bool = False) -> None:
+    """
+    Escala de cores (verde = menor perda) nas colunas de largura da aba Mapa.
+    maior_melhor=True inverte a escala (verde = maior valor, ex.: nº de válidas).
+    """
+    from openpyxl.formatting.rule import ColorScaleRule
+    from openpyxl.utils import get_column_letter
+    
+    if linhas == 0:
+        return
+    intervalo = (f"{get_column_letter(primeira_coluna)}2:"
+                 f"{get_column_letter(primeira_coluna + colunas - 1)}{linhas + 1}")
+    verde, vermelho = ('F8696B', '63BE7B') if maior_melhor else ('63BE7B', 'F8696B')
+    ws.conditional_formatting.add(intervalo, ColorScaleRule(
+        start_type='min', start_color=verde, mid_type='percentile', mid_value=50,
+        mid_color='FFEB84', end_type='max', end_color=vermelho))
+    ws.column_dimensions['C'].width = 30
+
+
+# ================================================================================
+# BLOCO 18: PERFIL DE EXECUÇÃO (TEMPO E MEMÓRIA POR ETAPA)
+# ================================================================================
+
+class PerfilExecucao:
+    """
+    Mede cada etapa do fluxo (carga → menu → busca → kg → exibição →
+    exportação) com tempo de parede e de CPU e, opcionalmente, cProfile e
+    pico de memória (tracemalloc).
+    
+    USO:
+        perfil = PerfilExecucao(cprofile=True, memoria=True)
+        with perfil.etapa('busca'):
+            ...
+        perfil.gravar()   # perfil_<timestamp>.txt (+ .prof) em BASE_OUTPUT
+    
+    NOTA: menu e exibição (paginador) incluem o tempo de digitação do
+          usuário no tempo de parede; a CPU mostra o custo real. A CPU é a
+          deste processo (pools de processos, como no atlas e no lote, ficam
+          de fora). O cProfile só fica ligado dentro das etapas e enxerga
+          apenas a thread principal.
+    
+    MEMÓRIA (memoria=True):
+        pico_mb    = maior alocação acima do início da etapa (tracemalloc,
+                     todas as threads deste processo)
+        liquido_mb = o que a etapa deixou alocado ao terminar
+        O tracemalloc deixa o Python bem mais lento: compare tempos só entre
+        execuções com a mesma opção.
+    """
+    
+    def __init__(self, cprofile: bool = False, memoria: bool = False, orcamento_mb: float | None = None):
+        import cProfile
+        import tracemalloc
+        
+        self.etapas = []        # [{'etapa', 'parede_s', 'cpu_s'(, 'pico_mb', 'liquido_mb')}]
+        self.inicio = datetime.now()
+        self.profiler = cProfile.Profile() if cprofile else None
+        self.memoria = memoria
+        self.orcamento_mb = orcamento_mb    # só para o relatório
+        if memoria and not tracemalloc.is_tracing():
+            tracemalloc.start()
+    
+    def etapa(self, nome: str):
+        """Context manager que mede uma etapa (pode se repetir: uma por consulta)."""
+        from contextlib import contextmanager
+        
+        import gc
+        import tracemalloc
+        
+        @contextmanager
+        def medir():
+            if self.memoria:
+                gc.collect()    # sobras da etapa anterior não entram nesta
+                tracemalloc.reset_peak()
+                memoria_inicial = tracemalloc.get_traced_memory()[0]
+            parede, cpu = time.perf_counter(), time.process_time()
+            if self.profiler is not None:
+                self.profiler.enable()
+            try:
+                yield
+            finally:
+                if self.profiler is not None:
+                    self.profiler.disable()
+                medicao = {
+                    'etapa': nome,
+                    'parede_s': time.perf_counter() - parede,
+                    'cpu_s': time.process_time() - cpu,
+                }
+                if self.memoria:
+                    atual, pico = tracemalloc.get_traced_memory()
+                    medicao['pico_mb'] = (pico - memoria_inicial) / 2**20
+                    medicao['liquido_mb'] = (atual - memoria_inicial) / 2**20
+                self.etapas.append(medicao)
+        
+        return medir()
+    
+    def resumo(self) -> pd.DataFrame:
+        """
+        Totais por etapa: vezes, parede, CPU e % do tempo de parede medido
+        (+ maior pico_mb e soma de liquido_mb, com memoria=True).
+        """
+        if not self.etapas:
+            return pd.DataFrame(columns=['etapa', 'vezes', 'parede_s', 'cpu_s', 'pct_parede'])
+        df = pd.DataFrame(self.etapas)
+        agregados = dict(vezes=('etapa', 'size'), parede_s=('parede_s', 'sum'), cpu_s=('cpu_s', 'sum'))
+        if self.memoria:
+            agregados.update(pico_mb=('pico_mb', 'max'), liquido_mb=('liquido_mb', 'sum'))
+        resumo = df.groupby('etapa', sort=False).agg(**agregados).reset_index()
+        total = resumo['parede_s'].sum()
+        resumo['pct_parede'] = (resumo['parede_s'] / total * 100).round(1) if total else 0.0
+        return resumo
+    
+    def relatorio(self, comando: list[str] | None = None, top: int = 30) -> str:
+        """Texto do relatório: totais por etapa, cada medição e o topo do cProfile."""
+        import io
+        import pstats
+        
+        linhas = [
+            "PERFIL DE EXECUÇÃO — PLANO DE CORTE",
+            f"Início : {self.inicio:%Y-%m-%d %H:%M:%S}",
+            f"Comando: {' '.join(comando) if comando else '(menu interativo)'}",
+            f"Máquina: {platform.node()} | {platform.platform()} | Python {platform.python_version()}",
+            "",
+            f"{'Etapa':<12} {'Vezes':>6} {'Parede (s)':>11} {'CPU (s)':>9} {'% parede':>9}"
+            + (f" {'Pico (MB)':>10} {'Líquido (MB)':>13}" if self.memoria else ""),
+        ]
+        for r in self.resumo().itertuples():
+            linhas.append(
+                f"{r.etapa:<12} {r.vezes:>6} {r.parede_s:>11.3f} {r.cpu_s:>9.3f} {r.pct_parede:>8.1f}%"
+                + (f" {r.pico_mb:>10.1f} {r.liquido_mb:>13.1f}" if self.memoria else "")
+            )
+        if self.memoria:
+            orcamento = f"{self.orcamento_mb} MB" if self.orcamento_mb else "sem limite"
+            linhas.append(f"(memória: tracemalloc; orçamento da busca = {orcamento})")
+        
+        linhas += ["", "Medições (ordem de execução):"]
+        for i, e in enumerate(self.etapas, 1):
+            linhas.append(
+                f"  {i:>3}. {e['etapa']:<12} parede {e['parede_s']:>9.3f} s   CPU {e['cpu_s']:>9.3f} s"
+                + (f"   pico {e['pico_mb']:>8.1f} MB   líquido {e['liquido_mb']:>8.1f} MB"
+                   if self.memoria else "")
+            )
+        
+        if self.profiler is not None:
+            texto = io.StringIO()
+            pstats.Stats(self.profiler, stream=texto).sort_stats('cumulative').print_stats(top)
+            linhas += ["", f"cProfile — {top} funções de maior tempo acumulado:", texto.getvalue()]
+        
+        return "\n".join(linhas) + "\n"
+    
+    def gravar(self, pasta: str | None = None, comando: list[str] | None = None) -> list[str]:
+        """
+        Grava perfil_<timestamp>.txt e, com cProfile, perfil_<timestamp>.prof
+        (abrir com pstats / snakeviz).
+        
+        SAÍDA:
+            Lista de arquivos gravados
+        """
+        pasta = pasta or BASE_OUTPUT
+        os.makedirs(pasta, exist_ok=True)
+        base = os.path.join(pasta, f"perfil_{self.inicio:%Y%m%d_%H%M%S}")
+        
+        arquivos = [base + '.txt']
+        with open(base + '.txt', 'w', encoding='utf-8') as f:
+            f.write(self.relatorio(comando))
+        if self.profiler is not None:
+            self.profiler.dump_stats(base + '.prof')
+            arquivos.append(base + '.prof')
+        
+        print("\n  ⏱ Perfil da execução:")
+        for r in self.resumo().itertuples():
+            memoria = f" | pico {r.pico_mb:>8.1f} MB" if self.memoria else ""
+            print(f"     {r.etapa:<12} {r.parede_s:>9.3f} s parede | {r.cpu_s:>9.3f} s CPU{memoria} ({r.vezes}×)")
+        print(f"  ✓ {' / '.join(arquivos)}")
+        return arquivos
+
+
+def etapa_perfil(perfil: PerfilExecucao | None, nome: str):
+    """perfil.etapa(nome), ou um contexto vazio se não houver perfil."""
+    from contextlib import nullcontext
+    return perfil.etapa(nome) if perfil is not None else nullcontext()
+
+
+# ================================================================================
+# BLOCO 19: VARREDURA DE SENSIBILIDADE (JANELA DE PERDA E LARGURAS)
+# ================================================================================
+
+def ler_grade(texto: str, conv=float) -> list:
+    """
+    Lê uma grade de valores da linha de comando.
+    
+    FORMATOS:
+        '0.67,1.0,1.7'   lista
+        '0.5:2.0:0.1'    de 0.5 até 2.0 (inclusive), passo 0.1
+        '900:1600'       intervalo com passo 1
+        (listas e intervalos podem ser misturados: '0.67,1:2:0.5')
+    
+    SAÍDA:
+        Valores distintos em ordem crescente
+    
+    ERRO:
+        ValueError se a grade estiver vazia ou mal formada
+    """
+    valores = set()
+    for parte in str(texto).replace(';', ',').split(','):
+        parte = parte.strip()
+        if not parte:
+            continue
+        if ':' in parte:
+            campos = [float(x) for x in parte.split(':')]
+            if len(campos) not in (2, 3) or (len(campos) == 3 and campos[2] <= 0):
+                raise ValueError(f"intervalo inválido: {parte!r} (use inicio:fim[:passo])")
+            inicio, fim, passo = (campos + [1.0])[:3]
+            valores.update(np.round(np.arange(inicio, fim + passo / 2, passo), 6).tolist())
+        else:
+            valores.add(float(parte))
+    if not valores:
+        raise ValueError(f"grade vazia: {texto!r}")
+    return sorted({conv(v) for v in valores})
+
+
+def somas_totais_ancora(
+    somas: dict,
+    indice_ancora: int,
+    dev_ancora: float,
+    largura_max: int
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Largura ocupada (âncora + complementares) de todas as combinações da
+    âncora que cabem em largura_max, agrupadas por valor.
+    
+    Parte da enumeração das complementares do grupo, feita UMA vez em
+    largura_max (enumerar_somas_complementares), e soma cada N de cortes da
+    âncora com a mesma conta do motor (soma_âncora + soma_comp); as que usam
+    a própria âncora como complementar são descartadas. A enumeração em
+    largura_max contém a de qualquer largura menor, então o resultado serve
+    para todas elas: em cada largura L a perda é L − soma.
+    
+    ENTRADA:
+        somas: saída de enumerar_somas_complementares(devs, largura_max, ...)
+        indice_ancora: posição da âncora no grupo
+    
+    SAÍDA:
+        (somas distintas ORDENADAS, nº de combinações com cada soma)
+    """
+    soma_comp = somas['soma'][~(somas['membros'] == indice_ancora).any(axis=1)]
+    partes = []
+    for n_ancora in range(1, int(largura_max / dev_ancora) + 1):
+        soma_ancora = dev_ancora * n_ancora
+        fim = np.searchsorted(soma_comp, largura_max - soma_ancora + 1e-6, 'right')
+        partes += [np.array([soma_ancora]), soma_ancora + soma_comp[:fim]]
+    
+    if not partes:
+        return np.zeros(0), np.zeros(0, dtype=int)
+    return np.unique(np.concatenate(partes), return_counts=True)
+
+
+def _faixa_somas(
+    somas: np.ndarray,
+    largura: np.ndarray,
+    perda_min: np.ndarray,
+    perda_max: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Índices [ini, fim) das somas (distintas, ordenadas) com
+    perda_min ≤ largura − soma ≤ perda_max, vetorizado em largura e janela.
+    
+    A busca usa os limites invertidos (largura − perda), que podem arredondar
+    diferente da perda calculada pelo motor; o vizinho de cada ponta é
+    conferido com a própria perda, então a contagem é exata.
+    """
+    n = len(somas)
+    ini = np.searchsorted(somas, largura - perda_max, 'left')
+    fim = np.searchsorted(somas, largura - perda_min, 'right')
+    if n == 0:
+        return ini, fim
+    
+    def soma(i):
+        return somas[np.clip(i, 0, n - 1)]
+    
+    ini = ini - ((ini > 0) & (largura - soma(ini - 1) <= perda_max))
+    ini = ini + ((ini < n) & (largura - soma(ini) > perda_max))
+    fim = fim + ((fim < n) & (largura - soma(fim) >= perda_min))
+    fim = fim - ((fim > 0) & (largura - soma(fim - 1) < perda_min))
+    return ini, np.maximum(fim, ini)
+
+
+def sensibilidade_grupo(
+    espessura: float,
+    tipo: str,
+    matrizes: list[str],
+    devs_grupo: list[float],
+    devs_ancora: list[float],
+    larguras: list[int],
+    janelas: list[tuple[float, float]],
+    ancoras: list[str] | None = None,
+    config: ConfigPlano | None = None
+) -> dict:
+    """
+    Combinações válidas, fora da regra e melhor perda de cada âncora do
+    grupo (espessura, tipo) em cada largura × janela de perda da varredura.
+    
+    MÉTODO:
+        As complementares do grupo são enumeradas UMA vez, na maior largura
+        (enumerar_somas_complementares). Para cada âncora, as larguras
+        ocupadas de todas as combinações ficam num vetor ordenado
+        (somas_totais_ancora); cada célula (largura, janela) vira um
+        intervalo nesse vetor (_faixa_somas), resolvido com searchsorted
+        para a grade inteira de uma vez. Uma grade 20×20 custa pouco mais
+        que uma consulta.
+    
+    ENTRADA:
+        matrizes / devs_grupo / devs_ancora: como em atlas_grupo
+        janelas: lista de (perda_min_pct, perda_max_pct)
+        ancoras: matrizes avaliadas como âncora (None = todas do grupo)
+        config: refilo e nº de complementares (None = ConfigPlano.padrao());
+                a janela e as larguras vêm da grade
+    
+    SAÍDA:
+        Colunas (dict de arrays), uma linha por (matriz, largura, janela):
+        {Espessura, Tipo, Matriz, Largura_bobina, Perda_min_pct,
+         Perda_max_pct, Validas, Fora_regra, Melhor_perda_pct}
+    """
+    config = config or ConfigPlano.padrao()
+    refilo_min = config.refilo_min(espessura)
+    somas = enumerar_somas_complementares(np.array(devs_grupo, dtype=float), max(larguras),
+                                          config.max_complementares)
+    
+    # Grade achatada: larguras × janelas (mesma conta de ConfigPlano.janela_mm)
+    largura = np.repeat(np.array(larguras, dtype=float), len(janelas))
+    pmin = np.tile([j[0] for j in janelas], len(larguras))
+    pmax = np.tile([j[1] for j in janelas], len(larguras))
+    perda_min_mm = largura * pmin / 100
+    perda_max_mm = largura * pmax / 100
+    minimo_valida = np.maximum(perda_min_mm, refilo_min)
+    
+    colunas = {'Matriz': [], 'Validas': [], 'Fora_regra': [], 'Melhor_perda_pct': []}
+    for a, (matriz, dev_ancora) in enumerate(zip(matrizes, devs_ancora)):
+        if ancoras is not None and matriz not in ancoras:
+            continue
+        
+        totais, quantos = somas_totais_ancora(somas, a, dev_ancora, max(larguras))
+        acumulado = np.concatenate([[0], np.cumsum(quantos)])
+        ini, fim = _faixa_somas(totais, largura, perda_min_mm, perda_max_mm)
+        ini_v, fim_v = _faixa_somas(totais, largura, minimo_valida, perda_max_mm)
+        
+        na_janela = acumulado[fim] - acumulado[ini]
+        validas = acumulado[fim_v] - acumulado[ini_v]
+        melhor = np.full(len(largura), np.nan)
+        tem = validas > 0
+        # Maior soma válida = menor perda
+        melhor[tem] = np.round((largura[tem] - totais[fim_v[tem] - 1]) / largura[tem] * 100, 4)
+        
+        colunas['Matriz'] += [matriz] * len(largura)
+        colunas['Validas'].append(validas)
+        colunas['Fora_regra'].append(na_janela - validas)
+        colunas['Melhor_perda_pct'].append(melhor)
+    
+    linhas = len(colunas['Matriz'])
+    vezes = linhas // len(largura) if len(largura) else 0
+    return {
+        'Espessura': np.full(linhas, espessura),
+        'Tipo': [tipo] * linhas,
+        'Matriz': colunas['Matriz'],
+        'Largura_bobina': np.tile(largura.astype(int), vezes),
+        'Perda_min_pct': np.tile(pmin, vezes),
+        'Perda_max_pct': np.tile(pmax, vezes),
+        **{c: (np.concatenate(colunas[c]) if colunas[c] else np.zeros(0))
+           for c in ('Validas', 'Fora_regra', 'Melhor_perda_pct')},
+    }
+
+
+def grupos_no_escopo(
+    df: pd.DataFrame,
+    espessura: float | None = None,
+    tipo: str | None = None,
+    ancora: str | None = None
+) -> list[tuple]:
+    """
+    Grupos (espessura, tipo) de uma varredura, já no formato de atlas_grupo.
+    
+    ENTRADA:
+        espessura / tipo / ancora: escopo (None = sem filtro); com âncora,
+        só os grupos que a contêm, avaliando apenas ela
+    
+    SAÍDA:
+        [(espessura, tipo, matrizes, devs_grupo, devs_ancora, ancoras)],
+        maiores grupos primeiro (equilibra o pool); ancoras = None (todas)
+        ou [ancora]
+    
+    ERRO:
+        ValueError se nenhuma matriz estiver no escopo
+    """
+    motor = MotorPlanejamento(df)
+    grupos = []
+    for (esp, tp), grupo in sorted(motor.grupos.items()):
+        if (espessura is not None and esp != espessura) or (tipo is not None and tp != tipo):
+            continue
+        if ancora is not None and ancora not in grupo['Matriz'].values:
+            continue
+        grupos.append((esp, tp, grupo['Matriz'].tolist(), grupo['Dev_mm'].tolist(),
+                       [motor.devs[(m, esp)] for m in grupo['Matriz']],
+                       [ancora] if ancora is not None else None))
+    if not grupos:
+        raise ValueError("nenhuma matriz no escopo da varredura (espessura / tipo / âncora)")
+    grupos.sort(key=lambda g: -len(g[2]))
+    return grupos
+
+
+def _sensibilidade_tarefa(args) -> dict:
+    """Wrapper para o pool de processos."""
+    return sensibilidade_grupo(*args)
+
+
+def varrer_sensibilidade(
+    df: pd.DataFrame,
+    perdas_min: list[float] | None = None,
+    perdas_max: list[float] | None = None,
+    larguras: list[int] | None = None,
+    espessura: float | None = None,
+    tipo: str | None = None,
+    ancora: str | None = None,
+    processos: int | None = None,
+    pasta_saida: str | None = None,
+    config: ConfigPlano | None = None
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    "E se aceitássemos 2,0 % de perda?" / "e se comprássemos bobina de
+    1250 mm?": varre uma grade de janelas de perda e de larguras e mostra
+    como mudam o nº de combinações válidas e a melhor perda — para uma
+    âncora, uma espessura (ou espessura + tipo) ou o catálogo inteiro —
+    sem editar as constantes nem rodar uma consulta por cenário.
+    
+    A janela atual (config) entra sempre na grade, como referência.
+    Cada grupo (espessura, tipo) é resolvido por sensibilidade_grupo, com
+    uma única enumeração das complementares; os grupos são distribuídos
+    entre os núcleos, como no atlas.
+    
+    ARQUIVOS (em pasta_saida, padrão BASE_OUTPUT):
+        sensibilidade_<timestamp>.csv   uma linha por matriz, largura e janela
+        sensibilidade_<timestamp>.xlsx  abas Resumo (por largura e janela),
+                                        L<largura> com as válidas em
+                                        perda mínima × perda máxima e
+                                        Detalhe (idem CSV, só até
+                                        LIMITE_COMBOS_EXCEL_NORMAL linhas)
+    
+    ENTRADA:
+        perdas_min / perdas_max: grades em % (None = valor atual da config);
+                                 pares com mínimo > máximo são ignorados
+        larguras: larguras candidatas (None = config.larguras)
+        espessura / tipo / ancora: escopo (None = sem filtro)
+        processos: nº de processos (None = nº de núcleos; 1 = sem pool)
+        config: regras de referência (None = ConfigPlano.padrao())
+    
+    SAÍDA:
+        (detalhe, resumo). O resumo tem uma linha por (largura, janela):
+        Matrizes, Viaveis (matrizes com ≥ 1 válida), Validas, Fora_regra,
+        Melhor_perda_media_pct, Atual (janela da config) e a diferença de
+        Viaveis / Validas para a janela atual na mesma largura
+    
+    ERRO:
+        ValueError se a grade ou o escopo não tiverem nenhum caso
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    
+    inicio = time.perf_counter()
+    config = config or ConfigPlano.padrao()
+    atual = (config.perda_min_pct, config.perda_max_pct)
+    janelas = sorted({(float(a), float(b))
+                      for a in (perdas_min or [atual[0]]) for b in (perdas_max or [atual[1]])
+                      if 0 <= a <= b} | {atual})
+    larguras = sorted({int(l) for l in (larguras or config.larguras)})
+    
+    tarefas = [(*grupo[:5], larguras, janelas, grupo[5], config)
+               for grupo in grupos_no_escopo(df, espessura, tipo, ancora)]
+    
+    if processos == 1 or len(tarefas) == 1:
+        partes = [_sensibilidade_tarefa(t) for t in tarefas]
+    else:
+        with ProcessPoolExecutor(max_workers=processos) as executor:
+            partes = list(executor.map(_sensibilidade_tarefa, tarefas))
+    
+    detalhe = (
+        pd.concat([pd.DataFrame(p) for p in partes], ignore_index=True)
+        .sort_values(['Espessura', 'Tipo', 'Matriz', 'Largura_bobina', 'Perda_min_pct', 'Perda_max_pct'])
+        .reset_index(drop=True)
+    )
+    
+    # ── Resumo por (largura, janela) e diferença para a janela atual ──
+    cenario = ['Largura_bobina', 'Perda_min_pct', 'Perda_max_pct']
+    resumo = (
+        detalhe.assign(Viaveis=detalhe['Validas'] > 0)
+        .groupby(cenario)
+        .agg(Matrizes=('Matriz', 'size'), Viaveis=('Viaveis', 'sum'), Validas=('Validas', 'sum'),
+             Fora_regra=('Fora_regra', 'sum'), Melhor_perda_media_pct=('Melhor_perda_pct', 'mean'))
+        .reset_index()
+    )
+    resumo['Melhor_perda_media_pct'] = resumo['Melhor_perda_media_pct'].round(4)
+    resumo['Atual'] = (resumo['Perda_min_pct'] == atual[0]) & (resumo['Perda_max_pct'] == atual[1])
+    base = resumo[resumo['Atual']].set_index('Largura_bobina')
+    for coluna in ('Viaveis', 'Validas'):
+        resumo[f'Delta_{coluna.lower()}'] = resumo[coluna] - resumo['Largura_bobina'].map(base[coluna])
+    
+    # ── Arquivos ──
+    pasta_saida = pasta_saida or BASE_OUTPUT
+    os.makedirs(pasta_saida, exist_ok=True)
+    caminho = os.path.join(pasta_saida, f"sensibilidade_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+    detalhe.to_csv(caminho + '.csv', index=False, encoding='utf-8')
+    with pd.ExcelWriter(caminho + '.xlsx') as writer:
+        resumo.to_excel(writer, sheet_name='Resumo', index=False)
+        for largura, parte in resumo.groupby('Largura_bobina'):
+            mapa = parte.pivot(index='Perda_min_pct', columns='Perda_max_pct', values='Validas')
+            mapa.columns = [f"max {c:g}%" for c in mapa.columns]
+            aba = f"L{largura}"
+            mapa.reset_index().to_excel(writer, sheet_name=aba, index=False)
+            _colorir_mapa(writer.sheets[aba], linhas=len(mapa), primeira_coluna=2,
+                          colunas=mapa.shape[1], maior_melhor=True)
+        # A grade do catálogo inteiro passa de centenas de milhares de linhas: fica só no CSV
+        if len(detalhe) <= LIMITE_COMBOS_EXCEL_NORMAL:
+            detalhe.to_excel(writer, sheet_name='Detalhe', index=False)
+    
+    escopo = ' / '.join(str(x) for x in (espessura, tipo, ancora) if x is not None) or 'catálogo inteiro'
+    print(f"\n  ✓ Sensibilidade ({escopo}): {len(detalhe) // len(resumo)} matrizes × "
+          f"{len(larguras)} larguras × {len(janelas)} janelas em {time.perf_counter() - inicio:.2f} s")
+    for r in resumo[resumo['Atual']].itertuples():
+        parte = resumo[resumo['Largura_bobina'] == r.Largura_bobina]
+        print(f"     L{r.Largura_bobina}: atual {atual[0]:g}–{atual[1]:g} % → {r.Validas} válidas, "
+              f"{r.Viaveis}/{r.Matrizes} matrizes viáveis | na grade: {parte['Validas'].min()}–"
+              f"{parte['Validas'].max()} válidas, {parte['Viaveis'].min()}–{parte['Viaveis'].max()} viáveis")
+    print(f"  ✓ {caminho}.xlsx / .csv")
+    
+    return detalhe, resumo
+
+
+# ================================================================================
+# BLOCO 20: LARGURA DE BOBINA ÓTIMA (VARREDURA DE LARGURAS ARBITRÁRIAS)
+# ================================================================================
+
+def largura_otima_grupo(
+    espessura: float,
+    tipo: str,
+    matrizes: list[str],
+    devs_grupo: list[float],
+    devs_ancora: list[float],
+    larguras: list[int],
+    ancoras: list[str] | None = None,
+    config: ConfigPlano | None = None
+) -> dict:
+    """
+    Combinações válidas, melhor perda e perda média de cada âncora do grupo
+    em cada largura de uma faixa (ex.: todas de 900 a 1600 mm).
+    
+    MÉTODO:
+        Igual a sensibilidade_grupo, com as larguras no lugar das janelas:
+        uma enumeração das complementares na maior largura, um vetor
+        ordenado de larguras ocupadas por âncora e um searchsorted para a
+        faixa inteira. A perda média sai das somas acumuladas do vetor.
+        Centenas de larguras custam quase o mesmo que uma.
+    
+    ENTRADA:
+        larguras: larguras avaliadas (mm)
+        ancoras: matrizes avaliadas como âncora (None = todas do grupo)
+        config: janela de perda, refilo e nº de complementares
+                (None = ConfigPlano.padrao()); config.larguras é ignorada
+    
+    SAÍDA:
+        Colunas (dict de arrays), uma linha por (matriz, largura):
+        {Espessura, Tipo, Matriz, Largura_bobina, Validas, Melhor_perda_pct,
+         Perda_media_pct}
+    """
+    config = config or ConfigPlano.padrao()
+    refilo_min = config.refilo_min(espessura)
+    somas = enumerar_somas_complementares(np.array(devs_grupo, dtype=float), max(larguras),
+                                          config.max_complementares)
+    
+    largura = np.array(larguras, dtype=float)
+    perda_min_mm = np.maximum(largura * config.perda_min_pct / 100, refilo_min)
+    perda_max_mm = largura * config.perda_max_pct / 100
+    
+    colunas = {'Matriz': [], 'Validas': [], 'Melhor_perda_pct': [], 'Perda_media_pct': []}
+    for a, (matriz, dev_ancora) in enumerate(zip(matrizes, devs_ancora)):
+        if ancoras is not None and matriz not in ancoras:
+            continue
+        
+        totais, quantos = somas_totais_ancora(somas, a, dev_ancora, max(larguras))
+        acumulado = np.concatenate([[0], np.cumsum(quantos)])
+        acumulado_mm = np.concatenate([[0.0], np.cumsum(totais * quantos)])
+        ini, fim = _faixa_somas(totais, largura, perda_min_mm, perda_max_mm)
+        
+        validas = acumulado[fim] - acumulado[ini]
+        tem = validas > 0
+        melhor = np.full(len(largura), np.nan)
+        media = np.full(len(largura), np.nan)
+        melhor[tem] = np.round((largura[tem] - totais[fim[tem] - 1]) / largura[tem] * 100, 4)
+        soma_media = (acumulado_mm[fim[tem]] - acumulado_mm[ini[tem]]) / validas[tem]
+        media[tem] = np.round((largura[tem] - soma_media) / largura[tem] * 100, 4)
+        
+        colunas['Matriz'] += [matriz] * len(largura)
+        colunas['Validas'].append(validas)
+        colunas['Melhor_perda_pct'].append(melhor)
+        colunas['Perda_media_pct'].append(media)
+    
+    linhas = len(colunas['Matriz'])
+    return {
+        'Espessura': np.full(linhas, espessura),
+        'Tipo': [tipo] * linhas,
+        'Matriz': colunas['Matriz'],
+        'Largura_bobina': np.tile(largura.astype(int), linhas // len(largura)),
+        **{c: (np.concatenate(colunas[c]) if colunas[c] else np.zeros(0))
+           for c in ('Validas', 'Melhor_perda_pct', 'Perda_media_pct')},
+    }
+
+
+def _largura_otima_tarefa(args) -> dict:
+    """Wrapper para o pool de processos."""
+    return largura_otima_grupo(*args)
+
+
+def buscar_largura_otima(
+    df: pd.DataFrame,
+    larguras: list[int] | None = None,
+    espessura: float | None = None,
+    tipo: str | None = None,
+    ancora: str | None = None,
+    objetivo: str = 'validas',
+    top: int = 10,
+    processos: int | None = None,
+    pasta_saida: str | None = None,
+    config: ConfigPlano | None = None
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Avalia TODAS as larguras inteiras de uma faixa (não só LARGURAS_BOBINA)
+    para uma âncora, uma espessura (ou espessura + tipo) ou o catálogo, e
+    ordena as larguras pelo objetivo — para decidir se uma largura fora do
+    padrão oferecida pela usina serve melhor ao mix de matrizes.
+    
+    OBJETIVOS:
+        'validas': mais combinações válidas no escopo
+        'perda':   mais matrizes viáveis e, entre elas, a menor média da
+                   melhor perda de cada matriz
+    
+    ARQUIVOS (em pasta_saida, padrão BASE_OUTPUT):
+        largura_otima_<timestamp>.csv   uma linha por matriz e largura
+        largura_otima_<timestamp>.xlsx  abas Ranking (larguras na ordem do
+                                        objetivo) e Detalhe (só até
+                                        LIMITE_COMBOS_EXCEL_NORMAL linhas)
+    
+    ENTRADA:
+        larguras: larguras avaliadas (None = FAIXA_LARGURA_OTIMA, passo 1 mm)
+        espessura / tipo / ancora: escopo (None = sem filtro)
+        top: quantas larguras mostrar no terminal
+        processos: nº de processos (None = nº de núcleos; 1 = sem pool)
+        config: janela de perda e demais regras (None = ConfigPlano.padrao());
+                as larguras de config.larguras são marcadas no ranking
+    
+    SAÍDA:
+        (detalhe, ranking). O ranking tem uma linha por largura: Matrizes,
+        Viaveis, Validas, Melhor_perda_media_pct, Perda_media_pct (de todas
+        as válidas), Padrao (largura de config.larguras) e Posicao
+    
+    ERRO:
+        ValueError se o objetivo for desconhecido ou o escopo estiver vazio
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    
+    if objetivo not in ('validas', 'perda'):
+        raise ValueError(f"objetivo desconhecido: {objetivo!r} (use 'validas' ou 'perda')")
+    inicio = time.perf_counter()
+    config = config or ConfigPlano.padrao()
+    larguras = sorted({int(l) for l in (larguras or range(FAIXA_LARGURA_OTIMA[0], FAIXA_LARGURA_OTIMA[1] + 1))})
+    
+    tarefas = [(*grupo[:5], larguras, grupo[5], config)
+               for grupo in grupos_no_escopo(df, espessura, tipo, ancora)]
+    if processos == 1 or len(tarefas) == 1:
+        partes = [_largura_otima_tarefa(t) for t in tarefas]
+    else:
+        with ProcessPoolExecutor(max_workers=processos) as executor:
+            partes = list(executor.map(_largura_otima_tarefa, tarefas))
+    
+    detalhe = (
+        pd.concat([pd.DataFrame(p) for p in partes], ignore_index=True)
+        .sort_values(['Espessura', 'Tipo', 'Matriz', 'Largura_bobina'])
+        .reset_index(drop=True)
+    )
+    
+    # ── Ranking por largura ──
+    detalhe['_perda_total'] = detalhe['Perda_media_pct'].fillna(0) * detalhe['Validas']
+    ranking = (
+        detalhe.assign(Viaveis=detalhe['Validas'] > 0)
+        .groupby('Largura_bobina')
+        .agg(Matrizes=('Matriz', 'size'), Viaveis=('Viaveis', 'sum'), Validas=('Validas', 'sum'),
+             Melhor_perda_media_pct=('Melhor_perda_pct', 'mean'), _perda_total=('_perda_total', 'sum'))
+        .reset_index()
+    )
+    detalhe = detalhe.drop(columns='_perda_total')
+    ranking['Perda_media_pct'] = (ranking.pop('_perda_total') / ranking['Validas'].where(ranking['Validas'] > 0)).round(4)
+    ranking['Melhor_perda_media_pct'] = ranking['Melhor_perda_media_pct'].round(4)
+    ranking['Padrao'] = ranking['Largura_bobina'].isin(config.larguras)
+    if objetivo == 'validas':
+        ranking = ranking.sort_values(['Validas', 'Melhor_perda_media_pct'], ascending=[False, True])
+    else:
+        ranking = ranking.sort_values(['Viaveis', 'Melhor_perda_media_pct'], ascending=[False, True])
+    ranking = ranking.reset_index(drop=True)
+    ranking.insert(0, 'Posicao', np.arange(1, len(ranking) + 1))
+    
+    # ── Arquivos ──
+    pasta_saida = pasta_saida or BASE_OUTPUT
+    os.makedirs(pasta_saida, exist_ok=True)
+    caminho = os.path.join(pasta_saida, f"largura_otima_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+    detalhe.to_csv(caminho + '.csv', index=False, encoding='utf-8')
+    with pd.ExcelWriter(caminho + '.xlsx') as writer:
+        ranking.to_excel(writer, sheet_name='Ranking', index=False)
+        if len(detalhe) <= LIMITE_COMBOS_EXCEL_NORMAL:
+            detalhe.to_excel(writer, sheet_name='Detalhe', index=False)
+    
+    escopo = ' / '.join(str(x) for x in (espessura, tipo, ancora) if x is not None) or 'catálogo inteiro'
+    print(f"\n  ✓ Largura ótima ({escopo}, objetivo: {objetivo}): {len(larguras)} larguras de "
+          f"{larguras[0]} a {larguras[-1]} mm × {len(detalhe) // len(larguras)} matrizes em "
+          f"{time.perf_counter() - inicio:.2f} s")
+    print(f"     {'Pos':>4} {'Largura':>8} {'Viáveis':>9} {'Válidas':>10} {'Melhor %':>9} {'Média %':>8}")
+    mostrar = pd.concat([ranking.head(top), ranking[ranking['Padrao']]]).drop_duplicates('Largura_bobina')
+    for r in mostrar.itertuples():
+        print(f"     {r.Posicao:>4} {r.Largura_bobina:>8} {r.Viaveis:>4}/{r.Matrizes:<4} {r.Validas:>10} "
+              f"{r.Melhor_perda_media_pct:>9.4f} {r.Perda_media_pct:>8.4f}" + ("  ← padrão" if r.Padrao else ""))
+    print(f"  ✓ {caminho}.xlsx / .csv")
+    
+    return detalhe, ranking
 
 
 # ════════════════════════════════════════════════════════════════════════════════